@@ -0,0 +1,49 @@
+import argparse
+from function.graph import STORAGE, TABLES, GRAPHS, CONTENTS, SEARCH
+
+ENTITY_TABLE = {
+    'attribute_definitions': [{'AttributeName': 'id', 'AttributeType': 'S'}],
+    'key_schema': [{'AttributeName': 'id', 'KeyType': 'HASH'}],
+    'billing_mode': 'PAY_PER_REQUEST',
+}
+
+
+def bootstrap():
+    existing = STORAGE.list_tables()
+    for entity, table_name in TABLES.items():
+        if table_name not in existing:
+            STORAGE.create_table(table_name, **ENTITY_TABLE)
+            print(f'created {entity} table {table_name}')
+    if GRAPHS.bootstrap():
+        print(f'created graph table {GRAPHS.table_name}')
+    if CONTENTS.bootstrap():
+        print(f'created content table {CONTENTS.table_name}')
+
+
+def page_version_content(item):
+    if 'content_chain' in item:
+        return CONTENTS.get(item['content_chain'], item['content_revision'])
+    return item.get('content')
+
+
+def rebuild_search():
+    page_versions = ((item['id'], {'name': item.get('name'), 'content': page_version_content(item)})
+                     for item in STORAGE.iter_scan(TABLES['page_version']))
+    print(f'indexed {SEARCH["page_version"].rebuild(page_versions)} page versions')
+    edges = ((edge['id'], {'name': edge.get('name'), 'keywords': edge.get('keywords')})
+             for edge in GRAPHS.scan('edge'))
+    print(f'indexed {SEARCH["edge"].rebuild(edges)} edges')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Creates the tables of the HyperWiki in DynamoDB')
+    parser.add_argument('--migrate-graph', nargs=3, metavar=('GRAPH_TABLE', 'NODE_TABLE', 'EDGE_TABLE'),
+                        help='copy graphs from the legacy per entity tables into the adjacency list table')
+    parser.add_argument('--rebuild-search', action='store_true',
+                        help='rebuild the full-text indexes of page versions and edges from the tables')
+    args = parser.parse_args()
+    bootstrap()
+    if args.migrate_graph:
+        print(f'migrated {GRAPHS.migrate(*args.migrate_graph)} graph rows')
+    if args.rebuild_search:
+        rebuild_search()
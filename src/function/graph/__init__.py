@@ -1,14 +1,47 @@
-from ariadne import QueryType, graphql_sync, make_executable_schema, load_schema_from_path, ObjectType, MutationType
-from ariadne.explorer import ExplorerGraphiQL
-from flask import Flask, jsonify, request
-from ..util.config import Config
+from ariadne import QueryType, ObjectType, MutationType
+from ..util.config import get_config
+from ..util.cache import ItemCache
+from ..util.changes import ChangeFeed
+from ..util.content import ContentStore
+from ..util.graph_index import GraphIndex
+from ..util.graph_store import GraphStore
+from ..util.permissions import PermissionIndex, parse_principals
+from ..util.search import SearchIndex, GraphSearchListener
+from ..util.storage import Storage
+from ..util.transfer import NotebookTransfer
+from .cost import CostAnalyzer
+from .execution import DocumentCache
+from .loader import ENTITIES, SCHEMAS
+from .schema_cache import make_cached_schema
+from .transport import ResponseEncoder
 from .query import *
 from .mutation_delete import *
 from .mutation_create import *
 from .mutation_update import *
-
-CONF = Config()
-type_defs = load_schema_from_path(CONF.graph_schema)
+from .mutation_bulk import *
+
+CONF = get_config()
+TABLES = {entity: getattr(CONF, f'db_tables_{entity}') for entity in ENTITIES}
+STORAGE = Storage(CONF.db_endpoint, CONF.db_access_key, CONF.db_secret_key,
+                  max_workers=CONF.db_max_workers,
+                  cache=ItemCache(CONF.db_cache_size, CONF.db_cache_ttl),
+                  schemas={TABLES[entity]: schema for entity, schema in SCHEMAS.items()})
+GRAPHS = GraphStore(STORAGE, CONF.db_tables_graph)
+CONTENTS = ContentStore(STORAGE, CONF.db_tables_content, CONF.content_snapshot_interval, CONF.content_cache_size)
+GRAPH_INDEX = GraphIndex(GRAPHS, CONF.graph_index_max_edges, CONF.graph_index_log or None,
+                         CONF.graph_index_log_max_size)
+SEARCH = {
+    'page_version': SearchIndex(CONF.search_directory, 'page_version', ('name', 'content'),
+                                CONF.search_flush_size, CONF.search_merge_factor),
+    'edge': SearchIndex(CONF.search_directory, 'edge', ('name', 'keywords'),
+                        CONF.search_flush_size, CONF.search_merge_factor),
+}
+GRAPHS.add_listener(GraphSearchListener(SEARCH['edge']))
+PERMISSIONS = PermissionIndex(STORAGE, TABLES, CONF.auth_log or None, CONF.auth_log_max_size, CONF.auth_cache_size)
+TRANSFER = NotebookTransfer(STORAGE, TABLES, GRAPHS, CONTENTS, SEARCH, batch_size=CONF.transfer_batch_size,
+                            rate=CONF.transfer_rate, compress_level=CONF.transfer_gzip_level, permissions=PERMISSIONS)
+# Successful mutations are announced to the socket server, which emits them to the rooms of their notebook or page
+CHANGES = ChangeFeed(CONF.socket_feed_path)
 
 # Query definition
 query = QueryType()
@@ -40,6 +73,32 @@ query.set_field('nodes', resolve_nodes)
 query.set_field('edge', resolve_edge)
 query.set_field('edges', resolve_edges)
 
+# graph traversal resolvers
+query.set_field('neighborhood', resolve_neighborhood)
+query.set_field('path', resolve_path)
+
+# nested type resolvers
+notebook = ObjectType('Notebook')
+notebook.set_field('pages', resolve_notebook_pages)
+notebook.set_field('folders', resolve_notebook_folders)
+notebook.set_field('graph', resolve_notebook_graph)
+
+folder = ObjectType('Folder')
+folder.set_field('pages', resolve_folder_pages)
+
+page = ObjectType('Page')
+page.set_field('versions', resolve_page_versions_of_page)
+
+page_version = ObjectType('PageVersion')
+page_version.set_field('content', resolve_page_version_content)
+
+graph = ObjectType('Graph')
+graph.set_field('nodes', resolve_graph_nodes)
+
+node = ObjectType('Node')
+node.set_field('page', resolve_node_page)
+node.set_field('edges', resolve_node_edges)
+
 # Mutation definition
 mutation = MutationType()
 
@@ -61,30 +120,51 @@ mutation.set_field('updateFolder', update_folder)
 mutation.set_field('updateNotebook', update_notebook)
 mutation.set_field('updatePageVersion', update_page_version)
 
-# Schema & App definition
-schema = make_executable_schema(type_defs, query, mutation)
-
-app = Flask('HYPER-WIKI-GRAPHQL')
-app.debug = True
-
-# Explorer definition
-explorer_html = ExplorerGraphiQL().html(None)
-
+# Bulk Mutations
+mutation.set_field('createPageVersions', create_page_versions)
+mutation.set_field('updatePageVersions', update_page_versions)
+mutation.set_field('deletePageVersions', delete_page_versions)
 
-@app.route("/", methods=["GET"])
-def graphql_explorer():
-    return explorer_html, 200
-
-
-@app.route("/", methods=["POST"])
-def graphql_server():
-    data = request.get_json()
-    success, result = graphql_sync(
-        schema,
-        data,
-        context_value={"request": request},
-        debug=app.debug
-    )
-
-    status_code = 200 if success else 400
-    return jsonify(result), status_code
+# Schema & App definition
+schema = make_cached_schema(CONF.graph_schema, CONF.graph_schema_cache,
+                            query, mutation, notebook, folder, page, page_version, graph, node)
+DOCUMENTS = DocumentCache(schema, CONF.graph_document_cache_size)
+COSTS = CostAnalyzer(schema, CONF.graph_cost_max_depth, CONF.graph_cost_max_cost,
+                     default_weight=CONF.graph_cost_default_weight,
+                     default_list_size=CONF.graph_cost_default_list_size,
+                     weights=CONF.section('graph_cost_weights'),
+                     list_sizes=CONF.section('graph_cost_list_sizes'))
+# The results depend on the principals of a request, if authorization is enabled
+ENCODER = ResponseEncoder(CONF.graph_http_compress_min_size, CONF.graph_http_gzip_level,
+                          CONF.graph_http_brotli_quality, CONF.graph_http_cache_control,
+                          (CONF.auth_principal_header,) if CONF.auth_enabled else ())
+
+
+def request_access(headers):
+    """
+    Returns the permission view of a request for the resolvers
+
+    :param headers: Mapping, The headers of the request, holding its principals
+    :return: Access, The view or None, if authorization is disabled
+    """
+    if not CONF.auth_enabled:
+        return None
+    return PERMISSIONS.access(parse_principals(headers.get(CONF.auth_principal_header)))
+
+
+def authorize_import(access):
+    """
+    Returns the check of a notebook import, which may overwrite stored items only with the control right on them
+
+    :param access: Access, The permission view of the request
+    :return: callable, Called with the entity and the stored item of everything the import overwrites
+    """
+    return lambda entity, item: access.check(entity, item, 'control')
+
+
+def __getattr__(name):
+    # The Flask app is created on first access, the ASGI workers do not import Flask at all
+    if name == 'app':
+        from .wsgi import app
+        return app
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,217 @@
+"""
+ASGI application executing the GraphQL requests asynchronously, served by multiple uvicorn workers
+"""
+import asyncio
+import io
+import re
+from ariadne.asgi import GraphQL
+from ariadne.asgi.handlers import GraphQLHTTPHandler
+from ariadne.exceptions import HttpError
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from ..util.async_storage import AsyncStorage
+from ..util.metrics import METRICS, field_middleware
+from . import CHANGES, CONF, CONTENTS, COSTS, DOCUMENTS, ENCODER, STORAGE, TABLES, GRAPHS, GRAPH_INDEX, SEARCH, \
+    PERMISSIONS, TRANSFER, authorize_import, request_access, schema
+from .execution import graphql_cached, operation_type
+from .loader import Loaders
+from .transport import LazyExplorer, is_get_query, request_data
+
+# Blocking storage calls of the resolvers run on this executor, so the event loop keeps serving other requests
+EXECUTOR = AsyncStorage(storage=STORAGE,
+                        max_concurrency=CONF.graph_storage_concurrency,
+                        max_workers=CONF.graph_storage_workers)
+
+# Routes of the notebook transfers, served next to the GraphQL app
+EXPORT_PATH = re.compile(r'^/notebooks/(?P<notebook>[^/]+)/export$')
+IMPORT_PATH = '/notebooks/import'
+
+
+async def request_access_async(headers):
+    if CONF.auth_enabled and not PERMISSIONS.loaded:
+        # The first request loads the permission index from the tables, later ones apply the logged changes only
+        await EXECUTOR.run(PERMISSIONS.sync)
+    return request_access(headers)
+
+
+async def get_context(request, data):
+    return {"request": request, "loaders": Loaders(STORAGE, TABLES, GRAPHS, CONTENTS, EXECUTOR), "graph_index": GRAPH_INDEX,
+            "search": SEARCH, "changes": CHANGES, "access": await request_access_async(request.headers)}
+
+
+class CachedGraphQLHTTPHandler(GraphQLHTTPHandler):
+    """
+    HTTP handler executing the requests with the validated documents of the DocumentCache.
+    Queries are accepted with GET as well, responses are compressed and validated by their ETag.
+    """
+
+    async def handle_request(self, request):
+        if request.method == 'GET' and CONF.graph_http_get_queries and is_get_query(request.query_params):
+            try:
+                data = request_data(request.query_params)
+            except ValueError as error:
+                return PlainTextResponse(str(error), status_code=400)
+            return await self.respond(request, data, operations=('query',))
+        return await super().handle_request(request)
+
+    async def graphql_http_server(self, request):
+        try:
+            data = await self.extract_data_from_request(request)
+        except HttpError as error:
+            return PlainTextResponse(error.message or error.status, status_code=400)
+        return await self.respond(request, data)
+
+    async def respond(self, request, data, operations: tuple = None):
+        success, result = await self.execute_graphql_query(request, data, operations=operations)
+        status_code, body, headers = ENCODER.encode(result, success, operation_type(DOCUMENTS, data) == 'query',
+                                                    request.headers.get('accept-encoding'),
+                                                    request.headers.get('if-none-match'))
+        return Response(body, status_code=status_code, headers=headers)
+
+    async def execute_graphql_query(self, request, data, *, context_value=None, query_document=None,
+                                    operations: tuple = None):
+        if context_value is None:
+            context_value = await self.get_context_for_request(request, data)
+        middleware = await self.get_middleware_for_request(request, context_value)
+        return await graphql_cached(self.schema, DOCUMENTS, data,
+                                    context_value=context_value,
+                                    debug=self.debug,
+                                    middleware=middleware,
+                                    logger=self.logger,
+                                    costs=COSTS,
+                                    operations=operations)
+
+
+graphql_app = GraphQL(
+    schema,
+    context_value=get_context,
+    debug=CONF.graph_debug,
+    explorer=LazyExplorer(),
+    http_handler=CachedGraphQLHTTPHandler(middleware=[field_middleware])
+)
+
+
+class ReceiveReader(io.RawIOBase):
+    """
+    Blocking file object over the body of a request, which a worker thread reads while the event loop receives it
+    """
+
+    def __init__(self, receive, loop: asyncio.AbstractEventLoop):
+        """
+
+        :param receive: callable, Awaitable returning the next event of the connection
+        :param loop: asyncio.AbstractEventLoop, The loop of the connection
+        """
+        self.receive = receive
+        self.loop = loop
+        self.pending = b''
+        self.more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending and self.more:
+            message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+            if message['type'] == 'http.disconnect':
+                raise ValueError('The client disconnected before the end of the stream')
+            self.pending = message.get('body', b'')
+            self.more = message.get('more_body', False)
+        data, self.pending = self.pending[:len(buffer)], self.pending[len(buffer):]
+        buffer[:len(data)] = data
+        return len(data)
+
+
+async def export_notebook(scope, notebook_id: str):
+    """
+    Streams the export of a notebook, the blocking reads run on the executor
+
+    :param scope: dict, The scope of the connection
+    :param notebook_id: str, The id of the notebook
+    :return: Response, The streamed export, 403 or 404
+    """
+    access = await request_access_async(Request(scope).headers)
+    if access is not None and not access.can('notebook', {'id': notebook_id}):
+        return PlainTextResponse(f'Not allowed to read notebook {notebook_id}', status_code=403)
+    chunks = TRANSFER.export_stream(notebook_id)
+    done = object()
+    try:
+        first = await EXECUTOR.run(next, chunks)
+    except LookupError as error:
+        return PlainTextResponse(str(error), status_code=404)
+
+    async def body():
+        try:
+            chunk = first
+            while chunk is not done:
+                yield chunk
+                chunk = await EXECUTOR.run(next, chunks, done)
+        finally:
+            chunks.close()
+
+    return StreamingResponse(body(), media_type='application/gzip',
+                             headers={'Content-Disposition': f'attachment; filename="{notebook_id}.ndjson.gz"'})
+
+
+async def import_notebook(scope, receive):
+    """
+    Imports the stream in the body of a request, while receiving it.
+    A failed import answers with the committed offset, sending the stream again with ?offset=<offset> resumes it.
+
+    :param scope: dict, The scope of the connection
+    :param receive: callable, Awaitable returning the next event of the connection
+    :return: Response, The result of the import
+    """
+    try:
+        offset = int(Request(scope).query_params.get('offset', 0))
+    except ValueError:
+        offset = 0
+    committed = {'offset': offset}
+    access = await request_access_async(Request(scope).headers)
+    reader = ReceiveReader(receive, asyncio.get_running_loop())
+    try:
+        result = await EXECUTOR.run(TRANSFER.import_stream, reader, offset,
+                                    lambda offset: committed.update(offset=offset),
+                                    None if access is None else authorize_import(access))
+    except PermissionError as error:
+        return JSONResponse({'error': True, 'message': str(error), 'offset': committed['offset']}, status_code=403)
+    except ValueError as error:
+        return JSONResponse({'error': True, 'message': str(error), 'offset': committed['offset']}, status_code=400)
+    return JSONResponse(dict(result, error=False))
+
+
+async def app(scope, receive, send):
+    """
+    Entrypoint of the ASGI server, serves the metrics and the notebook transfers and passes everything else
+    to the GraphQL app
+
+    :param scope: dict, The scope of the connection
+    :param receive: callable, Awaitable returning the next event of the connection
+    :param send: callable, Awaitable sending an event to the connection
+    :return: None
+    """
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                EXECUTOR.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    elif scope['type'] == 'http' and scope['path'] == '/metrics':
+        body = METRICS.render().encode('utf-8')
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                                (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+    elif scope['type'] == 'http' and CONF.transfer_http and scope['method'] == 'GET' and \
+            EXPORT_PATH.match(scope['path']):
+        response = await export_notebook(scope, EXPORT_PATH.match(scope['path'])['notebook'])
+        await response(scope, receive, send)
+    elif scope['type'] == 'http' and CONF.transfer_http and scope['method'] == 'POST' and \
+            scope['path'] == IMPORT_PATH:
+        response = await import_notebook(scope, receive)
+        await response(scope, receive, send)
+    else:
+        await graphql_app(scope, receive, send)
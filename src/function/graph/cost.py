@@ -0,0 +1,113 @@
+"""
+Static cost analysis of GraphQL documents, which rejects too deep or too expensive queries before execution
+"""
+from graphql import (DocumentNode, FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLError,
+                     GraphQLSchema, InlineFragmentNode, get_named_type, get_nullable_type, is_list_type)
+from graphql.utilities import get_operation_ast
+
+
+class QueryTooComplex(GraphQLError):
+    """
+    Raised, if a query exceeds the depth or cost limits
+    """
+
+    def __init__(self, message: str, cost: int, depth: int):
+        super().__init__(message, extensions={'code': 'QUERY_TOO_COMPLEX', 'cost': cost, 'depth': depth})
+        self.cost = cost
+        self.depth = depth
+
+
+class CostAnalyzer:
+    """
+    Computes the cost and depth of an operation from its document alone.
+    The cost of a field is its weight plus the cost of its selections, multiplied by the expected number of
+    items for list fields. Root list fields scan whole tables, so their weights are set high in the config.
+    """
+
+    def __init__(self, schema: GraphQLSchema, max_depth: int = 10, max_cost: int = 10000,
+                 default_weight: int = 1, default_list_size: int = 10,
+                 weights: dict = None, list_sizes: dict = None):
+        """
+
+        :param schema: GraphQLSchema, The schema of the documents
+        :param max_depth: int, The maximum nesting of fields
+        :param max_cost: int, The maximum cost of an operation
+        :param default_weight: int, The weight of fields, which are not scalars and not configured
+        :param default_list_size: int, The expected number of items of list fields, which are not configured
+        :param weights: dict, Weights by field, e.g. {'Query.pages': 100, 'PageVersion.content': 10}
+        :param list_sizes: dict, Expected numbers of items by list field, e.g. {'Notebook.pages': 20}
+        """
+        self.schema = schema
+        self.max_depth = max_depth
+        self.max_cost = max_cost
+        self.default_weight = default_weight
+        self.default_list_size = default_list_size
+        self.weights = weights or {}
+        self.list_sizes = list_sizes or {}
+
+    def analyze(self, document: DocumentNode, operation_name: str = None):
+        """
+        Computes the cost and depth of an operation
+
+        :param document: DocumentNode, The validated document
+        :param operation_name: str, The name of the operation to execute
+        :return: tuple, The cost and the depth of the operation, (0, 0) if the operation does not exist
+        """
+        operation = get_operation_ast(document, operation_name)
+        if operation is None:
+            return 0, 0
+        root = self.schema.get_root_type(operation.operation)
+        if root is None:
+            return 0, 0
+        fragments = {definition.name.value: definition for definition in document.definitions
+                     if isinstance(definition, FragmentDefinitionNode)}
+        return self._selections(root, operation.selection_set, fragments, 1)
+
+    def check(self, document: DocumentNode, operation_name: str = None):
+        """
+        Computes the cost of an operation and enforces the limits
+
+        :param document: DocumentNode, The validated document
+        :param operation_name: str, The name of the operation to execute
+        :return: tuple, The cost and the depth of the operation
+        :raises QueryTooComplex: If the operation exceeds the maximum depth or cost
+        """
+        cost, depth = self.analyze(document, operation_name)
+        if depth > self.max_depth:
+            raise QueryTooComplex(f'Query depth {depth} exceeds the maximum depth of {self.max_depth}', cost, depth)
+        if cost > self.max_cost:
+            raise QueryTooComplex(f'Query cost {cost} exceeds the maximum cost of {self.max_cost}', cost, depth)
+        return cost, depth
+
+    def _selections(self, parent_type, selection_set, fragments: dict, depth: int):
+        cost, max_depth = 0, depth - 1
+        for selection in selection_set.selections if selection_set else ():
+            if isinstance(selection, FieldNode):
+                field_cost, field_depth = self._field(parent_type, selection, fragments, depth)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = (self.schema.get_type(selection.type_condition.name.value)
+                                 if selection.type_condition else parent_type)
+                field_cost, field_depth = self._selections(fragment_type, selection.selection_set, fragments, depth)
+            elif isinstance(selection, FragmentSpreadNode) and selection.name.value in fragments:
+                fragment = fragments[selection.name.value]
+                field_cost, field_depth = self._selections(self.schema.get_type(fragment.type_condition.name.value),
+                                                           fragment.selection_set, fragments, depth)
+            else:
+                continue
+            cost += field_cost
+            max_depth = max(max_depth, field_depth)
+        return cost, max_depth
+
+    def _field(self, parent_type, node: FieldNode, fragments: dict, depth: int):
+        name = node.name.value
+        fields = getattr(parent_type, 'fields', {})
+        if name.startswith('__') or name not in fields:
+            return 0, depth - 1
+        key = f'{parent_type.name}.{name}'
+        field_type = get_nullable_type(fields[name].type)
+        named_type = get_named_type(field_type)
+        weight = self.weights.get(key, 0 if node.selection_set is None else self.default_weight)
+        cost, field_depth = self._selections(named_type, node.selection_set, fragments, depth + 1)
+        if is_list_type(field_type):
+            cost *= self.list_sizes.get(key, self.default_list_size)
+        return weight + cost, max(depth, field_depth)
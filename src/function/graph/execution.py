@@ -0,0 +1,239 @@
+"""
+Execution of GraphQL requests with a cache of parsed and validated documents and automatic persisted queries
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from inspect import isawaitable
+from ariadne.format_error import format_error
+from ariadne.graphql import handle_graphql_errors, handle_query_result, validate_operation_name, validate_variables
+from graphql import GraphQLError, GraphQLSchema, execute, execute_sync, get_operation_ast, parse, validate
+from .cost import CostAnalyzer
+from .transport import METHOD_NOT_ALLOWED
+
+# Error of the automatic persisted query protocol, the client answers it by sending the full query text
+PERSISTED_QUERY_NOT_FOUND = 'PersistedQueryNotFound'
+
+
+def query_hash(query: str):
+    """
+    Computes the hash, which identifies a query in the cache and in the persisted query protocol
+
+    :param query: str, The text of the query
+    :return: str, The hex encoded SHA-256 hash of the query
+    """
+    return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+
+class ValidationFailed(GraphQLError):
+    """
+    Carries all validation errors of a document through a single raise
+    """
+
+    def __init__(self, errors: list):
+        super().__init__(errors[0].message)
+        self.errors = errors
+
+
+class DocumentCache:
+    """
+    Thread safe LRU cache of parsed and validated documents, keyed by the SHA-256 hash of the query text.
+    Validation errors are cached as well, so an invalid query is rejected without parsing it again.
+    The cache doubles as the store of automatic persisted queries, which clients send by hash only.
+    """
+
+    def __init__(self, schema: GraphQLSchema, max_size: int = 1000):
+        """
+
+        :param schema: GraphQLSchema, The schema the documents are validated against
+        :param max_size: int, The maximum number of cached documents
+        """
+        self.schema = schema
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def document(self, data: dict):
+        """
+        Returns the validated document of a request
+
+        :param data: dict, The body of the request, holding the query text and / or a persisted query hash
+        :return: tuple, The document and the list of validation errors
+        :raises GraphQLError: If the request holds no usable query or a persisted query is unknown
+        """
+        key, query = self._key(data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        if not query:
+            raise GraphQLError(PERSISTED_QUERY_NOT_FOUND, extensions={'code': 'PERSISTED_QUERY_NOT_FOUND'})
+        try:
+            document = parse(query)
+        except GraphQLError as error:
+            entry = (None, [error])
+        else:
+            entry = (document, validate(self.schema, document))
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def cached(self, data: dict):
+        """
+        Returns the cached document of a request without counting a hit or parsing the query
+
+        :param data: dict, The body of the request
+        :return: tuple, The document and the list of validation errors or None, if the document is not cached
+        """
+        try:
+            key, _query = self._key(data)
+        except GraphQLError:
+            return None
+        with self._lock:
+            return self._entries.get(key)
+
+    @staticmethod
+    def _key(data: dict):
+        query = data.get('query')
+        if query is not None and not isinstance(query, str):
+            raise GraphQLError('The query must be a string.')
+        persisted = (data.get('extensions') or {}).get('persistedQuery')
+        if persisted:
+            if persisted.get('version') != 1:
+                raise GraphQLError('Unsupported persisted query version.')
+            key = persisted.get('sha256Hash')
+            if query and query_hash(query) != key:
+                raise GraphQLError('The hash of the persisted query does not match the query.')
+        elif query:
+            key = query_hash(query)
+        else:
+            raise GraphQLError('The query must be a string.')
+        return key, query
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of the cache
+
+        :return: dict, The number of hits, misses and cached documents
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+def operation_type(documents: DocumentCache, data):
+    """
+    Returns the type of the operation a request executed, from the document cache
+
+    :param documents: DocumentCache, The cache of validated documents
+    :param data: The body of the request
+    :return: str, 'query', 'mutation' or 'subscription', None if the request holds no valid document
+    """
+    entry = documents.cached(data) if isinstance(data, dict) else None
+    if entry is None or entry[0] is None:
+        return None
+    operation = get_operation_ast(entry[0], data.get('operationName'))
+    return None if operation is None else operation.operation.value
+
+
+def prepare(documents: DocumentCache, data, costs: CostAnalyzer = None, operations: tuple = None):
+    """
+    Checks a request and returns its validated document
+
+    :param documents: DocumentCache, The cache of validated documents
+    :param data: The body of the request
+    :param costs: CostAnalyzer, The analyzer enforcing the depth and cost limits, None to skip the analysis
+    :param operations: tuple, The allowed operation types, e.g. ('query',) for GET requests, None for all
+    :return: tuple, The document to execute and the extensions of the response
+    :raises GraphQLError: If the request or its query is invalid or too complex, the first error holds all errors
+    """
+    if not isinstance(data, dict):
+        raise GraphQLError('Operation data should be a JSON object')
+    validate_variables(data.get('variables'))
+    validate_operation_name(data.get('operationName'))
+    document, errors = documents.document(data)
+    if errors:
+        raise ValidationFailed(errors)
+    if operations is not None:
+        operation = get_operation_ast(document, data.get('operationName'))
+        if operation is not None and operation.operation.value not in operations:
+            raise GraphQLError(f'Can only perform a {" or ".join(operations)} operation with this request method.',
+                               extensions={'code': METHOD_NOT_ALLOWED})
+    if costs is None:
+        return document, None
+    cost, depth = costs.check(document, data.get('operationName'))
+    return document, {'cost': {'requested': cost, 'maximum': costs.max_cost, 'depth': depth}}
+
+
+def _succeeded(result, extensions: dict, debug: bool, logger):
+    success, response = handle_query_result(result, logger=logger, error_formatter=format_error, debug=debug)
+    if extensions:
+        response.setdefault('extensions', {}).update(extensions)
+    return success, response
+
+
+def _failed(error: GraphQLError, debug: bool, logger):
+    errors = error.errors if isinstance(error, ValidationFailed) else [error]
+    return handle_graphql_errors(errors, logger=logger, error_formatter=format_error, debug=debug)
+
+
+def graphql_cached_sync(schema: GraphQLSchema, documents: DocumentCache, data, context_value=None,
+                        debug: bool = False, middleware: list = None, logger=None, costs: CostAnalyzer = None,
+                        operations: tuple = None):
+    """
+    Executes a request synchronously, like ariadne.graphql_sync, but with the validated document of the cache
+
+    :param schema: GraphQLSchema, The schema to execute the request against
+    :param documents: DocumentCache, The cache of validated documents
+    :param data: The body of the request
+    :param context_value: The context of the resolvers
+    :param debug: bool, Whether errors include their traceback
+    :param middleware: list, The middleware of the resolvers
+    :param logger: The logger of the errors
+    :param costs: CostAnalyzer, The analyzer enforcing the depth and cost limits
+    :param operations: tuple, The allowed operation types, None for all
+    :return: tuple, Whether the request succeeded and the response
+    """
+    try:
+        document, extensions = prepare(documents, data, costs, operations)
+        result = execute_sync(schema, document, context_value=context_value,
+                              variable_values=data.get('variables'), operation_name=data.get('operationName'),
+                              middleware=middleware)
+    except GraphQLError as error:
+        return _failed(error, debug, logger)
+    return _succeeded(result, extensions, debug, logger)
+
+
+async def graphql_cached(schema: GraphQLSchema, documents: DocumentCache, data, context_value=None,
+                         debug: bool = False, middleware: list = None, logger=None, costs: CostAnalyzer = None,
+                        operations: tuple = None):
+    """
+    Executes a request asynchronously, like ariadne.graphql, but with the validated document of the cache
+
+    :param schema: GraphQLSchema, The schema to execute the request against
+    :param documents: DocumentCache, The cache of validated documents
+    :param data: The body of the request
+    :param context_value: The context of the resolvers
+    :param debug: bool, Whether errors include their traceback
+    :param middleware: list, The middleware of the resolvers
+    :param logger: The logger of the errors
+    :param costs: CostAnalyzer, The analyzer enforcing the depth and cost limits
+    :param operations: tuple, The allowed operation types, None for all
+    :return: tuple, Whether the request succeeded and the response
+    """
+    try:
+        document, extensions = prepare(documents, data, costs, operations)
+        result = execute(schema, document, context_value=context_value,
+                         variable_values=data.get('variables'), operation_name=data.get('operationName'),
+                         middleware=middleware)
+        if isawaitable(result):
+            result = await result
+    except GraphQLError as error:
+        return _failed(error, debug, logger)
+    return _succeeded(result, extensions, debug, logger)
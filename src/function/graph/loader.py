@@ -0,0 +1,296 @@
+"""
+Request scoped DataLoaders, which batch and memoize the storage reads of nested resolvers
+"""
+import asyncio
+import functools
+from ..util.async_storage import AsyncStorage
+from ..util.content import ContentStore
+from ..util.graph_store import GraphStore
+from ..util.storage import Storage
+from .projection import projection
+
+ENTITIES = ('notebook', 'folder', 'page', 'page_version')
+
+# Fields of an entity, which reference other entities by id: entity -> ((field, referenced entity), ...)
+RELATIONS = {
+    'notebook': (('pages', 'page'), ('folders', 'folder'), ('graph', 'graph')),
+    'folder': (('pages', 'page'),),
+    'page': (('pageVersions', 'page_version'),),
+}
+
+# Attribute types of the entities, used by the storage codec to skip the per attribute type dispatch
+SCHEMAS = {
+    'notebook': {'id': 'S', 'name': 'S', 'pages': 'L', 'folders': 'L', 'graph': 'S', 'permissions': 'L'},
+    'folder': {'id': 'S', 'name': 'S', 'location': 'S', 'pages': 'L'},
+    'page': {'id': 'S', 'name': 'S', 'location': 'S', 'pageVersions': 'L'},
+    'page_version': {'id': 'S', 'name': 'S', 'version': 'N', 'content': 'S', 'permissions': 'L', 'page': 'S',
+                     'content_chain': 'S', 'content_revision': 'N'},
+}
+
+
+def content_ref(page_version: dict):
+    """
+    Returns the key of the content of a page version in the ContentStore
+
+    :param page_version: dict, The page version item
+    :return: tuple, The chain and the revision of the content
+    """
+    return page_version['content_chain'], int(page_version['content_revision'])
+
+
+class DataLoader:
+    """
+    Collects keys, loads them with a single batch call and memoizes the results for the rest of the request
+    """
+
+    def __init__(self, batch_load_fn, on_load=None, pending: dict = None):
+        """
+
+        :param batch_load_fn: callable, Called with a list of unique keys, has to return the values in the same order
+        :param on_load: callable, Called with the list of newly loaded values after every batch
+        :param pending: dict, The queued keys per group, shared by loaders of the same keys
+        """
+        self.batch_load_fn = batch_load_fn
+        self.on_load = on_load
+        self.cache = {}
+        self.pending = {} if pending is None else pending
+
+    def defer(self, keys: list, group: str = None):
+        """
+        Queues keys, which will be loaded together with the next load of the same group
+
+        :param keys: list, The keys to queue
+        :param group: str, The group, e.g. the relation the keys were found in
+        :return: None
+        """
+        pending = self.pending.setdefault(group, {})
+        for key in keys:
+            if key not in self.cache:
+                pending[key] = None
+
+    def load(self, key, group: str = None):
+        """
+        Loads a single value
+
+        :param key: The key to load
+        :param group: str, The group whose queued keys are loaded in the same batch
+        :return: The loaded value or None, if it does not exist
+        """
+        return self.load_many([key], group)[0]
+
+    def load_many(self, keys: list, group: str = None):
+        """
+        Loads multiple values in one batch together with all queued keys of the group
+
+        :param keys: list, The keys to load
+        :param group: str, The group whose queued keys are loaded in the same batch
+        :return: list, The loaded values in the order of the keys
+        """
+        missing = dict(self.pending.pop(group, {}))
+        missing.update((key, None) for key in keys if key not in self.cache)
+        missing = [key for key in missing if key not in self.cache]
+        if missing:
+            values = self.batch_load_fn(missing)
+            self.cache.update(zip(missing, values))
+            if self.on_load:
+                self.on_load([value for value in values if value is not None])
+        return [self.cache[key] for key in keys]
+
+    def prime(self, key, value):
+        """
+        Stores an already known value, so it is not loaded again
+
+        :param key: The key of the value
+        :param value: The value to store
+        :return: None
+        """
+        self.cache[key] = value
+
+
+class AsyncDataLoader:
+    """
+    Awaitable counterpart of DataLoader for asynchronous execution.
+    Keys requested while the resolvers of one level run are collected and loaded with a single batch call,
+    once the event loop has no other callbacks ready.
+    """
+
+    def __init__(self, batch_load_fn, on_load=None, ticks: int = 3):
+        """
+
+        :param batch_load_fn: callable, Called with a list of unique keys, has to return an awaitable of the values
+        :param on_load: callable, Called with the list of newly loaded values after every batch
+        :param ticks: int, The number of event loop iterations to wait for further keys before a batch is loaded
+        """
+        self.batch_load_fn = batch_load_fn
+        self.on_load = on_load
+        self.ticks = ticks
+        self.cache = {}
+        self.queue = []
+
+    def defer(self, keys: list, group: str = None):
+        """
+        Keys of siblings are collected by the running batch anyway, deferring them is not required
+
+        :param keys: list, The keys to queue
+        :param group: str, The group, e.g. the relation the keys were found in
+        :return: None
+        """
+
+    def load(self, key, group: str = None):
+        """
+        Loads a single value
+
+        :param key: The key to load
+        :param group: str, Ignored, keys of all groups are collected together
+        :return: asyncio.Future, resolving to the loaded value or None, if it does not exist
+        """
+        future = self.cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self.cache[key] = loop.create_future()
+            self.queue.append(key)
+            if len(self.queue) == 1:
+                loop.call_soon(self._schedule, loop, self.ticks)
+        return future
+
+    def load_many(self, keys: list, group: str = None):
+        """
+        Loads multiple values
+
+        :param keys: list, The keys to load
+        :param group: str, Ignored, keys of all groups are collected together
+        :return: asyncio.Future, resolving to the loaded values in the order of the keys
+        """
+        return asyncio.gather(*[self.load(key) for key in keys])
+
+    def prime(self, key, value):
+        """
+        Stores an already known value, so it is not loaded again
+
+        :param key: The key of the value
+        :param value: The value to store
+        :return: None
+        """
+        if key not in self.cache:
+            future = self.cache[key] = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+
+    def _schedule(self, loop, ticks: int):
+        # Resolvers of the next level resume over several loop iterations, wait for them before loading
+        if ticks > 1:
+            loop.call_soon(self._schedule, loop, ticks - 1)
+        else:
+            keys, self.queue = self.queue, []
+            loop.create_task(self._dispatch(keys))
+
+    async def _dispatch(self, keys: list):
+        try:
+            values = await self.batch_load_fn(keys)
+        except Exception as error:
+            for key in keys:
+                self.cache.pop(key).set_exception(error)
+            return
+        for key, value in zip(keys, values):
+            self.cache[key].set_result(value)
+        if self.on_load:
+            self.on_load([value for value in values if value is not None])
+
+
+class Loaders:
+    """
+    Registry of the DataLoaders of a single request, one per entity and projection.
+    The loaders of the projections of an entity share their queued keys, the first load of a group takes all of them.
+    Graphs are loaded as a whole (with their nodes and edges) from the GraphStore, the contents of page versions
+    (keyed by (chain, revision)) are reconstructed by the ContentStore.
+    With an executor the loaders are asynchronous and run their batches on it, instead of blocking.
+    """
+
+    def __init__(self, storage: Storage, tables: dict, graphs: GraphStore, contents: ContentStore,
+                 executor: AsyncStorage = None):
+        """
+
+        :param storage: Storage, The storage to load the entities from
+        :param tables: dict, A map of entity names to table names
+        :param graphs: GraphStore, The store to load graphs from
+        :param contents: ContentStore, The store of the page version contents
+        :param executor: AsyncStorage, The executor of asynchronous requests, None for synchronous requests
+        """
+        self.storage = storage
+        self.tables = tables
+        self.graphs = graphs
+        self.contents = contents
+        self.executor = executor
+        self._loaders = {}
+        self._pending = {}
+
+    def __getitem__(self, entity: str):
+        return self.get(entity)
+
+    def get(self, entity: str, attributes: frozenset = None):
+        """
+        Returns the loader of an entity, which reads only the given attributes
+
+        :param entity: str, The name of the entity
+        :param attributes: frozenset, The attributes to read, None to read whole items. Ignored for graphs and contents.
+        :return: DataLoader or AsyncDataLoader
+        """
+        if entity in ('graph', 'content'):
+            attributes = None
+        key = (entity, attributes)
+        if key not in self._loaders:
+            if entity == 'graph':
+                batch_load_fn = lambda keys: [self.graphs.load_graph(key) for key in keys]
+            elif entity == 'content':
+                batch_load_fn = self.contents.get_many
+            else:
+                table, params = self.tables[entity], projection(attributes)
+                batch_load_fn = lambda keys: self.storage.batch_get_items(table, [{'id': key} for key in keys],
+                                                                          **params)
+            on_load = lambda items: self.loaded(entity, items)
+            if self.executor is None:
+                self._loaders[key] = DataLoader(batch_load_fn, on_load, self._pending.setdefault(entity, {}))
+            else:
+                self._loaders[key] = AsyncDataLoader(functools.partial(self.executor.run, batch_load_fn), on_load)
+        return self._loaders[key]
+
+    def prime_many(self, entity: str, items: list, attributes: frozenset = None):
+        """
+        Stores items, which were read by a query or scan, in the loader of their entity
+
+        :param entity: str, The name of the entity
+        :param items: list, The items read
+        :param attributes: frozenset, The attributes the items were read with, None for whole items
+        :return: list, The given items
+        """
+        loader = self.get(entity, attributes)
+        for item in items:
+            loader.prime(item['id'], item)
+        self.loaded(entity, items)
+        return items
+
+    def loaded(self, entity: str, items: list):
+        """
+        Queues the references of freshly loaded items, so all siblings are resolved in one batch
+
+        :param entity: str, The name of the entity
+        :param items: list, The loaded items
+        :return: None
+        """
+        if entity == 'graph':
+            pages = [node['page'] for graph in items for node in graph['nodes'] if node.get('page')]
+            self['page_version'].defer(pages, 'node.page')
+            return
+        if entity == 'page_version':
+            refs = [content_ref(item) for item in items if 'content_chain' in item]
+            if refs:
+                self['content'].defer(refs, 'page_version.content')
+        for field, referenced in RELATIONS.get(entity, ()):
+            keys = []
+            for item in items:
+                value = item.get(field)
+                if isinstance(value, (list, set)):
+                    keys.extend(value)
+                elif value:
+                    keys.append(value)
+            if keys:
+                self[referenced].defer(keys, f'{entity}.{field}')
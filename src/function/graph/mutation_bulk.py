@@ -0,0 +1,242 @@
+from ..util.changes import DELETED
+from ..util.config import get_config
+from ..util.storage import TRANSACT_WRITE_LIMIT, chunk
+from .mutation_create import CONDITION_FAILED, created_page_versions, new_page_version, version_writes, \
+    write_page_versions
+from .mutation_delete import DETACH_RETRIES, detach_versions, unlink_versions, versions_by_page
+from .mutation_update import authorize_update, build_update, update_values, updated_page_versions
+from .query import call
+
+# The versions of a page written by one transaction: a content revision and a put each and the update of the page
+GROUP_SIZE = (TRANSACT_WRITE_LIMIT - 1) // 2
+
+# Follow-up: bulk and atomic mutations of pages, notebooks and folders (e.g. moving the pages of a notebook in one
+# transaction) are still missing. Their single mutations raise NotImplementedError, once they exist, their bulk
+# variants are built on write_bulk like the ones of page versions.
+
+
+def bulk_result(results: list, noun: str):
+    """
+    Summarizes the results of the items of a bulk mutation
+
+    :param results: list, The MutationResult of every item
+    :param noun: str, The plural of the entity, used in the message
+    :return: dict, The BulkMutationResult
+    """
+    written = sum(not result['error'] for result in results)
+    return {'error': written < len(results), 'message': f'{written} of {len(results)} {noun} written',
+            'results': results}
+
+
+def check_bulk(ids: list, atomic: bool):
+    """
+    Checks the size of a bulk mutation and that every item is written once
+
+    :param ids: list, The ids of the items, None for items still to be created
+    :param atomic: bool, Whether the items are written in a single transaction
+    :return: list, The error result of every item, None for the accepted items
+    """
+    limit = TRANSACT_WRITE_LIMIT if atomic else get_config().graph_bulk_max_items
+    if len(ids) > limit:
+        message = f'A{"n atomic" if atomic else ""} bulk mutation writes at most {limit} items, got {len(ids)}'
+        return [{'error': True, 'message': message} for _ in ids]
+    seen, results = set(), []
+    for id in ids:
+        results.append({'error': True, 'message': f'{id} is written more than once'} if id in seen else None)
+        if id is not None:
+            seen.add(id)
+    return results
+
+
+def rejected(results: list, atomic: bool):
+    """
+    Checks whether an atomic bulk mutation has rejected items, marking all other items as not written
+
+    :param results: list, The error result of every item, None for the accepted items, is completed in place
+    :param atomic: bool, Whether all items are written or none of them
+    :return: bool, Whether nothing may be written
+    """
+    if not atomic or all(result is None for result in results):
+        return False
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = {'error': True, 'message': 'Not written, as other items of the mutation were rejected'}
+    return True
+
+
+def merged(current: dict, values: dict, remove: tuple):
+    """
+    Applies an update to a read item, as transactions do not return the written items
+
+    :param current: dict, The item as read
+    :param values: dict, The values set by the update, None values are not set
+    :param remove: tuple, The attributes removed by the update
+    :return: dict, The item as written
+    """
+    item = dict(current, **{attribute: value for attribute, value in values.items() if value is not None})
+    for attribute in remove:
+        item.pop(attribute, None)
+    return item
+
+
+def write_bulk(loaders, actions: dict, results: list, atomic: bool, missing: str):
+    """
+    Writes the actions of the accepted items of a bulk mutation, in one transaction if it is atomic
+
+    :param loaders: Loaders, The loaders of the request
+    :param actions: dict, The index of every accepted item mapped to its write, see Storage.transact_write_items
+    :param results: list, The error result of every item, None for the accepted items, is completed in place
+    :param atomic: bool, Whether all items are written or none of them
+    :param missing: str, The message of a failed condition, formatted with the id of the item
+    :return: list, The indexes of the written items
+    """
+    if rejected(results, atomic):
+        return []
+    writes = list(actions.values())
+    if atomic:
+        outcomes = loaders.storage.transact_write_items(writes)
+    else:
+        outcomes = loaders.storage.batch_write(writes)
+    return bulk_outcomes(actions, outcomes, results, missing)
+
+
+def bulk_outcomes(actions: dict, outcomes: list, results: list, missing: str):
+    """
+    Completes the results of a bulk mutation from the outcomes of its writes
+
+    :param actions: dict, The index of every accepted item mapped to its write
+    :param outcomes: list, The results of the writes in the order of the actions, see write_result
+    :param results: list, The error result of every item, None for the accepted items, is completed in place
+    :param missing: str, The message of a failed condition, formatted with the id of the item
+    :return: list, The indexes of the written items
+    """
+    written = []
+    for index, write, outcome in zip(actions, actions.values(), outcomes):
+        key = write.get('put') or write.get('update') or write.get('delete')
+        if not outcome['error']:
+            results[index] = {'error': False, 'message': key['id']}
+            written.append(index)
+        elif outcome['code'] in CONDITION_FAILED:
+            results[index] = {'error': True, 'message': missing.format(key['id'])}
+        else:
+            results[index] = {'error': True, 'message': outcome['message'] or outcome['code']}
+    return written
+
+
+def create_page_versions(_, info, inputs: list, atomic: bool = False):
+    loaders = info.context['loaders']
+
+    def create():
+        access = info.context.get('access')
+        results = check_bulk([None] * len(inputs), atomic)
+        for index, input in enumerate(inputs):
+            if results[index] is None and access is not None and input.get('page') and \
+                    not access.can('page', {'id': input['page']}, 'write'):
+                results[index] = {'error': True, 'message': f'Not allowed to write page {input["page"]}'}
+        if rejected(results, atomic):
+            # Nothing is written, so the contents are not appended to their chains either
+            return bulk_result(results, 'page versions')
+        accepted = [index for index, result in enumerate(results) if result is None]
+        entries = {index: new_page_version(inputs[index]) for index in accepted}
+        if atomic:
+            groups = [accepted]
+            writes = version_writes(list(entries.values()))
+            if writes > TRANSACT_WRITE_LIMIT:
+                message = f'An atomic bulk mutation writes at most {TRANSACT_WRITE_LIMIT} items, contents and pages,' \
+                          f' got {writes}'
+                return bulk_result([{'error': True, 'message': message} for _ in inputs], 'page versions')
+        else:
+            # The versions of a page append to one content chain and one list, so they are written together
+            by_page = {}
+            for index in accepted:
+                by_page.setdefault(inputs[index].get('page'), []).append(index)
+            groups = [group for indexes in by_page.values() for group in chunk(indexes, GROUP_SIZE)]
+        for group in groups:
+            errors = write_page_versions(loaders, [entries[index] for index in group], independent=not atomic)
+            for index, error in zip(group, errors):
+                results[index] = error or {'error': False, 'message': entries[index][0]['id']}
+        written = [index for index in accepted if not results[index]['error']]
+        created_page_versions(info, [entries[index][0] for index in written], [entries[index][1] for index in written],
+                              [inputs[index] for index in written])
+        return bulk_result(results, 'page versions')
+
+    return call(info, create)
+
+
+def update_page_versions(_, info, inputs: list, atomic: bool = False):
+    loaders = info.context['loaders']
+
+    def update():
+        access = info.context.get('access')
+        table = loaders.tables['page_version']
+        ids = [entry['id'] for entry in inputs]
+        results = check_bulk(ids, atomic)
+        currents = loaders.storage.batch_get_items(table, [{'id': id} for id in ids], consistent_read=True) \
+            if None in results else [None] * len(ids)
+        for index, (id, current) in enumerate(zip(ids, currents)):
+            if results[index] is None:
+                results[index] = {'error': True, 'message': f'Could not find page version {id}'} \
+                    if current is None else authorize_update(access, current, inputs[index]['input'])
+        if rejected(results, atomic):
+            return bulk_result(results, 'page versions')
+        accepted = [index for index, result in enumerate(results) if result is None]
+        actions, items, contents = {}, {}, {}
+        for index in accepted:
+            values, remove, contents[index] = update_values(loaders, inputs[index]['input'], currents[index])
+            actions[index] = dict(build_update(values, remove), table=table, update={'id': ids[index]})
+            items[index] = merged(currents[index], values, remove)
+        written = write_bulk(loaders, actions, results, atomic, 'Could not find page version {}')
+        updated_page_versions(info, [items[index] for index in written], [contents[index] for index in written],
+                              [inputs[index]['input'] for index in written])
+        return bulk_result(results, 'page versions')
+
+    return call(info, update)
+
+
+def delete_page_versions(_, info, ids: list, atomic: bool = False):
+    loaders = info.context['loaders']
+
+    def delete():
+        access = info.context.get('access')
+        table = loaders.tables['page_version']
+        results = check_bulk(ids, atomic)
+        currents = loaders.storage.batch_get_items(table, [{'id': id} for id in ids], consistent_read=True) \
+            if None in results else [None] * len(ids)
+        for index, (id, current) in enumerate(zip(ids, currents)):
+            if results[index] is not None:
+                continue
+            if current is None:
+                results[index] = {'error': True, 'message': f'Could not find page version {id}'}
+            elif access is not None and not access.can('page_version', current, 'write'):
+                results[index] = {'error': True, 'message': f'Not allowed to write page version {id}'}
+        accepted = [index for index, result in enumerate(results) if result is None]
+        # The items were just read, only a transaction has to make sure they still exist when it is applied
+        condition = {'conditional_expression': 'attribute_exists(#id)',
+                     'expression_attribute_names': {'#id': 'id'}} if atomic else {}
+        actions = {index: dict(condition, table=table, delete={'id': ids[index]}) for index in accepted}
+        missing = 'Could not find page version {}'
+        if not atomic:
+            written = write_bulk(loaders, actions, results, atomic, missing)
+            unlink_versions(loaders, versions_by_page([currents[index] for index in written]))
+        elif rejected(results, atomic):
+            written = []
+        else:
+            # The versions are removed from their pages in the same transaction, which is sent again, if a list
+            # of versions changed after it was read
+            pages = versions_by_page([currents[index] for index in accepted])
+            for _attempt in range(DETACH_RETRIES):
+                detach = detach_versions(loaders, pages)
+                if len(actions) + len(detach) > TRANSACT_WRITE_LIMIT:
+                    message = f'An atomic bulk mutation writes at most {TRANSACT_WRITE_LIMIT} items and pages, ' \
+                              f'got {len(actions) + len(detach)}'
+                    return bulk_result([{'error': True, 'message': message} for _ in ids], 'page versions')
+                outcomes = loaders.storage.transact_write_items(list(actions.values()) + detach)
+                if not any(outcome['code'] in CONDITION_FAILED for outcome in outcomes[len(actions):]):
+                    break
+            written = bulk_outcomes(actions, outcomes, results, missing)
+        for index in written:
+            info.context['search']['page_version'].delete(ids[index])
+            info.context['changes'].publish('page_version', ids[index], DELETED, page=currents[index].get('page'))
+        return bulk_result(results, 'page versions')
+
+    return call(info, delete)
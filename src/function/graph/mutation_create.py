@@ -1,3 +1,20 @@
+import uuid
+from ..util.changes import CREATED
+from .query import call
+
+CONDITION_FAILED = ('ConditionalCheckFailed', 'ConditionalCheckFailedException')
+
+
+def with_permission_ids(permissions: list):
+    """
+    Assigns ids to the permissions of a create or update input
+
+    :param permissions: list, The permission inputs
+    :return: list, The permissions as stored
+    """
+    return [dict(permission, id=str(uuid.uuid4())) for permission in permissions or []]
+
+
 def create_page(*_, input: dict):
     raise NotImplementedError('Not Implemented Yet :D')
 
@@ -10,5 +27,148 @@ def create_folder(*_, input: dict):
     raise NotImplementedError('Not Implemented Yet :D')
 
 
-def create_page_version(*_, input: dict):
-    raise NotImplementedError('Not Implemented Yet :D')
+def new_page_version(input: dict):
+    """
+    Builds the item of a new page version, its content is appended to the content chain of its page by
+    write_page_versions
+
+    :param input: dict, The input of the mutation
+    :return: tuple, The item to store and its content
+    """
+    item = dict(input, id=str(uuid.uuid4()))
+    if 'permissions' in item:
+        item['permissions'] = with_permission_ids(item['permissions'])
+    content = item.pop('content', None)
+    if content is not None:
+        # The versions of a page share one chain of deltas, a version without page has a chain of its own
+        item['content_chain'] = item.get('page') or item['id']
+    return item, content
+
+
+def append_versions(table: str, page: str, ids: list):
+    """
+    Builds the write appending new versions to the pageVersions of their page
+
+    :param table: str, The name of the page table
+    :param page: str, The id of the page
+    :param ids: list, The ids of the new versions
+    :return: dict, The update, which fails if the page does not exist, see Storage.transact_write_items
+    """
+    return {'table': table, 'update': {'id': page},
+            'update_expression': 'SET #versions = list_append(if_not_exists(#versions, :empty), :versions)',
+            'conditional_expression': 'attribute_exists(#id)',
+            'expression_attribute_names': {'#versions': 'pageVersions', '#id': 'id'},
+            'expression_attribute_values': {':empty': [], ':versions': list(ids)}}
+
+
+def version_writes(entries: list):
+    """
+    Counts the writes of new page versions: their puts, their contents and one update per page
+
+    :param entries: list, The (item, content) tuples of new_page_version
+    :return: int, The number of writes
+    """
+    return sum(1 + (content is not None) for _, content in entries) + \
+        len({item['page'] for item, _ in entries if item.get('page')})
+
+
+def write_page_versions(loaders, entries: list, independent: bool = False):
+    """
+    Writes new page versions in one transaction with their contents and the pageVersions of their pages, so a
+    failed write neither leaves revisions nor references behind. The transaction is retried with new revisions,
+    while others append to the same content chains.
+
+    :param loaders: Loaders, The loaders of the request
+    :param entries: list, The (item, content) tuples of new_page_version, see version_writes for the limit
+    :param independent: bool, Whether the entries not causing a failure are written without the failed ones
+    :return: list, The error result of every entry, None for the written ones
+    """
+    results = [None] * len(entries)
+    pending, attempts = list(range(len(entries))), 0
+    while pending:
+        if attempts == loaders.contents.max_retries:
+            for index in pending:
+                results[index] = {'error': True, 'message': 'Could not append the content, while others appended '
+                                                            f'to {entries[index][0]["content_chain"]}'}
+            break
+        attempts += 1
+        chains, pages = {}, {}
+        for index in pending:
+            item, content = entries[index]
+            if content is not None:
+                chains.setdefault(item['content_chain'], []).append(index)
+            if item.get('page'):
+                pages.setdefault(item['page'], []).append(index)
+        rows, texts, owners = [], [], []
+        for chain, indexes in chains.items():
+            for index, row in zip(indexes, loaders.contents.prepare(chain, [entries[i][1] for i in indexes])):
+                entries[index][0]['content_revision'] = row['revision']
+                rows.append(row)
+                texts.append(entries[index][1])
+                owners.append([index])
+        actions = [loaders.contents.append_action(row) for row in rows]
+        actions += [{'table': loaders.tables['page_version'], 'put': entries[index][0]} for index in pending]
+        owners += [[index] for index in pending]
+        actions += [append_versions(loaders.tables['page'], page, [entries[i][0]['id'] for i in indexes])
+                    for page, indexes in pages.items()]
+        owners += list(pages.values())
+        outcomes = loaders.storage.transact_write_items(actions)
+        if not any(outcome['error'] for outcome in outcomes):
+            loaders.contents.remember(rows, texts)
+            break
+        # Another process appended to a chain first, the revisions are prepared again
+        if any(outcome['code'] in CONDITION_FAILED for outcome in outcomes[:len(rows)]):
+            continue
+        failed = set()
+        for position, (outcome, indexes) in enumerate(zip(outcomes, owners)):
+            if outcome['code'] == 'TransactionCanceled':
+                continue
+            for index in indexes:
+                page = position >= len(rows) + len(pending) and outcome['code'] in CONDITION_FAILED
+                results[index] = {'error': True, 'message': f'Could not find page {entries[index][0]["page"]}'
+                                  if page else outcome['message'] or outcome['code']}
+                failed.add(index)
+        if not independent or not failed:
+            for index in pending:
+                if results[index] is None:
+                    results[index] = {'error': True, 'message': 'Not written, as other writes of the mutation failed'}
+            break
+        pending, attempts = [index for index in pending if index not in failed], 0
+    return results
+
+
+def created_page_versions(info, items: list, contents: list, inputs: list):
+    """
+    Indexes stored page versions and announces them to the socket server
+
+    :param info: GraphQLResolveInfo, The info of the resolver
+    :param items: list, The stored items
+    :param contents: list, The contents of the items
+    :param inputs: list, The inputs of the mutation, which created the items
+    :return: None
+    """
+    info.context['search']['page_version'].add_many((item['id'], {'name': item['name'], 'content': content})
+                                                     for item, content in zip(items, contents))
+    access = info.context.get('access')
+    if access is not None:
+        access.index.put_many('page_version', [item for item in items if item.get('permissions')])
+    for item, input in zip(items, inputs):
+        info.context['changes'].publish('page_version', item['id'], CREATED, fields=input.keys(),
+                                        version=item.get('version'), page=item.get('page'))
+
+
+def create_page_version(_, info, input: dict):
+    loaders = info.context['loaders']
+
+    def create():
+        access = info.context.get('access')
+        if access is not None and input.get('page') and not access.can('page', {'id': input['page']}, 'write'):
+            return {'error': True, 'message': f'Not allowed to write page {input["page"]}'}
+        item, content = new_page_version(input)
+        error = write_page_versions(loaders, [(item, content)])[0]
+        if error is not None:
+            return error
+        created_page_versions(info, [item], [content], [input])
+        return {'error': False, 'message': item['id']}
+
+    return call(info, create)
@@ -1,3 +1,13 @@
+from botocore.exceptions import ClientError
+from ..util.changes import DELETED
+from .mutation_create import CONDITION_FAILED
+from .mutation_update import is_missing
+from .query import call
+
+# How often the pageVersions of a page are read again, when they changed between reading and writing them
+DETACH_RETRIES = 5
+
+
 def delete_page(*_, id):
     raise NotImplementedError('Not Implemented Yet :D')
 
@@ -10,5 +20,87 @@ def delete_folder(*_, id):
     raise NotImplementedError('Not Implemented Yet :D')
 
 
-def delete_page_version(*_, id):
-    raise NotImplementedError('Not Implemented Yet :D')
+def versions_by_page(items: list):
+    """
+    Groups deleted page versions by their page
+
+    :param items: list, The deleted page versions
+    :return: dict, The id of every page mapped to the ids of its deleted versions
+    """
+    pages = {}
+    for item in items:
+        if item.get('page'):
+            pages.setdefault(item['page'], []).append(item['id'])
+    return pages
+
+
+def detach_versions(loaders, pages: dict):
+    """
+    Builds the writes removing page versions from the pageVersions of their pages, as read consistently
+
+    :param loaders: Loaders, The loaders of the request
+    :param pages: dict, The id of every page mapped to the ids of the versions to remove
+    :return: list, The updates, which fail if a list changed after it was read, see Storage.transact_write_items
+    """
+    table, ids = loaders.tables['page'], list(pages)
+    items = loaders.storage.batch_get_items(table, [{'id': id} for id in ids], consistent_read=True,
+                                            projection_expression='#id, #versions',
+                                            expression_attribute_names={'#id': 'id', '#versions': 'pageVersions'})
+    actions = []
+    for id, item in zip(ids, items):
+        versions = (item or {}).get('pageVersions') or []
+        positions = [i for i, version in enumerate(versions) if version in pages[id]]
+        if positions:
+            actions.append({'table': table, 'update': {'id': id},
+                            'update_expression': 'REMOVE ' + ', '.join(f'#versions[{i}]' for i in positions),
+                            'conditional_expression': ' AND '.join(f'#versions[{i}] = :v{i}' for i in positions),
+                            'expression_attribute_names': {'#versions': 'pageVersions'},
+                            'expression_attribute_values': {f':v{i}': versions[i] for i in positions}})
+    return actions
+
+
+def unlink_versions(loaders, pages: dict):
+    """
+    Removes deleted page versions from the pageVersions of their pages, reading a page again if its list changed
+
+    :param loaders: Loaders, The loaders of the request
+    :param pages: dict, The id of every page mapped to the ids of its deleted versions
+    :return: None
+    """
+    for _attempt in range(DETACH_RETRIES):
+        actions = detach_versions(loaders, pages)
+        outcomes = loaders.storage.batch_write(actions)
+        pages = {action['update']['id']: pages[action['update']['id']]
+                 for action, outcome in zip(actions, outcomes) if outcome['code'] in CONDITION_FAILED}
+        for action, outcome in zip(actions, outcomes):
+            if outcome['error'] and outcome['code'] not in CONDITION_FAILED:
+                print(f'Could not remove deleted versions from page {action["update"]["id"]}: {outcome["message"]}')
+        if not pages:
+            return
+    print(f'Could not remove deleted versions from pages {", ".join(pages)}, while their versions changed')
+
+
+def delete_page_version(_, info, id):
+    loaders = info.context['loaders']
+
+    def delete():
+        access = info.context.get('access')
+        if access is not None:
+            current = loaders.storage.get_item(loaders.tables['page_version'], {'id': id}, consistent_read=True)
+            if current is None:
+                return {'error': True, 'message': f'Could not find page version {id}'}
+            if not access.can('page_version', current, 'write'):
+                return {'error': True, 'message': f'Not allowed to write page version {id}'}
+        try:
+            item = loaders.storage.delete_item(loaders.tables['page_version'], {'id': id}, return_values='ALL_OLD',
+                                               conditional_expression='attribute_exists(id)')
+        except ClientError as error:
+            if not is_missing(error):
+                raise
+            return {'error': True, 'message': f'Could not find page version {id}'}
+        unlink_versions(loaders, versions_by_page([item or {}]))
+        info.context['search']['page_version'].delete(id)
+        info.context['changes'].publish('page_version', id, DELETED, page=(item or {}).get('page'))
+        return {'error': False, 'message': id}
+
+    return call(info, delete)
@@ -1,3 +1,47 @@
+from botocore.exceptions import ClientError
+from ..util.changes import UPDATED
+from .mutation_create import with_permission_ids
+from .query import call
+
+
+def build_update(input: dict, remove: tuple = ()):
+    """
+    Builds the update parameters setting all attributes given in a mutation input
+
+    :param input: dict, The input of the mutation
+    :param remove: tuple, Attributes to remove
+    :return: dict, The keyword arguments for Storage.update_item
+    """
+    assignments, names, values = [], {'#id': 'id'}, {}
+    for i, (attribute, value) in enumerate(input.items()):
+        if value is not None:
+            assignments.append(f'#set{i} = :set{i}')
+            names[f'#set{i}'] = attribute
+            values[f':set{i}'] = value
+    removals = []
+    for i, attribute in enumerate(remove):
+        removals.append(f'#rm{i}')
+        names[f'#rm{i}'] = attribute
+    clauses = [f'SET {", ".join(assignments)}' if assignments else '',
+               f'REMOVE {", ".join(removals)}' if removals else '']
+    return {
+        'update_expression': ' '.join(clause for clause in clauses if clause) or None,
+        'conditional_expression': 'attribute_exists(#id)',
+        'expression_attribute_names': names,
+        'expression_attribute_values': values or None
+    }
+
+
+def is_missing(error: ClientError):
+    """
+    Checks whether a conditional write failed, because the item does not exist
+
+    :param error: ClientError, The error raised by the write
+    :return: bool, Whether the condition of the write failed
+    """
+    return error.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+
 def update_page(*_, input, id):
     raise NotImplementedError('Not Implemented Yet :D')
 
@@ -10,5 +54,94 @@ def update_folder(*_, input, id):
     raise NotImplementedError('Not Implemented Yet :D')
 
 
-def update_page_version(*_, input, id):
-    raise NotImplementedError('Not Implemented Yet :D')
+def authorize_update(access, current: dict, input: dict):
+    """
+    Checks the right an update of a page version takes, control to change its permissions and write otherwise
+
+    :param access: Access, The permission view of the request, None if authorization is disabled
+    :param current: dict, The stored page version
+    :param input: dict, The input of the mutation
+    :return: dict, The error result or None, if the update is allowed
+    """
+    right = 'write' if input.get('permissions') is None else 'control'
+    if access is not None and not access.can('page_version', current, right):
+        return {'error': True, 'message': f'Not allowed to {right} page version {current["id"]}'}
+    return None
+
+
+def update_values(loaders, input: dict, current: dict = None):
+    """
+    Builds the values of an update of a page version, appending new content to its content chain
+
+    :param loaders: Loaders, The loaders of the request
+    :param input: dict, The input of the mutation
+    :param current: dict, The stored page version, required if the input changes the content
+    :return: tuple, The values to set, the attributes to remove and the new content
+    """
+    values, remove = dict(input), ()
+    if values.get('permissions') is not None:
+        values['permissions'] = with_permission_ids(values['permissions'])
+    content = values.pop('content', None)
+    if content is not None:
+        values['content_chain'] = current.get('content_chain') or current.get('page') or current['id']
+        values['content_revision'] = loaders.contents.put(values['content_chain'], content)
+        remove = ('content',)
+    return values, remove, content
+
+
+def updated_page_versions(info, items: list, contents: list, inputs: list):
+    """
+    Indexes updated page versions again and announces them to the socket server
+
+    :param info: GraphQLResolveInfo, The info of the resolver
+    :param items: list, The updated items
+    :param contents: list, The new contents of the items, None where the content did not change
+    :param inputs: list, The inputs of the mutation, which updated the items
+    :return: None
+    """
+    loaders = info.context['loaders']
+    unchanged = [i for i, (item, content) in enumerate(zip(items, contents))
+                 if content is None and 'content_chain' in item]
+    contents = list(contents)
+    for i, text in zip(unchanged, loaders.contents.get_many([(items[i]['content_chain'], items[i]['content_revision'])
+                                                             for i in unchanged])):
+        contents[i] = text
+    info.context['search']['page_version'].add_many(
+        (item['id'], {'name': item.get('name'), 'content': item.get('content') if content is None else content})
+        for item, content in zip(items, contents))
+    access = info.context.get('access')
+    if access is not None:
+        access.index.put_many('page_version', [item for item, input in zip(items, inputs)
+                                               if input.get('permissions') is not None])
+    for item, input in zip(items, inputs):
+        info.context['changes'].publish('page_version', item['id'], UPDATED,
+                                        fields=[field for field, value in input.items() if value is not None],
+                                        version=item.get('version'), page=item.get('page'))
+
+
+def update_page_version(_, info, input, id):
+    loaders = info.context['loaders']
+
+    def update():
+        table = loaders.tables['page_version']
+        access = info.context.get('access')
+        current = None
+        if input.get('content') is not None or access is not None:
+            current = loaders.storage.get_item(table, {'id': id}, consistent_read=True)
+            if current is None:
+                return {'error': True, 'message': f'Could not find page version {id}'}
+            error = authorize_update(access, current, input)
+            if error is not None:
+                return error
+        values, remove, content = update_values(loaders, input, current)
+        try:
+            item = loaders.storage.update_item(table, {'id': id}, return_values='ALL_NEW',
+                                               **build_update(values, remove))
+        except ClientError as error:
+            if not is_missing(error):
+                raise
+            return {'error': True, 'message': f'Could not find page version {id}'}
+        updated_page_versions(info, [item], [content], [input])
+        return {'error': False, 'message': id}
+
+    return call(info, update)
@@ -0,0 +1,62 @@
+"""
+Projection pushdown: the attributes read from DynamoDB are derived from the fields a query selects
+"""
+from graphql import FieldNode, FragmentSpreadNode, GraphQLResolveInfo, InlineFragmentNode
+
+# Attributes a field is resolved from, if they differ from the name of the field: type -> field -> attributes
+FIELD_ATTRIBUTES = {
+    'Page': {'versions': ('pageVersions',)},
+    'PageVersion': {'content': ('content', 'content_chain', 'content_revision')},
+}
+
+# Attributes every projected item holds, the loaders key the items by them
+KEY_ATTRIBUTES = ('id',)
+
+
+def selected_attributes(info: GraphQLResolveInfo, extra=()):
+    """
+    Returns the attributes the selection of a resolver needs, including the ids of referenced entities of
+    nested selections
+
+    :param info: GraphQLResolveInfo, The info of the resolver returning the items
+    :param extra: Further attributes, e.g. the ones the resolver checks its arguments against
+    :return: frozenset, The names of the attributes
+    """
+    type_name = info.return_type
+    while hasattr(type_name, 'of_type'):
+        type_name = type_name.of_type
+    mapping = FIELD_ATTRIBUTES.get(type_name.name, {})
+    attributes = set(KEY_ATTRIBUTES)
+    attributes.update(attribute for attribute in extra)
+    for field_node in info.field_nodes:
+        for name in _field_names(field_node.selection_set, info.fragments):
+            if not name.startswith('__'):
+                attributes.update(mapping.get(name, (name,)))
+    return frozenset(attributes)
+
+
+def _field_names(selection_set, fragments: dict, visited: set = None):
+    visited = set() if visited is None else visited
+    for selection in selection_set.selections if selection_set else ():
+        if isinstance(selection, FieldNode):
+            yield selection.name.value
+        elif isinstance(selection, InlineFragmentNode):
+            yield from _field_names(selection.selection_set, fragments, visited)
+        elif isinstance(selection, FragmentSpreadNode) and selection.name.value not in visited:
+            visited.add(selection.name.value)
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                yield from _field_names(fragment.selection_set, fragments, visited)
+
+
+def projection(attributes):
+    """
+    Builds the projection parameters of a read
+
+    :param attributes: The names of the attributes to read, None to read whole items
+    :return: dict, The keyword arguments for the reads of Storage
+    """
+    if attributes is None:
+        return {}
+    names = {f'#p{i}': attribute for i, attribute in enumerate(sorted(attributes))}
+    return {'projection_expression': ', '.join(names), 'expression_attribute_names': names}
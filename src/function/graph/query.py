@@ -1,50 +1,316 @@
-def resolve_page(*_, id, location=None, name=None):
-    raise NotImplementedError('Not Implemented Yet :D')
+from inspect import isawaitable
+from ..util.permissions import ITEM_ATTRIBUTES
+from .loader import content_ref
+from .projection import projection, selected_attributes
 
 
-def resolve_folder(*_, id, name=None, location=None):
-    raise NotImplementedError('Not Implemented Yet :D')
+def call(info, fn, *args, **kwargs):
+    """
+    Calls a blocking storage function, on the executor of the request if it is executed asynchronously
 
+    :param info: GraphQLResolveInfo, The info of the resolver
+    :param fn: callable, The blocking function
+    :return: The result of the function or an awaitable of it
+    """
+    executor = info.context['loaders'].executor
+    if executor is None:
+        return fn(*args, **kwargs)
+    return executor.run(fn, *args, **kwargs)
 
-def resolve_notebook(*_, id, name=None):
-    raise NotImplementedError('Not Implemented Yet :D')
 
+def then(value, fn):
+    """
+    Applies a function to a value, which may still have to be awaited
 
-def resolve_page_version(*_, id, name=None):
-    raise NotImplementedError('Not Implemented Yet :D')
+    :param value: The value or an awaitable of it
+    :param fn: callable, The function to apply
+    :return: The result of the function or an awaitable of it
+    """
+    if isawaitable(value):
+        async def chained():
+            return fn(await value)
+        return chained()
+    return fn(value)
 
 
-def resolve_graph(*_, id):
-    raise NotImplementedError('Not Implemented Yet :D')
+def authorized(info, entity: str, items: list):
+    """
+    Removes the items the principals of the request may not read, in one pass over the permission index
 
+    :param info: GraphQLResolveInfo, The info of the resolver
+    :param entity: str, The name of the entity
+    :param items: list, The items
+    :return: list, The readable items
+    """
+    access = info.context.get('access')
+    return items if access is None else access.filter(entity, items)
 
-def resolve_node(*_, id):
-    raise NotImplementedError('Not Implemented Yet :D')
 
+def build_scan_filter(storage, contains: dict = None, **equals):
+    """
+    Builds the filter parameters of a scan from optional arguments of a resolver
 
-def resolve_edge(*_, id):
-    raise NotImplementedError('Not Implemented Yet :D')
+    :param storage: Storage, The storage used to serialize the values
+    :param contains: dict, Attributes, which have to contain the given value
+    :param equals: Attributes, which have to be equal to the given value
+    :return: dict, The keyword arguments for Storage.iter_scan
+    """
+    conditions, names, values = [], {}, {}
+    for i, (attribute, value) in enumerate(equals.items()):
+        if value is not None:
+            conditions.append(f'#eq{i} = :eq{i}')
+            names[f'#eq{i}'] = attribute
+            values[f':eq{i}'] = storage.codec.serialize(value)
+    for i, (attribute, value) in enumerate((contains or {}).items()):
+        if value is not None:
+            conditions.append(f'contains(#ct{i}, :ct{i})')
+            names[f'#ct{i}'] = attribute
+            values[f':ct{i}'] = storage.codec.serialize(value)
+    if not conditions:
+        return {}
+    return {
+        'filter_expression': ' AND '.join(conditions),
+        'expression_attribute_names': names,
+        'expression_attribute_values': values
+    }
 
 
-def resolve_pages(*_, location=None, name=None):
-    raise NotImplementedError('Not Implemented Yet :D')
+def load_entity(info, entity: str, id, **expected):
+    """
+    Loads a single entity through the request loaders and checks the optional arguments of its resolver.
+    Only the attributes selected by the query and the checked ones are read.
 
+    :param info: GraphQLResolveInfo, The info of the resolver
+    :param entity: str, The name of the entity
+    :param id: The id of the entity
+    :param expected: Attributes, which have to be equal to the given value, if set
+    :return: dict, The entity
+    """
+    def check(item):
+        if item is None or any(value is not None and item.get(key) != value for key, value in expected.items()):
+            raise LookupError(f'Could not find {entity} {id}')
+        access = info.context.get('access')
+        return item if access is None else access.check(entity, item)
 
-def resolve_folders(*_, name=None, location=None):
-    raise NotImplementedError('Not Implemented Yet :D')
+    attributes = selected_attributes(info, [key for key, value in expected.items() if value is not None] +
+                                     list(ITEM_ATTRIBUTES.get(entity, ())))
+    return then(info.context['loaders'].get(entity, attributes).load(id), check)
 
 
-def resolve_notebooks(*_, name=None):
-    raise NotImplementedError('Not Implemented Yet :D')
+def scan_entities(info, entity: str, contains: dict = None, **equals):
+    """
+    Reads all entities matching the arguments of a list resolver and stores them in the request loaders
 
+    :param info: GraphQLResolveInfo, The info of the resolver
+    :param entity: str, The name of the entity
+    :param contains: dict, Attributes, which have to contain the given value
+    :param equals: Attributes, which have to be equal to the given value
+    :return: list, The entities
+    """
+    loaders = info.context['loaders']
+    attributes = selected_attributes(info, ITEM_ATTRIBUTES.get(entity, ()))
+    params = build_scan_filter(loaders.storage, contains, **equals)
+    read = projection(attributes)
+    params.update(read, expression_attribute_names=dict(params.get('expression_attribute_names', {}),
+                                                        **read['expression_attribute_names']))
+    items = call(info, lambda: list(loaders.storage.iter_scan(loaders.tables[entity], **params)))
+    return then(items, lambda found: authorized(info, entity, loaders.prime_many(entity, found, attributes)))
 
-def resolve_page_versions(*_, name=None, content=None):
-    raise NotImplementedError('Not Implemented Yet :D')
 
+def search_entities(info, entity: str, limit: int = None, offset: int = 0, name: str = None, **fields):
+    """
+    Finds entities through the full-text index of the entity, ranked by relevance
 
-def resolve_nodes(*_, name=None):
-    raise NotImplementedError('Not Implemented Yet :D')
+    :param info: GraphQLResolveInfo, The info of the resolver
+    :param entity: str, The name of the entity
+    :param limit: int, The maximum number of entities, None for all
+    :param offset: int, The number of best matches to skip
+    :param name: str, The exact name of the entities, matched by the index and checked on the loaded entities
+    :param fields: The full-text queries per indexed field, e.g. content='hello world'
+    :return: list, The entities in order of their relevance
+    """
+    index = info.context['search'][entity]
+    if name is None:
+        _total, ranked = index.search(limit=limit, offset=offset, **fields)
+    else:
+        # The name has to be checked before paginating, so all matches are loaded
+        _total, ranked = index.search(name=name, **fields)
+    ids = [doc_id for doc_id, _score in ranked]
 
+    def loaded(items):
+        items = [item for item in items if item is not None and (name is None or item.get('name') == name)]
+        items = authorized(info, entity, items)
+        return items if name is None else items[offset:None if limit is None else offset + limit]
 
-def resolve_edges(*_, name=None, keyword=None):
-    raise NotImplementedError('Not Implemented Yet :D')
+    if entity == 'edge':
+        return then(call(info, info.context['loaders'].graphs.get_edges, ids), loaded)
+    attributes = selected_attributes(info, (() if name is None else ('name',)) + ITEM_ATTRIBUTES.get(entity, ()))
+    return then(info.context['loaders'].get(entity, attributes).load_many(ids), loaded)
+
+
+def paginate(items, limit: int = None, offset: int = 0):
+    """
+    Applies the pagination arguments of a list resolver to a list, which may still have to be awaited
+
+    :param items: list, The items
+    :param limit: int, The maximum number of items, None for all
+    :param offset: int, The number of items to skip
+    :return: list, The page of the items
+    """
+    return then(items, lambda found: found[offset:None if limit is None else offset + limit])
+
+
+def load_references(info, entity: str, parent: dict, field: str, parent_entity: str):
+    """
+    Loads the entities referenced by a list of ids of the parent, batched with the references of its siblings
+
+    :param info: GraphQLResolveInfo, The info of the resolver
+    :param entity: str, The name of the referenced entity
+    :param parent: dict, The parent item
+    :param field: str, The attribute of the parent holding the ids
+    :param parent_entity: str, The name of the parent entity
+    :return: list, The referenced entities
+    """
+    keys = parent.get(field) or []
+    loader = info.context['loaders'].get(entity, selected_attributes(info, ITEM_ATTRIBUTES.get(entity, ())))
+    return then(loader.load_many(list(keys), f'{parent_entity}.{field}'),
+                lambda items: authorized(info, entity, items))
+
+
+def resolve_page(_, info, id, location=None, name=None):
+    return load_entity(info, 'page', id, location=location, name=name)
+
+
+def resolve_folder(_, info, id, name=None, location=None):
+    return load_entity(info, 'folder', id, name=name, location=location)
+
+
+def resolve_notebook(_, info, id, name=None):
+    return load_entity(info, 'notebook', id, name=name)
+
+
+def resolve_page_version(_, info, id, name=None):
+    return load_entity(info, 'page_version', id, name=name)
+
+
+def resolve_graph(_, info, id):
+    return load_entity(info, 'graph', id)
+
+
+def resolve_node(_, info, id):
+    def check(node):
+        if node is None:
+            raise LookupError(f'Could not find node {id}')
+        return node
+
+    return then(call(info, info.context['loaders'].graphs.get_node, id), check)
+
+
+def resolve_edge(_, info, id):
+    def check(edge):
+        if edge is None:
+            raise LookupError(f'Could not find edge {id}')
+        return edge
+
+    return then(call(info, info.context['loaders'].graphs.get_edge, id), check)
+
+
+def resolve_pages(_, info, location=None, name=None):
+    return scan_entities(info, 'page', location=location, name=name)
+
+
+def resolve_folders(_, info, name=None, location=None):
+    return scan_entities(info, 'folder', name=name, location=location)
+
+
+def resolve_notebooks(_, info, name=None):
+    return scan_entities(info, 'notebook', name=name)
+
+
+def resolve_page_versions(_, info, name=None, content=None, limit=None, offset=0):
+    if name is None and content is None:
+        return paginate(scan_entities(info, 'page_version'), limit, offset)
+    return search_entities(info, 'page_version', limit, offset, name=name, content=content)
+
+
+def resolve_nodes(_, info, name=None):
+    loaders = info.context['loaders']
+
+    def defer(nodes):
+        loaders['graph'].defer([node['graph'] for node in nodes], 'node.graph')
+        loaders['page_version'].defer([node['page'] for node in nodes if node.get('page')], 'node.page')
+        return nodes
+
+    return then(call(info, lambda: list(loaders.graphs.scan('node', name=name))), defer)
+
+
+def resolve_edges(_, info, name=None, keyword=None, limit=None, offset=0):
+    if name is not None or keyword is not None:
+        return search_entities(info, 'edge', limit, offset, name=name, keywords=keyword)
+
+    def unique(found):
+        edges = {}
+        for edge in found:
+            edges.setdefault(edge['id'], edge)
+        return list(edges.values())
+
+    graphs = info.context['loaders'].graphs
+    return paginate(then(call(info, lambda: list(graphs.scan('edge'))), unique), limit, offset)
+
+
+# Field resolvers of nested types, the loaders batch the references of all siblings
+def resolve_notebook_pages(notebook, info):
+    return load_references(info, 'page', notebook, 'pages', 'notebook')
+
+
+def resolve_notebook_folders(notebook, info):
+    return load_references(info, 'folder', notebook, 'folders', 'notebook')
+
+
+def resolve_notebook_graph(notebook, info):
+    if not notebook.get('graph'):
+        return None
+    return info.context['loaders']['graph'].load(notebook['graph'], 'notebook.graph')
+
+
+def resolve_folder_pages(folder, info):
+    return load_references(info, 'page', folder, 'pages', 'folder')
+
+
+def resolve_page_versions_of_page(page, info):
+    return load_references(info, 'page_version', page, 'pageVersions', 'page')
+
+
+def resolve_page_version_content(page_version, info):
+    if 'content_chain' not in page_version:
+        return page_version.get('content')
+    return info.context['loaders']['content'].load(content_ref(page_version), 'page_version.content')
+
+
+def resolve_graph_nodes(graph, info):
+    return graph['nodes']
+
+
+def resolve_node_page(node, info):
+    def check(page_version):
+        access = info.context.get('access')
+        return page_version if access is None else access.check('page_version', page_version)
+
+    loader = info.context['loaders'].get('page_version', selected_attributes(info, ITEM_ATTRIBUTES['page_version']))
+    return then(loader.load(node['page'], 'node.page'), check)
+
+
+def resolve_node_edges(node, info):
+    if 'edges' in node:
+        return node['edges']
+    return then(info.context['loaders']['graph'].load(node['graph'], 'node.graph'),
+                lambda graph: next((other['edges'] for other in graph['nodes'] if other['id'] == node['id']), [])
+                if graph else [])
+
+
+def resolve_neighborhood(_, info, id, depth=1, keyword=None):
+    return call(info, info.context['graph_index'].neighborhood, id, depth, keyword)
+
+
+def resolve_path(_, info, keyword=None, **ends):
+    return call(info, info.context['graph_index'].shortest_path, ends['from'], ends['to'], keyword)
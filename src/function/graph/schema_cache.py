@@ -0,0 +1,97 @@
+"""
+On disk cache of the built schema, keyed by the hash of the schema definition, so a cold start skips parsing and
+validating it. Resolvers are bound on every start, only the schema without them is cached.
+"""
+import hashlib
+import os
+import pickle
+import graphql
+from ariadne import load_schema_from_path
+from ariadne.enums import set_default_enum_values_on_schema, validate_schema_enum_values
+from ariadne.executable_schema import normalize_bindables, repair_default_enum_values
+from ariadne.types import SchemaBindable
+from graphql import GraphQLSchema, assert_valid_schema, build_ast_schema, parse
+
+
+def schema_key(type_defs: str):
+    """
+    Computes the key of a schema definition in the cache
+
+    :param type_defs: str, The schema definition
+    :return: str, The hex encoded SHA-256 hash of the definition and the graphql-core version
+    """
+    return hashlib.sha256(f'{graphql.version}\n{type_defs}'.encode('utf-8')).hexdigest()
+
+
+def build_schema(path: str, cache_dir: str = None):
+    """
+    Builds and validates the schema of a schema file or directory, without resolvers
+
+    :param path: str, The schema file or a directory of them
+    :param cache_dir: str, The directory of the cached schemas, None to disable the cache
+    :return: GraphQLSchema, The schema
+    """
+    if os.path.isdir(path):
+        type_defs = load_schema_from_path(path)
+    else:
+        with open(path, 'r', encoding='utf-8') as schema_file:
+            type_defs = schema_file.read()
+    cached = os.path.join(cache_dir, f'{schema_key(type_defs)}.pickle') if cache_dir else None
+    if cached:
+        try:
+            with open(cached, 'rb') as cache_file:
+                schema = pickle.load(cache_file)
+            if isinstance(schema, GraphQLSchema):
+                return schema
+        except (OSError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+            pass
+    schema = build_ast_schema(parse(type_defs))
+    # The validation result is stored on the schema and cached with it
+    assert_valid_schema(schema)
+    if cached:
+        store(schema, cached)
+    return schema
+
+
+def store(schema: GraphQLSchema, cached: str):
+    """
+    Writes a schema to the cache and drops the schemas of earlier definitions.
+    Failures are ignored, the schema is built again on the next start.
+
+    :param schema: GraphQLSchema, The schema
+    :param cached: str, The file of the schema in the cache
+    :return: None
+    """
+    directory = os.path.dirname(cached)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        temporary = f'{cached}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as cache_file:
+            pickle.dump(schema, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, cached)
+        for name in os.listdir(directory):
+            if name.endswith('.pickle') and name != os.path.basename(cached):
+                os.remove(os.path.join(directory, name))
+    except (OSError, pickle.PicklingError) as error:
+        print(f'Could not cache the schema: {error}')
+
+
+def make_cached_schema(path: str, cache_dir: str, *bindables):
+    """
+    Builds the executable schema like ariadne.make_executable_schema, but from the cache
+
+    :param path: str, The schema file or a directory of them
+    :param cache_dir: str, The directory of the cached schemas, None to disable the cache
+    :param bindables: The ariadne bindables, e.g. QueryType and ObjectType instances
+    :return: GraphQLSchema, The schema with bound resolvers
+    """
+    schema = build_schema(path, cache_dir)
+    normalized_bindables = normalize_bindables(*bindables)
+    for bindable in normalized_bindables:
+        if isinstance(bindable, SchemaBindable):
+            bindable.bind_to_schema(schema)
+    set_default_enum_values_on_schema(schema)
+    assert_valid_schema(schema)
+    validate_schema_enum_values(schema)
+    repair_default_enum_values(schema, normalized_bindables)
+    return schema
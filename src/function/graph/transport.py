@@ -0,0 +1,216 @@
+"""
+HTTP transport of GraphQL responses: GET queries, negotiated compression and conditional requests by ETag
+"""
+import gzip
+import hashlib
+import json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Error code of operations, which may not be sent with the method of the request, e.g. mutations with GET
+METHOD_NOT_ALLOWED = 'METHOD_NOT_ALLOWED'
+
+# Parameters of GET requests, which hold JSON instead of plain strings
+JSON_PARAMETERS = ('variables', 'extensions')
+
+
+def request_data(params):
+    """
+    Reads the GraphQL request of a GET request from its query parameters
+
+    :param params: Mapping, The query parameters
+    :return: dict, The request like the body of a POST request
+    :raises ValueError: If a JSON parameter cannot be decoded
+    """
+    data = {key: params[key] for key in ('query', 'operationName') if params.get(key)}
+    for key in JSON_PARAMETERS:
+        if params.get(key):
+            try:
+                data[key] = json.loads(params[key])
+            except ValueError:
+                raise ValueError(f'The parameter {key} must be JSON.')
+    return data
+
+
+def is_get_query(params):
+    """
+    Checks whether a GET request holds a GraphQL request, instead of asking for the explorer
+
+    :param params: Mapping, The query parameters
+    :return: bool
+    """
+    return bool(params.get('query') or params.get('extensions'))
+
+
+def accepted_encodings(header: str):
+    """
+    Parses an Accept-Encoding header
+
+    :param header: str, The header, may be empty
+    :return: dict, The quality values of the accepted content codings
+    """
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+def entity_tag(body: bytes, encoding: str = None):
+    """
+    Computes the strong ETag of a response, the representations of the different encodings get different tags
+
+    :param body: bytes, The uncompressed body
+    :param encoding: str, The content coding of the representation, None for the uncompressed body
+    :return: str, The quoted tag
+    """
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+
+def none_match(header: str, tag: str):
+    """
+    Checks an If-None-Match header against the tag of the current response.
+    Tags of other encodings of the same body match as well, their content is the same.
+
+    :param header: str, The header, may be empty
+    :param tag: str, The tag of the uncompressed body
+    :return: bool, Whether the client already holds the response
+    """
+    if not header:
+        return False
+    digest = tag.strip('"')
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate.strip('"').split('-', 1)[0] == digest:
+            return True
+    return False
+
+
+class ResponseEncoder:
+    """
+    Serializes GraphQL results to HTTP responses. Results of successful queries get an ETag and are answered with
+    304 Not Modified, if the client holds them already. Bodies above a size threshold are compressed with
+    brotli, if it is installed and accepted, or gzip.
+    """
+
+    def __init__(self, min_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4,
+                 cache_control: str = 'no-cache', vary: tuple = ()):
+        """
+
+        :param min_size: int, The minimum size of compressed bodies in bytes, 0 disables compression
+        :param gzip_level: int, The compression level of gzip, 1 to 9
+        :param brotli_quality: int, The quality of brotli, 0 to 11
+        :param cache_control: str, The Cache-Control header of cacheable responses
+        :param vary: tuple, Further request headers the bodies depend on, e.g. the principals of the request
+        """
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_control = cache_control
+        self.vary = ', '.join(('Accept-Encoding',) + tuple(vary))
+
+    def negotiate(self, accept_encoding: str):
+        """
+        Selects the content coding of a response
+
+        :param accept_encoding: str, The Accept-Encoding header of the request
+        :return: str, 'br', 'gzip' or None for an uncompressed response
+        """
+        accepted = accepted_encodings(accept_encoding)
+        codings = (['br'] if brotli is not None else []) + ['gzip']
+        quality = lambda coding: accepted.get(coding, accepted.get('*', 0.0))
+        best = max(codings, key=quality)
+        return best if quality(best) > 0 else None
+
+    def compress(self, body: bytes, encoding: str):
+        """
+        Compresses a body
+
+        :param body: bytes, The body
+        :param encoding: str, 'br' or 'gzip'
+        :return: bytes, The compressed body
+        """
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def encode(self, result: dict, success: bool, cacheable: bool, accept_encoding: str = None,
+               if_none_match: str = None):
+        """
+        Builds the response of a GraphQL result
+
+        :param result: dict, The result
+        :param success: bool, Whether the request succeeded
+        :param cacheable: bool, Whether the result may be cached, only true for query operations
+        :param accept_encoding: str, The Accept-Encoding header of the request
+        :param if_none_match: str, The If-None-Match header of the request
+        :return: tuple, The status code, the body as bytes and the headers as dict
+        """
+        body = json.dumps(result, separators=(',', ':')).encode('utf-8')
+        status = 200 if success else self.error_status(result)
+        headers = {'Content-Type': 'application/json', 'Vary': self.vary}
+        if status == 405:
+            headers['Allow'] = 'POST'
+        encoding = self.negotiate(accept_encoding) if self.min_size and len(body) >= self.min_size else None
+        if cacheable and success and not result.get('errors'):
+            tag = entity_tag(body)
+            headers['ETag'] = entity_tag(body, encoding)
+            headers['Cache-Control'] = self.cache_control
+            if none_match(if_none_match, tag):
+                del headers['Content-Type']
+                return 304, b'', headers
+        else:
+            headers['Cache-Control'] = 'no-store'
+        if encoding:
+            body = self.compress(body, encoding)
+            headers['Content-Encoding'] = encoding
+        return status, body, headers
+
+    @staticmethod
+    def error_status(result: dict):
+        """
+        Returns the status code of a failed request
+
+        :param result: dict, The result holding the errors
+        :return: int, 405 for operations not allowed with the method of the request, else 400
+        """
+        codes = {(error.get('extensions') or {}).get('code') for error in result.get('errors') or ()}
+        return 405 if METHOD_NOT_ALLOWED in codes else 400
+
+
+class LazyExplorer:
+    """
+    GraphiQL explorer of ariadne, which is imported and rendered on the first request of the page
+    """
+
+    def __init__(self, **options):
+        """
+
+        :param options: The options of ariadne.explorer.ExplorerGraphiQL
+        """
+        self.options = options
+        self._html = None
+
+    def html(self, _request):
+        if self._html is None:
+            from ariadne.explorer import ExplorerGraphiQL
+            self._html = ExplorerGraphiQL(**self.options).html(None)
+        return self._html
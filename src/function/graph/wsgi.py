@@ -0,0 +1,93 @@
+"""
+Flask application executing the GraphQL requests synchronously, served by the development server in the 'flask' mode
+"""
+import itertools
+from flask import Flask, jsonify, request, Response
+from ..util.metrics import METRICS, field_middleware
+from . import CHANGES, CONF, CONTENTS, COSTS, DOCUMENTS, ENCODER, STORAGE, TABLES, GRAPHS, GRAPH_INDEX, SEARCH, \
+    TRANSFER, authorize_import, request_access, schema
+from .execution import graphql_cached_sync, operation_type
+from .loader import Loaders
+from .transport import LazyExplorer, is_get_query, request_data
+
+app = Flask('HYPER-WIKI-GRAPHQL')
+app.debug = CONF.graph_debug
+
+# Explorer definition
+explorer = LazyExplorer()
+
+
+@app.route("/", methods=["GET"])
+def graphql_explorer():
+    if CONF.graph_http_get_queries and is_get_query(request.args):
+        # Queries sent with GET can be cached by browsers and CDNs, mutations are refused
+        try:
+            data = request_data(request.args)
+        except ValueError as error:
+            return str(error), 400
+        return execute_request(data, operations=('query',))
+    return explorer.html(request), 200
+
+
+@app.route("/", methods=["POST"])
+def graphql_server():
+    return execute_request(request.get_json())
+
+
+def execute_request(data, operations: tuple = None):
+    success, result = graphql_cached_sync(
+        schema,
+        DOCUMENTS,
+        data,
+        context_value={"request": request, "loaders": Loaders(STORAGE, TABLES, GRAPHS, CONTENTS),
+                       "graph_index": GRAPH_INDEX, "search": SEARCH, "changes": CHANGES,
+                       "access": request_access(request.headers)},
+        debug=app.debug,
+        middleware=[field_middleware],
+        costs=COSTS,
+        operations=operations
+    )
+
+    status_code, body, headers = ENCODER.encode(result, success, operation_type(DOCUMENTS, data) == 'query',
+                                                request.headers.get('Accept-Encoding'),
+                                                request.headers.get('If-None-Match'))
+    return Response(body, status=status_code, headers=headers)
+
+
+@app.route("/notebooks/<notebook_id>/export", methods=["GET"])
+def export_notebook(notebook_id):
+    if not CONF.transfer_http:
+        return 'Not Found', 404
+    access = request_access(request.headers)
+    if access is not None and not access.can('notebook', {'id': notebook_id}):
+        return f'Not allowed to read notebook {notebook_id}', 403
+    chunks = TRANSFER.export_stream(notebook_id)
+    try:
+        first = next(chunks)
+    except LookupError as error:
+        return str(error), 404
+    return Response(itertools.chain([first], chunks), mimetype='application/gzip',
+                    headers={'Content-Disposition': f'attachment; filename="{notebook_id}.ndjson.gz"'})
+
+
+@app.route("/notebooks/import", methods=["POST"])
+def import_notebook():
+    # A failed import answers with the committed offset, sending the stream again with ?offset=<offset> resumes it
+    if not CONF.transfer_http:
+        return 'Not Found', 404
+    committed = {'offset': request.args.get('offset', 0, type=int)}
+    access = request_access(request.headers)
+    try:
+        result = TRANSFER.import_stream(request.stream, committed['offset'],
+                                        lambda offset: committed.update(offset=offset),
+                                        None if access is None else authorize_import(access))
+    except PermissionError as error:
+        return jsonify(error=True, message=str(error), offset=committed['offset']), 403
+    except ValueError as error:
+        return jsonify(error=True, message=str(error), offset=committed['offset']), 400
+    return jsonify(dict(result, error=False))
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(METRICS.render(), mimetype='text/plain')
@@ -1,6 +1,118 @@
+import re
+import secrets
+import engineio
 import socketio
+from ..util.async_storage import AsyncStorage
+from ..util.config import get_config
+from ..util.content import ContentStore
+from ..util.permissions import ENTITIES, PermissionIndex, parse_principals
+from .bus import client_manager
+from .feed import ChangeRelay
+from .live import LiveEditor, StaleOperations
+from .router import worker_for
 
-sio = socketio.AsyncServer(async_mode='aiohttp')
+CONF = get_config()
+STORAGE = AsyncStorage(CONF.db_endpoint, CONF.db_access_key, CONF.db_secret_key,
+                       max_concurrency=CONF.socket_storage_concurrency,
+                       max_workers=CONF.socket_storage_workers)
+CONTENTS = ContentStore(STORAGE.storage, CONF.db_tables_content, CONF.content_snapshot_interval,
+                        CONF.content_cache_size)
+PERMISSIONS = PermissionIndex(STORAGE.storage, {entity: getattr(CONF, f'db_tables_{entity}') for entity in ENTITIES},
+                              CONF.auth_log or None, CONF.auth_log_max_size, CONF.auth_cache_size)
+# The header of the principals in the WSGI environ of a connection
+PRINCIPAL_KEY = 'HTTP_' + CONF.auth_principal_header.upper().replace('-', '_')
+
+# Every notebook has its own namespace, e.g. /notebook/<id>, and every page in it a room
+NOTEBOOK_NAMESPACE = re.compile(r'^/notebook/(?P<notebook>[^/]+)$')
+
+
+class WorkerEngineIOServer(engineio.AsyncServer):
+    """
+    Engine.IO server prefixing its session ids with the index of its worker, which the StickyRouter routes by
+    """
+    worker = None
+
+    def generate_id(self):
+        sid = secrets.token_urlsafe(15)
+        return sid if self.worker is None else f'{self.worker}.{sid}'
+
+    _generate_id = generate_id
+
+
+class NotebookServer(socketio.AsyncServer):
+    """
+    Socket.IO server accepting the dynamic notebook namespaces, their events are handled by the live editing handlers
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(namespaces='*', **kwargs)
+        self.notebook_handlers = {}
+        self.worker = None
+        self.workers = 1
+
+    def set_worker(self, worker: int, workers: int):
+        """
+        Makes the server one of multiple workers behind the StickyRouter
+
+        :param worker: int, The index of this worker
+        :param workers: int, The number of workers
+        :return: None
+        """
+        self.worker = self.eio.worker = worker
+        self.workers = workers
+
+    def _engineio_server_class(self):
+        return WorkerEngineIOServer
+
+    def on_notebook(self, event: str):
+        """
+        Decorator registering the handler of an event in all notebook namespaces.
+        The handler receives the namespace before the regular arguments of the event.
+
+        :param event: str, The name of the event
+        :return: callable, The decorator
+        """
+        def register(handler):
+            self.notebook_handlers[event] = handler
+            return handler
+        return register
+
+    async def _trigger_event(self, event, namespace, *args):
+        if namespace not in self.handlers and namespace not in self.namespace_handlers:
+            if not NOTEBOOK_NAMESPACE.match(namespace or ''):
+                # Refuse connections to unknown namespaces, namespaces='*' would accept them
+                return False if event == 'connect' else self.not_handled
+            handler = self.notebook_handlers.get(event)
+            return self.not_handled if handler is None else await handler(namespace, *args)
+        return await super()._trigger_event(event, namespace, *args)
+
+
+sio = NotebookServer(async_mode='aiohttp',
+                     client_manager=client_manager(CONF.socket_bus_backend, CONF.socket_bus_path, CONF.socket_bus_url))
+EDITOR = LiveEditor(sio, STORAGE, CONTENTS,
+                    tick=CONF.socket_live_tick,
+                    flush_interval=CONF.socket_live_flush_interval,
+                    history_size=CONF.socket_live_history_size)
+
+
+async def client_access(namespace: str, sid: str):
+    """
+    Returns the permission view of a client, for the principals of its connection
+
+    :param namespace: str, The namespace of the client
+    :param sid: str, The sid of the client
+    :return: Access, The view or None, if authorization is disabled
+    """
+    if not CONF.auth_enabled:
+        return None
+    if not PERMISSIONS.loaded:
+        # The first client loads the permission index from the tables, later ones apply the logged changes only
+        await STORAGE.run(PERMISSIONS.sync)
+    session = await sio.get_session(sid, namespace=namespace)
+    return PERMISSIONS.access(session.get('principals') or parse_principals(None))
+
+
+RELAY = ChangeRelay(sio, CONF.socket_feed_path, tick=CONF.socket_feed_tick, access=client_access)
 
 
 # Handeling Base Events here
@@ -14,4 +126,66 @@ def disconnect(sid):
     print('disconnect ', sid)
 
 
-# Use Namespaces for live page changes: https://www.alxolr.com/articles/working-with-socket-io-dynamic-namespaces
+# Live page changes in the dynamic notebook namespaces
+@sio.on_notebook('connect')
+async def notebook_connect(namespace, sid, environ, auth=None):
+    await sio.save_session(sid, {'principals': parse_principals(environ.get(PRINCIPAL_KEY))}, namespace=namespace)
+    access = await client_access(namespace, sid)
+    return access is None or access.can('notebook', {'id': NOTEBOOK_NAMESPACE.match(namespace)['notebook']})
+
+
+@sio.on_notebook('disconnect')
+async def notebook_disconnect(namespace, sid):
+    await EDITOR.leave_all(namespace, sid)
+
+
+@sio.on_notebook('join')
+async def notebook_join(namespace, sid, data):
+    """
+    Joins the room of a page, answers with the current text and sequence number of the page
+
+    :param data: dict, {'page': str}
+    """
+    page = (data or {}).get('page')
+    notebook_id = NOTEBOOK_NAMESPACE.match(namespace)['notebook']
+    if sio.worker is not None and worker_for(notebook_id, sio.workers) != sio.worker:
+        # The buffers of the pages live in one worker, the router sends connections with ?notebook=<id> there
+        return {'error': True, 'message': f'Connect with the query parameter notebook={notebook_id} to edit its pages'}
+    notebook = await STORAGE.get_item(CONF.db_tables_notebook, {'id': notebook_id})
+    if not page or notebook is None or page not in (notebook.get('pages') or ()):
+        return {'error': True, 'message': f'Could not find page {page} in this notebook'}
+    access = await client_access(namespace, sid)
+    if access is not None and not access.can('page', {'id': page}):
+        return {'error': True, 'message': f'Not allowed to read page {page}'}
+    return dict(await EDITOR.join(namespace, sid, page), error=False)
+
+
+@sio.on_notebook('leave')
+async def notebook_leave(namespace, sid, data):
+    """
+    Leaves the room of a page
+
+    :param data: dict, {'page': str}
+    """
+    await EDITOR.leave(namespace, sid, (data or {}).get('page'))
+    return {'error': False}
+
+
+@sio.on_notebook('ops')
+async def notebook_ops(namespace, sid, data):
+    """
+    Applies operations to a page, they are broadcast to the room of the page with the next tick
+
+    :param data: dict, {'page': str, 'seq': int, 'ops': list}, seq is the sequence number the operations are based on
+    """
+    data = data or {}
+    access = await client_access(namespace, sid)
+    if access is not None and not access.can('page', {'id': data.get('page')}, 'write'):
+        return {'error': True, 'message': f'Not allowed to write page {data.get("page")}'}
+    try:
+        seq = EDITOR.submit(namespace, sid, data.get('page'), data.get('seq', 0), data.get('ops') or [])
+    except StaleOperations as error:
+        return {'error': True, 'stale': True, 'message': str(error)}
+    except ValueError as error:
+        return {'error': True, 'message': str(error)}
+    return {'error': False, 'seq': seq}
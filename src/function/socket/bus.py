@@ -0,0 +1,84 @@
+"""
+Message bus of the socket workers, which share room broadcasts through a client manager
+"""
+import asyncio
+import pickle
+import socketio
+from socketio.asyncio_pubsub_manager import AsyncPubSubManager
+from ..util.ipc import PUBLISHER, SUBSCRIBER, frame, read_frame
+
+
+class AsyncIPCManager(AsyncPubSubManager):
+    """
+    Client manager sharing the broadcasts of the workers of one host through an IPCHub
+    """
+    name = 'asyncipc'
+
+    def __init__(self, path: str, write_only: bool = False, logger=None, retry_interval: float = 1.0):
+        """
+
+        :param path: str, The path of the unix socket of the hub
+        :param write_only: bool, Whether the manager only publishes, e.g. outside of the socket server
+        :param logger: The logger of the manager
+        :param retry_interval: float, The seconds between two attempts to reach the hub
+        """
+        super().__init__(channel=path, write_only=write_only, logger=logger)
+        self.path = path
+        self.retry_interval = retry_interval
+        self._writer = None
+        self._lock = None
+
+    async def _publish(self, data):
+        payload = frame(pickle.dumps(data))
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            for _attempt in range(2):
+                try:
+                    if self._writer is None or self._writer.is_closing():
+                        _reader, self._writer = await asyncio.open_unix_connection(self.path)
+                        self._writer.write(PUBLISHER)
+                    self._writer.write(payload)
+                    await self._writer.drain()
+                    return
+                except OSError:
+                    self._writer = None
+            self._get_logger().error('Could not publish to the socket bus at %s', self.path)
+
+    async def _listen(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(self.retry_interval)
+                continue
+            writer.write(SUBSCRIBER)
+            try:
+                while True:
+                    yield await read_frame(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                await asyncio.sleep(self.retry_interval)
+            finally:
+                writer.close()
+
+
+def client_manager(backend: str, path: str = None, url: str = None, write_only: bool = False):
+    """
+    Creates the client manager of a bus backend
+
+    :param backend: str, 'memory' for a single worker, 'ipc' for the workers of one host,
+                    'redis' or 'amqp' for workers on multiple hosts
+    :param path: str, The unix socket of the 'ipc' backend
+    :param url: str, The url of the broker of the 'redis' and 'amqp' backends
+    :param write_only: bool, Whether the manager only publishes
+    :return: socketio.AsyncManager, The manager or None for the default in-memory manager
+    """
+    if backend == 'memory':
+        return None
+    if backend == 'ipc':
+        return AsyncIPCManager(path, write_only=write_only)
+    if backend == 'redis':
+        return socketio.AsyncRedisManager(url, write_only=write_only)
+    if backend == 'amqp':
+        return socketio.AsyncAioPikaManager(url, write_only=write_only)
+    raise ValueError(f'Unknown socket bus backend {backend}')
@@ -0,0 +1,162 @@
+"""
+Relay of the change feed of the GraphQL server to the notebook namespaces and page rooms
+"""
+import asyncio
+import json
+from ..util.changes import CREATED, DELETED
+from ..util.ipc import SUBSCRIBER, read_frame
+
+
+def merge_change(current: dict, change: dict):
+    """
+    Merges two changes of the same item into one
+
+    :param current: dict, The earlier change
+    :param change: dict, The later change
+    :return: dict, The merged change or None if an item was created and deleted again
+    """
+    if change['op'] == DELETED and current['op'] == CREATED:
+        return None
+    merged = dict(current, **change)
+    merged['fields'] = sorted(set(current.get('fields', ())) | set(change.get('fields', ())))
+    if current['op'] == CREATED and change['op'] != DELETED:
+        merged['op'] = CREATED
+    return merged
+
+
+class ChangeRelay:
+    """
+    Subscribes a socket worker to the change feed. Changes are collected for a tick, changes of the same item
+    are merged and every room receives one 'changes' event per tick. Every worker emits to its own clients only,
+    as every worker receives the whole feed. With an access lookup, a client receives only the changes of the
+    items it may read, clients reading the same changes share one event.
+    """
+
+    def __init__(self, server, path: str, namespace_prefix: str = '/notebook/', tick: float = 0.1,
+                 retry_interval: float = 1.0, access=None):
+        """
+
+        :param server: socketio.AsyncServer, The server of the rooms
+        :param path: str, The unix socket of the feed hub
+        :param namespace_prefix: str, The prefix of the namespaces of the notebooks
+        :param tick: float, The seconds changes are collected before they are emitted
+        :param retry_interval: float, The seconds between two attempts to reach the feed hub
+        :param access: callable, Awaitable returning the Access of a client by its namespace and sid,
+            None to send every change to the whole room
+        """
+        self.server = server
+        self.path = path
+        self.namespace_prefix = namespace_prefix
+        self.tick = tick
+        self.retry_interval = retry_interval
+        self.access = access
+        self.pending = {}
+        self._tasks = None
+
+    def start(self):
+        """
+        Starts consuming the feed, once
+
+        :return: None
+        """
+        if self._tasks is None:
+            self._tasks = (self.server.start_background_task(self._listen),
+                           self.server.start_background_task(self._emit_every_tick))
+
+    def add(self, change: dict):
+        """
+        Queues a change for the next tick
+
+        :param change: dict, The change event
+        :return: None
+        """
+        key = (change.get('entity'), change.get('id'))
+        current = self.pending.get(key)
+        merged = change if current is None else merge_change(current, change)
+        if merged is None:
+            del self.pending[key]
+        else:
+            self.pending[key] = merged
+
+    def targets(self, change: dict):
+        """
+        Returns the rooms of the local clients, which receive a change
+
+        :param change: dict, The change event
+        :return: set, The (namespace, room) tuples, room None for the whole namespace
+        """
+        rooms = self.server.manager.rooms
+        notebook = change.get('notebook') or (change.get('id') if change.get('entity') == 'notebook' else None)
+        if notebook:
+            namespace = f'{self.namespace_prefix}{notebook}'
+            return {(namespace, None)} if namespace in rooms else set()
+        page = change.get('page') or (change.get('id') if change.get('entity') == 'page' else None)
+        if page is None:
+            return set()
+        return {(namespace, page) for namespace, namespace_rooms in rooms.items()
+                if namespace.startswith(self.namespace_prefix) and page in namespace_rooms}
+
+    async def emit(self):
+        """
+        Emits the queued changes
+
+        :return: None
+        """
+        if not self.pending:
+            return
+        changes, self.pending = list(self.pending.values()), {}
+        batches = {}
+        for change in changes:
+            for target in self.targets(change):
+                batches.setdefault(target, []).append(change)
+        for (namespace, room), batch in batches.items():
+            for recipients, changes in await self.recipients(namespace, room, batch):
+                await self.server.manager.emit('changes', {'changes': changes}, namespace=namespace, room=recipients,
+                                               ignore_queue=True)
+
+    async def recipients(self, namespace: str, room: str, changes: list):
+        """
+        Groups the local clients of a room by the changes they may read
+
+        :param namespace: str, The namespace of the room
+        :param room: str, The room, None for the whole namespace
+        :param changes: list, The changes the room receives
+        :return: list, (recipients, changes) tuples, the recipients are the room or a list of sids
+        """
+        if self.access is None:
+            return [(room, changes)]
+        groups = {}
+        for sid, _ in self.server.manager.get_participants(namespace, room):
+            access = await self.access(namespace, sid)
+            readable = tuple(index for index, change in enumerate(changes) if access is None or
+                             access.can(change.get('entity'), {'id': change.get('id'), 'page': change.get('page')}))
+            if readable:
+                groups.setdefault(readable, []).append(sid)
+        return [(sids, [changes[index] for index in readable]) for readable, sids in groups.items()]
+
+    async def _emit_every_tick(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self.emit()
+            except Exception:
+                self.server.logger.exception('Could not emit the changes')
+
+    async def _listen(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError:
+                await asyncio.sleep(self.retry_interval)
+                continue
+            writer.write(SUBSCRIBER)
+            try:
+                while True:
+                    try:
+                        self.add(json.loads(await read_frame(reader)))
+                    except ValueError:
+                        self.server.logger.warning('Dropped a malformed change')
+            except (asyncio.IncompleteReadError, ConnectionError):
+                await asyncio.sleep(self.retry_interval)
+            finally:
+                writer.close()
@@ -0,0 +1,345 @@
+"""
+Live editing of pages: editors send small operations, which are applied to an in-memory buffer of the page,
+broadcast to the room of the page in batches and written to the ContentStore periodically
+"""
+import asyncio
+from collections import deque
+from ..util.async_storage import AsyncStorage
+from ..util.content import ContentStore
+
+INSERT = 'insert'
+DELETE = 'delete'
+
+
+class StaleOperations(ValueError):
+    """
+    Raised, if operations are based on a sequence number, which is no longer in the history of the buffer
+    """
+
+
+def parse_operation(operation):
+    """
+    Checks the shape of an operation sent by an editor
+
+    :param operation: dict, {'type': 'insert', 'position': int, 'text': str} or
+                      {'type': 'delete', 'position': int, 'length': int}
+    :return: dict, The operation without unknown keys
+    :raises ValueError: If the operation is malformed
+    """
+    if not isinstance(operation, dict) or not isinstance(operation.get('position'), int) \
+            or isinstance(operation.get('position'), bool) or operation['position'] < 0:
+        raise ValueError(f'Invalid operation {operation}')
+    if operation.get('type') == INSERT and isinstance(operation.get('text'), str) and operation['text']:
+        return {'type': INSERT, 'position': operation['position'], 'text': operation['text']}
+    if operation.get('type') == DELETE and isinstance(operation.get('length'), int) \
+            and not isinstance(operation.get('length'), bool) and operation['length'] > 0:
+        return {'type': DELETE, 'position': operation['position'], 'length': operation['length']}
+    raise ValueError(f'Invalid operation {operation}')
+
+
+def apply_operation(text: str, operation: dict):
+    """
+    Applies an operation to a text
+
+    :param text: str, The text to change
+    :param operation: dict, The operation to apply
+    :return: str, The changed text
+    :raises ValueError: If the operation exceeds the text
+    """
+    position = operation['position']
+    if operation['type'] == INSERT:
+        if position > len(text):
+            raise ValueError(f'Insert at {position} exceeds the length {len(text)}')
+        return text[:position] + operation['text'] + text[position:]
+    end = position + operation['length']
+    if end > len(text):
+        raise ValueError(f'Delete until {end} exceeds the length {len(text)}')
+    return text[:position] + text[end:]
+
+
+def transform(operation: dict, other: dict, wins: bool):
+    """
+    Rebases an operation on a concurrent operation, both based on the same text.
+    An insert inside a concurrently deleted range is dropped and the deletion grows over an insert inside
+    its range, so both orders of application converge.
+
+    :param operation: dict, The operation to rebase
+    :param other: dict, The concurrent operation, which is applied first
+    :param wins: bool, Whether the operation goes first, if both insert at the same position
+    :return: dict, The rebased operation or None if nothing is left of it
+    """
+    position = operation['position']
+    start = other['position']
+    if other['type'] == INSERT:
+        size = len(other['text'])
+        if operation['type'] == INSERT:
+            if start < position or (start == position and not wins):
+                position += size
+            return dict(operation, position=position)
+        if start <= position:
+            return dict(operation, position=position + size)
+        if start < position + operation['length']:
+            return dict(operation, length=operation['length'] + size)
+        return operation
+    end = start + other['length']
+    if operation['type'] == INSERT:
+        if position >= end:
+            return dict(operation, position=position - other['length'])
+        if position > start:
+            return None
+        return operation
+    operation_end = position + operation['length']
+    if end <= position:
+        return dict(operation, position=position - other['length'])
+    if start >= operation_end:
+        return operation
+    length = operation['length'] - (min(end, operation_end) - max(start, position))
+    return dict(operation, position=min(start, position), length=length) if length else None
+
+
+def rebase(operations: list, concurrent: list):
+    """
+    Rebases a sequence of operations on the operations applied since their base
+
+    :param operations: list, The operations, each based on the text after its predecessors
+    :param concurrent: list, The operations applied since the base, in order
+    :return: list, The rebased operations
+    """
+    rebased = []
+    for operation in operations:
+        remaining = []
+        for other in concurrent:
+            if operation is None:
+                remaining.append(other)
+                continue
+            operation, other = transform(operation, other, wins=False), transform(other, operation, wins=True)
+            if other is not None:
+                remaining.append(other)
+        concurrent = remaining
+        if operation is not None:
+            rebased.append(operation)
+    return rebased
+
+
+def coalesce(entries: list):
+    """
+    Merges consecutive operations of the same author, e.g. the keystrokes of a typed word
+
+    :param entries: list, The (sequence number, author, operation) tuples in order
+    :return: list, The merged operations with their author and the sequence number of their last part
+    """
+    merged = []
+    for seq, author, operation in entries:
+        last = merged[-1] if merged else None
+        if last is not None and last['author'] == author and last['type'] == operation['type']:
+            if operation['type'] == INSERT and operation['position'] == last['position'] + len(last['text']):
+                last.update(text=last['text'] + operation['text'], seq=seq)
+                continue
+            if operation['type'] == DELETE and operation['position'] == last['position']:
+                last.update(length=last['length'] + operation['length'], seq=seq)
+                continue
+            if operation['type'] == DELETE and operation['position'] + operation['length'] == last['position']:
+                last.update(position=operation['position'], length=last['length'] + operation['length'], seq=seq)
+                continue
+        merged.append(dict(operation, author=author, seq=seq))
+    return merged
+
+
+class PageBuffer:
+    """
+    The current text of a page being edited, with the recent operations to rebase late operations on
+    """
+
+    def __init__(self, text: str, history_size: int = 1000):
+        """
+
+        :param text: str, The stored text of the page
+        :param history_size: int, The number of operations kept to rebase operations on
+        """
+        self.text = text
+        self.seq = 0
+        self.history = deque(maxlen=history_size)
+        self.pending = []
+        self.dirty = False
+        self.members = set()
+
+    def submit(self, author: str, base: int, operations: list):
+        """
+        Rebases operations on everything applied since their base and applies them
+
+        :param author: str, The sid of the editor
+        :param base: int, The sequence number the editor has seen last
+        :param operations: list, The operations of the editor
+        :return: int, The sequence number after the operations
+        :raises StaleOperations: If the base is too old to rebase on
+        :raises ValueError: If an operation is malformed or exceeds the text, nothing is applied then
+        """
+        if not isinstance(base, int) or isinstance(base, bool) or not isinstance(operations, list):
+            raise ValueError('Operations need the sequence number they are based on and a list of operations')
+        if base > self.seq or base < self.seq - len(self.history):
+            raise StaleOperations(f'Cannot rebase operations on {base}, the page is at {self.seq}')
+        concurrent = [operation for seq, operation in self.history if seq > base]
+        operations = rebase([parse_operation(operation) for operation in operations], concurrent)
+        text = self.text
+        for operation in operations:
+            text = apply_operation(text, operation)
+        self.text = text
+        for operation in operations:
+            self.seq += 1
+            self.history.append((self.seq, operation))
+            self.pending.append((self.seq, author, operation))
+        self.dirty = self.dirty or bool(operations)
+        return self.seq
+
+
+class LiveEditor:
+    """
+    Keeps the buffers of the pages being edited. Operations are broadcast to the room of their page once per tick
+    and buffers are written to the ContentStore every flush interval, so a burst of keystrokes costs one message
+    per editor and tick and a single write per interval.
+    """
+
+    def __init__(self, server, storage: AsyncStorage, contents: ContentStore,
+                 tick: float = 0.05, flush_interval: float = 2.0, history_size: int = 1000):
+        """
+
+        :param server: socketio.AsyncServer, The server emitting the operations
+        :param storage: AsyncStorage, The executor of the blocking ContentStore calls
+        :param contents: ContentStore, The store of the page texts, chained by page id
+        :param tick: float, The seconds operations are collected before they are broadcast
+        :param flush_interval: float, The seconds between two writes of a changed page
+        :param history_size: int, The number of operations per page kept to rebase late operations on
+        """
+        self.server = server
+        self.storage = storage
+        self.contents = contents
+        self.tick = tick
+        self.flush_interval = flush_interval
+        self.history_size = history_size
+        self.buffers = {}
+        self._loading = {}
+        self._tasks = None
+
+    async def join(self, namespace: str, sid: str, page: str):
+        """
+        Adds an editor to the room of a page, loading the page into a buffer if nobody edits it yet
+
+        :param namespace: str, The namespace of the notebook
+        :param sid: str, The sid of the editor
+        :param page: str, The id of the page
+        :return: dict, The current text and sequence number of the page
+        """
+        self._start()
+        buffer = await self._buffer(page)
+        buffer.members.add((namespace, sid))
+        self.server.enter_room(sid, page, namespace=namespace)
+        return {'page': page, 'text': buffer.text, 'seq': buffer.seq}
+
+    async def leave(self, namespace: str, sid: str, page: str):
+        """
+        Removes an editor from the room of a page, the buffer is written and dropped once the last editor left
+
+        :param namespace: str, The namespace of the notebook
+        :param sid: str, The sid of the editor
+        :param page: str, The id of the page
+        :return: None
+        """
+        self.server.leave_room(sid, page, namespace=namespace)
+        buffer = self.buffers.get(page)
+        if buffer is None:
+            return
+        buffer.members.discard((namespace, sid))
+        if not buffer.members:
+            await self._broadcast(page, buffer)
+            await self._flush(page, buffer)
+            if not buffer.members and self.buffers.get(page) is buffer:
+                del self.buffers[page]
+
+    async def leave_all(self, namespace: str, sid: str):
+        """
+        Removes a disconnected editor from all rooms
+
+        :param namespace: str, The namespace of the notebook
+        :param sid: str, The sid of the editor
+        :return: None
+        """
+        for page, buffer in list(self.buffers.items()):
+            if (namespace, sid) in buffer.members:
+                await self.leave(namespace, sid, page)
+
+    def submit(self, namespace: str, sid: str, page: str, base: int, operations: list):
+        """
+        Applies the operations of an editor, they are broadcast with the next tick
+
+        :param namespace: str, The namespace of the notebook
+        :param sid: str, The sid of the editor
+        :param page: str, The id of the page
+        :param base: int, The sequence number the editor has seen last
+        :param operations: list, The operations
+        :return: int, The sequence number after the operations
+        :raises StaleOperations: If the editor did not join the page or the base is too old
+        :raises ValueError: If an operation is invalid
+        """
+        buffer = self.buffers.get(page)
+        if buffer is None or (namespace, sid) not in buffer.members:
+            raise StaleOperations(f'Join page {page} before editing it')
+        return buffer.submit(sid, base, operations)
+
+    async def flush(self):
+        """
+        Writes all changed buffers
+
+        :return: None
+        """
+        await asyncio.gather(*(self._flush(page, buffer) for page, buffer in list(self.buffers.items())))
+
+    async def _buffer(self, page: str):
+        if page in self.buffers:
+            return self.buffers[page]
+        if page not in self._loading:
+            self._loading[page] = asyncio.ensure_future(self._load(page))
+        try:
+            return await asyncio.shield(self._loading[page])
+        finally:
+            self._loading.pop(page, None)
+
+    async def _load(self, page: str):
+        revision = await self.storage.run(self.contents.latest, page)
+        text = '' if revision is None else await self.storage.run(self.contents.get, page, revision)
+        buffer = self.buffers[page] = PageBuffer(text or '', self.history_size)
+        return buffer
+
+    def _start(self):
+        if self._tasks is None:
+            self._tasks = (self.server.start_background_task(self._every, self.tick, self._broadcast_all),
+                           self.server.start_background_task(self._every, self.flush_interval, self.flush))
+
+    async def _every(self, interval: float, fn):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await fn()
+            except Exception:
+                self.server.logger.exception('Live editing task failed')
+
+    async def _broadcast_all(self):
+        await asyncio.gather(*(self._broadcast(page, buffer) for page, buffer in list(self.buffers.items())
+                               if buffer.pending))
+
+    async def _broadcast(self, page: str, buffer: PageBuffer):
+        if not buffer.pending:
+            return
+        entries, buffer.pending = buffer.pending, []
+        message = {'page': page, 'seq': entries[-1][0], 'ops': coalesce(entries)}
+        for namespace in {namespace for namespace, _sid in buffer.members}:
+            await self.server.emit('ops', message, room=page, namespace=namespace)
+
+    async def _flush(self, page: str, buffer: PageBuffer):
+        if not buffer.dirty:
+            return
+        buffer.dirty = False
+        try:
+            await self.storage.run(self.contents.put, page, buffer.text)
+        except Exception:
+            buffer.dirty = True
+            raise
@@ -0,0 +1,146 @@
+"""
+Sticky routing of Socket.IO connections to the socket workers.
+The engine.io session ids carry the index of their worker, so every router process routes the polling requests
+and the websocket of a session to the same worker without shared state.
+"""
+import asyncio
+import itertools
+import zlib
+import aiohttp
+from aiohttp import web
+
+# Hop-by-hop headers, which are not forwarded
+HOP_HEADERS = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailer',
+               'transfer-encoding', 'upgrade', 'host', 'content-length'}
+
+
+def worker_for(key: str, workers: int):
+    """
+    Returns the worker, which owns a key, e.g. the notebook all editors of its pages share
+
+    :param key: str, The key
+    :param workers: int, The number of workers
+    :return: int, The index of the worker
+    """
+    return zlib.crc32(key.encode('utf-8')) % workers
+
+
+def session_worker(sid: str):
+    """
+    Returns the worker encoded in an engine.io session id
+
+    :param sid: str, The session id, e.g. '3.Kx0...'
+    :return: int, The index of the worker or None if the session id holds none
+    """
+    prefix, _, rest = (sid or '').partition('.')
+    return int(prefix) if rest and prefix.isdigit() else None
+
+
+class StickyRouter:
+    """
+    Reverse proxy in front of the socket workers. Requests of an existing session go to the worker of the session,
+    new sessions go to the worker owning their 'notebook' query parameter, so all editors of a notebook share
+    the buffers of its pages, or to the next worker.
+    """
+
+    def __init__(self, host: str, ports: list):
+        """
+
+        :param host: str, The host of the workers
+        :param ports: list, The ports of the workers, by index
+        """
+        self.host = host
+        self.ports = ports
+        self._next = itertools.cycle(range(len(ports)))
+        self.session = None
+
+    def worker(self, request: web.Request):
+        """
+        Chooses the worker of a request
+
+        :param request: web.Request, The request
+        :return: int, The index of the worker
+        """
+        worker = session_worker(request.query.get('sid'))
+        if worker is not None and worker < len(self.ports):
+            return worker
+        if request.query.get('notebook'):
+            return worker_for(request.query['notebook'], len(self.ports))
+        return next(self._next)
+
+    def app(self):
+        """
+        Creates the aiohttp application of the router
+
+        :return: web.Application, The application
+        """
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', self.handle)
+        app.on_startup.append(self._open)
+        app.on_cleanup.append(self._close)
+        return app
+
+    async def handle(self, request: web.Request):
+        """
+        Forwards a request to its worker
+
+        :param request: web.Request, The request
+        :return: web.StreamResponse, The response of the worker
+        """
+        url = f'http://{self.host}:{self.ports[self.worker(request)]}{request.rel_url}'
+        headers = {key: value for key, value in request.headers.items() if key.lower() not in HOP_HEADERS}
+        if request.remote:
+            headers['X-Forwarded-For'] = request.remote
+        if request.headers.get('Upgrade', '').lower() == 'websocket':
+            return await self._websocket(request, url, headers)
+        try:
+            async with self.session.request(request.method, url, headers=headers, data=await request.read(),
+                                            allow_redirects=False) as upstream:
+                body = await upstream.read()
+                response = web.Response(status=upstream.status, body=body)
+                for key, value in upstream.headers.items():
+                    if key.lower() not in HOP_HEADERS:
+                        response.headers.add(key, value)
+                return response
+        except aiohttp.ClientError:
+            return web.Response(status=502, text='Socket worker unavailable')
+
+    async def _websocket(self, request: web.Request, url: str, headers: dict):
+        headers = {key: value for key, value in headers.items()
+                   if not key.lower().startswith('sec-websocket')}
+        try:
+            upstream = await self.session.ws_connect(url, headers=headers, autoping=False)
+        except aiohttp.ClientError:
+            return web.Response(status=502, text='Socket worker unavailable')
+        downstream = web.WebSocketResponse(autoping=False)
+        await downstream.prepare(request)
+        pumps = [asyncio.ensure_future(self._pump(downstream, upstream)),
+                 asyncio.ensure_future(self._pump(upstream, downstream))]
+        await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+        for pump in pumps:
+            pump.cancel()
+        await upstream.close()
+        await downstream.close()
+        return downstream
+
+    @staticmethod
+    async def _pump(source, target):
+        async for message in source:
+            if message.type == aiohttp.WSMsgType.TEXT:
+                await target.send_str(message.data)
+            elif message.type == aiohttp.WSMsgType.BINARY:
+                await target.send_bytes(message.data)
+            elif message.type == aiohttp.WSMsgType.PING:
+                await target.ping(message.data)
+            elif message.type == aiohttp.WSMsgType.PONG:
+                await target.pong(message.data)
+            else:
+                return
+
+    async def _open(self, _app):
+        # Long polling requests stay open until the ping interval, so there is no total timeout
+        self.session = aiohttp.ClientSession(auto_decompress=False, timeout=aiohttp.ClientTimeout(total=None),
+                                             connector=aiohttp.TCPConnector(limit=0))
+
+    async def _close(self, _app):
+        await self.session.close()
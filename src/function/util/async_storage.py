@@ -0,0 +1,196 @@
+"""
+Asyncio Storage Module for DynamoDB
+"""
+import asyncio
+import contextvars
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from .cache import ItemCache
+from .storage import Storage
+
+
+class AsyncStorage:
+    """
+    Awaitable counterpart of Storage for event loops, e.g. the socket server.
+    Every call runs the blocking Storage method on a bounded thread pool, which shares one connection pool,
+    while a semaphore limits the number of calls in flight, so a slow query never blocks the event loop.
+    """
+
+    def __init__(self, endpoint=None, access_key=None, secret_key=None,
+                 max_concurrency: int = 64,
+                 max_workers: int = 32,
+                 cache: ItemCache = None,
+                 storage: Storage = None):
+        """
+
+        :param endpoint: The endpoint to use as DynamoDB Connection
+        :param access_key: The Access Key to use to authenticate with DynamoDB
+        :param secret_key: The Secret Key to use to authenticate with DynamoDB
+        :param max_concurrency: The maximum number of calls in flight, further calls wait without blocking the loop
+        :param max_workers: The number of threads and pooled HTTP connections used to execute the calls
+        :param cache: An optional ItemCache for the reads of the underlying Storage
+        :param storage: An existing Storage to wrap instead of creating a new one
+        """
+        self.storage = storage or Storage(endpoint, access_key, secret_key,
+                                          max_workers=max_workers,
+                                          cache=cache,
+                                          max_pool_connections=max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='async-storage')
+        self.max_concurrency = max_concurrency
+        # Closed loops are dropped with their semaphores
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Runs a blocking function on the executor, while respecting the concurrency limit
+
+        :param fn: callable, The function to run
+        :return: The result of the function
+        """
+        async with self._semaphore():
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self.executor, functools.partial(context.run, fn, *args, **kwargs))
+
+    def _semaphore(self):
+        """
+        Returns the semaphore of the running event loop, as asyncio primitives are bound to a single loop
+
+        :return: asyncio.Semaphore, The semaphore limiting the calls in flight
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def create_table(self, *args, **kwargs):
+        """
+        Awaitable version of Storage.create_table
+        """
+        return await self.run(self.storage.create_table, *args, **kwargs)
+
+    async def delete_table(self, *args, **kwargs):
+        """
+        Awaitable version of Storage.delete_table
+        """
+        return await self.run(self.storage.delete_table, *args, **kwargs)
+
+    async def list_tables(self):
+        """
+        Awaitable version of Storage.list_tables
+        """
+        return await self.run(self.storage.list_tables)
+
+    async def update_table(self, *args, **kwargs):
+        """
+        Awaitable version of Storage.update_table
+        """
+        return await self.run(self.storage.update_table, *args, **kwargs)
+
+    async def create_item(self, *args, **kwargs):
+        """
+        Awaitable version of Storage.create_item
+        """
+        return await self.run(self.storage.create_item, *args, **kwargs)
+
+    async def delete_item(self, *args, **kwargs):
+        """
+        Awaitable version of Storage.delete_item
+        """
+        return await self.run(self.storage.delete_item, *args, **kwargs)
+
+    async def update_item(self, *args, **kwargs):
+        """
+        Awaitable version of Storage.update_item
+        """
+        return await self.run(self.storage.update_item, *args, **kwargs)
+
+    async def get_item(self, *args, **kwargs):
+        """
+        Awaitable version of Storage.get_item
+        """
+        return await self.run(self.storage.get_item, *args, **kwargs)
+
+    async def query_table(self, *args, **kwargs):
+        """
+        Awaitable version of Storage.query_table
+        """
+        return await self.run(self.storage.query_table, *args, **kwargs)
+
+    async def scan_table(self, *args, **kwargs):
+        """
+        Awaitable version of Storage.scan_table
+        """
+        return await self.run(self.storage.scan_table, *args, **kwargs)
+
+    async def batch_get_items(self, *args, **kwargs):
+        """
+        Awaitable version of Storage.batch_get_items
+        """
+        return await self.run(self.storage.batch_get_items, *args, **kwargs)
+
+    async def batch_write_items(self, *args, **kwargs):
+        """
+        Awaitable version of Storage.batch_write_items
+        """
+        return await self.run(self.storage.batch_write_items, *args, **kwargs)
+
+    async def batch_write(self, *args, **kwargs):
+        """
+        Awaitable version of Storage.batch_write
+        """
+        return await self.run(self.storage.batch_write, *args, **kwargs)
+
+    async def transact_write_items(self, *args, **kwargs):
+        """
+        Awaitable version of Storage.transact_write_items
+        """
+        return await self.run(self.storage.transact_write_items, *args, **kwargs)
+
+    async def iter_query(self, *args, **kwargs):
+        """
+        Asynchronous iterator version of Storage.iter_query
+        """
+        async for item in self._iterate(self.storage.iter_query(*args, **kwargs)):
+            yield item
+
+    async def iter_scan(self, *args, **kwargs):
+        """
+        Asynchronous iterator version of Storage.iter_scan
+        """
+        async for item in self._iterate(self.storage.iter_scan(*args, **kwargs)):
+            yield item
+
+    async def parallel_scan(self, *args, **kwargs):
+        """
+        Asynchronous iterator version of Storage.parallel_scan
+        """
+        async for item in self._iterate(self.storage.parallel_scan(*args, **kwargs)):
+            yield item
+
+    async def _iterate(self, generator):
+        """
+        Consumes a blocking generator on the executor, one item at a time
+
+        :param generator: generator, The blocking generator
+        :return: async generator, yielding the items of the generator
+        """
+        done = object()
+        try:
+            while True:
+                item = await self.run(next, generator, done)
+                if item is done:
+                    return
+                yield item
+        finally:
+            generator.close()
+
+    def close(self):
+        """
+        Shuts the executor down without waiting for running calls
+
+        :return: None
+        """
+        self.executor.shutdown(wait=False)
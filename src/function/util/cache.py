@@ -0,0 +1,173 @@
+"""
+Read-through Cache Module for the Storage
+"""
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ItemCache:
+    """
+    Size bounded LRU cache with per table TTLs for items and query results read from DynamoDB.
+    Entries are indexed by the primary key of their item, so a write removes the reads of its item without
+    visiting the other entries of the table, query results are removed by every write to their table.
+    """
+
+    def __init__(self, max_size: int = 10000, default_ttl: float = 30, table_ttls: dict = None):
+        """
+
+        :param max_size: int, The maximum number of entries kept in the cache
+        :param default_ttl: float, The time in seconds an entry stays valid, if its table has no own TTL
+        :param table_ttls: dict, A map of table names to TTLs in seconds, a TTL of 0 disables caching for the table
+        """
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.table_ttls = table_ttls or {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # Table -> cache keys, (table, key names, key values) -> cache keys, table -> key names of its entries
+        self._keys = {}
+        self._items = {}
+        self._key_names = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(table_name: str, kind: str, params: dict):
+        """
+        Builds the cache key of a request
+
+        :param table_name: str, The name of the table the request is sent to
+        :param kind: str, The kind of the request, e.g. get or query
+        :param params: dict, The parameters of the request
+        :return: tuple, The cache key
+        """
+        return table_name, kind, json.dumps(params, sort_keys=True, default=str)
+
+    def get(self, key: tuple):
+        """
+        Looks up an entry in the cache
+
+        :param key: tuple, The cache key built with make_key
+        :return: tuple, (True, value) on a hit or (False, None) on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, copy.deepcopy(entry[1])
+
+    def set(self, key: tuple, value, item_key: dict = None):
+        """
+        Stores an entry in the cache and evicts the least recently used entries if the cache is full
+
+        :param key: tuple, The cache key built with make_key
+        :param value: The value to store
+        :param item_key: dict, The primary key of the stored item, used to invalidate it on writes
+        :return: None
+        """
+        ttl = self.table_ttls.get(key[0], self.default_ttl)
+        if not ttl:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            index = self._index(key[0], item_key)
+            self._entries[key] = (time.monotonic() + ttl, copy.deepcopy(value), index)
+            self._keys.setdefault(key[0], set()).add(key)
+            self._items.setdefault(index, set()).add(key)
+            if item_key is not None:
+                self._key_names.setdefault(key[0], set()).add(index[1])
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_item(self, table_name: str, item: dict):
+        """
+        Removes every cached read of the given item and all cached queries of its table
+
+        :param table_name: str, The name of the table the item was written to
+        :param item: dict, The written item or its primary key
+        :return: None
+        """
+        with self._lock:
+            indexes = [(table_name, None)]
+            for names in self._key_names.get(table_name, ()):
+                if all(name in item for name in names):
+                    indexes.append((table_name, names, tuple(item[name] for name in names)))
+            for index in indexes:
+                for key in list(self._items.get(index, ())):
+                    self._remove(key)
+
+    def invalidate_table(self, table_name: str):
+        """
+        Removes every cached entry of a table
+
+        :param table_name: str, The name of the table
+        :return: None
+        """
+        with self._lock:
+            for key in list(self._keys.get(table_name, ())):
+                self._remove(key)
+
+    def clear(self):
+        """
+        Removes every entry from the cache
+
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self._items.clear()
+            self._key_names.clear()
+
+    def stats(self):
+        """
+        Returns the counters of the cache
+
+        :return: dict, The number of hits, misses, evictions and the current size
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries)
+            }
+
+    def _remove(self, key: tuple):
+        """
+        Removes a single entry, the lock has to be held by the caller
+
+        :param key: tuple, The cache key of the entry
+        :return: None
+        """
+        index = self._entries.pop(key)[2]
+        self._keys[key[0]].discard(key)
+        entries = self._items[index]
+        entries.discard(key)
+        if not entries:
+            del self._items[index]
+
+    @staticmethod
+    def _index(table_name: str, item_key: dict):
+        """
+        Builds the index key of an entry, equal numbers of different types, e.g. int and Decimal, hash equally
+
+        :param table_name: str, The name of the table
+        :param item_key: dict, The primary key of the item, None for query results
+        :return: tuple, (table, key names, key values) or (table, None)
+        """
+        if item_key is None:
+            return table_name, None
+        names = tuple(sorted(item_key))
+        return table_name, names, tuple(item_key[name] for name in names)
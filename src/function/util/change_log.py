@@ -0,0 +1,92 @@
+"""
+Shared Change Log Module, which keeps the in-memory indexes of multiple processes (e.g. uvicorn workers) up to date
+"""
+import json
+import os
+
+
+class ChangeLog:
+    """
+    Append-only file of JSON records shared by processes on one host.
+    Every process appends the changes it made and reads the changes of the others from its last position.
+    A log growing beyond its maximum size is replaced by an empty one, readers notice the new file and load
+    their state from the tables again, which hold every logged change.
+    """
+
+    def __init__(self, path: str, max_size: int = 16 << 20):
+        """
+
+        :param path: str, The path of the log file
+        :param max_size: int, The size in bytes after which the log is rotated
+        """
+        self.path = path
+        self.max_size = max_size
+        self._id = None
+        self._offset = 0
+
+    def mark(self):
+        """
+        Skips the records logged so far, e.g. before the state is loaded from the tables.
+        Records logged while loading are read afterwards, so applying a record has to be idempotent.
+
+        :return: None
+        """
+        self._id, self._offset = self._position()
+
+    def changed(self):
+        """
+        Checks without reading the log whether records were appended or the log was rotated since the last read
+
+        :return: bool
+        """
+        return self._position() != (self._id, self._offset)
+
+    def read(self):
+        """
+        Reads the records appended since the last read, a record still being written is read next time
+
+        :return: list, The records or None, if the log was rotated and the state has to be loaded again
+        """
+        log_id, size = self._position()
+        if self._id is None and log_id is not None:
+            # The first change of any process created the log
+            self._id, self._offset = log_id, 0
+        elif log_id != self._id or size < self._offset:
+            return None
+        if size == self._offset:
+            return []
+        with open(self.path, 'rb') as log_file:
+            log_file.seek(self._offset)
+            data = log_file.read(size - self._offset)
+        complete = data.rfind(b'\n') + 1
+        self._offset += complete
+        return [json.loads(line) for line in data[:complete].splitlines()]
+
+    def append(self, records: list):
+        """
+        Appends records, rotating the log once it exceeds its maximum size
+
+        :param records: list, The JSON serializable records
+        :return: None
+        """
+        if not records:
+            return
+        data = b''.join(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n' for record in records)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Appends of a single write do not interleave with the appends of other processes
+        with open(self.path, 'ab') as log_file:
+            log_file.write(data)
+            size = log_file.tell()
+        if size > self.max_size:
+            temporary = f'{self.path}.{os.getpid()}.tmp'
+            open(temporary, 'wb').close()
+            os.replace(temporary, self.path)
+
+    def _position(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None, 0
+        return (stat.st_dev, stat.st_ino), stat.st_size
@@ -0,0 +1,59 @@
+"""
+Change feed, which announces successful mutations to the socket server, so clients do not have to poll for them
+"""
+import json
+from decimal import Decimal
+from .ipc import IPCPublisher
+
+CREATED = 'create'
+UPDATED = 'update'
+DELETED = 'delete'
+
+
+def change_event(entity: str, id: str, op: str, fields=(), version=None, page: str = None, notebook: str = None):
+    """
+    Builds the compact event of a change
+
+    :param entity: str, The type of the changed item, e.g. 'page_version'
+    :param id: str, The id of the changed item
+    :param op: str, 'create', 'update' or 'delete'
+    :param fields: The names of the changed attributes
+    :param version: The version of the item after the change, if it has one
+    :param page: str, The page the item belongs to, its room receives the event
+    :param notebook: str, The notebook the item belongs to, its namespace receives the event
+    :return: dict, The event without empty keys
+    """
+    event = {'entity': entity, 'id': id, 'op': op, 'fields': sorted(fields), 'version': version,
+             'page': page, 'notebook': notebook}
+    return {key: value for key, value in event.items() if value is not None}
+
+
+def _json_value(value):
+    # Numbers of DynamoDB items are Decimals
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return str(value)
+
+
+class ChangeFeed:
+    """
+    Publishes change events to the feed hub of the socket server. Publishing never fails a mutation,
+    events are dropped while the socket server is not running.
+    """
+
+    def __init__(self, path: str):
+        """
+
+        :param path: str, The unix socket of the feed hub
+        """
+        self.publisher = IPCPublisher(path)
+
+    def publish(self, entity: str, id: str, op: str, fields=(), version=None, page: str = None,
+                notebook: str = None):
+        """
+        Publishes the change of an item, see change_event for the parameters
+
+        :return: bool, Whether the event was sent
+        """
+        event = change_event(entity, id, op, fields, version, page, notebook)
+        return self.publisher.publish(json.dumps(event, default=_json_value, separators=(',', ':')).encode('utf-8'))
@@ -0,0 +1,174 @@
+"""
+Fast Item Codec Module for DynamoDB
+"""
+from collections.abc import Mapping
+from decimal import Clamped, Context, Decimal, Inexact, Overflow, Rounded, Underflow
+
+# The number context of boto3.dynamodb.types, boto3 itself is only imported for the types handled by its fallback
+DYNAMODB_CONTEXT = Context(Emin=-128, Emax=126, prec=38, traps=[Clamped, Overflow, Inexact, Rounded, Underflow])
+_create_decimal = DYNAMODB_CONTEXT.create_decimal
+
+
+def _binary(value):
+    from boto3.dynamodb.types import Binary
+    return Binary(value)
+
+
+def _serialize_number(value):
+    number = str(_create_decimal(value))
+    if number in ('Infinity', 'NaN'):
+        raise TypeError('Infinity and NaN not supported')
+    return {'N': number}
+
+
+class ItemCodec:
+    """
+    Converts items between python values and the DynamoDB wire format, like TypeSerializer and TypeDeserializer.
+    The common wiki types (strings, numbers, booleans, lists and maps) are converted by direct type dispatch,
+    everything else falls back to boto3. Optional per table schemas (attribute name -> type descriptor, e.g. S, N,
+    SS, L or M) skip the dispatch for known top level attributes.
+    """
+
+    def __init__(self, schemas: dict = None):
+        """
+
+        :param schemas: dict, A map of table names to attribute schemas, each a map of attribute names to type descriptors
+        """
+        self._serializer = None
+        self._deserializer = None
+        self._serializers = {
+            str: lambda value: {'S': value},
+            bool: lambda value: {'BOOL': value},
+            int: _serialize_number,
+            Decimal: _serialize_number,
+            type(None): lambda value: {'NULL': True},
+            list: lambda value: {'L': [self.serialize(v) for v in value]},
+            tuple: lambda value: {'L': [self.serialize(v) for v in value]},
+            dict: lambda value: {'M': {k: self.serialize(v) for k, v in value.items()}},
+        }
+        self._deserializers = {
+            'S': lambda value: value,
+            'N': _create_decimal,
+            'BOOL': lambda value: value,
+            'NULL': lambda value: None,
+            'SS': set,
+            'NS': lambda value: set(map(_create_decimal, value)),
+            'B': _binary,
+            'BS': lambda value: set(map(_binary, value)),
+            'L': lambda value: [self.deserialize(v) for v in value],
+            'M': lambda value: {k: self.deserialize(v) for k, v in value.items()},
+        }
+        self._schemas = {}
+        for table_name, schema in (schemas or {}).items():
+            self.set_schema(table_name, schema)
+
+    @property
+    def serializer(self):
+        """
+        The TypeSerializer of boto3 for the values without a direct conversion, created on first use
+        """
+        if self._serializer is None:
+            from boto3.dynamodb.types import TypeSerializer
+            self._serializer = TypeSerializer()
+        return self._serializer
+
+    @property
+    def deserializer(self):
+        """
+        The TypeDeserializer of boto3 for the values without a direct conversion, created on first use
+        """
+        if self._deserializer is None:
+            from boto3.dynamodb.types import TypeDeserializer
+            self._deserializer = TypeDeserializer()
+        return self._deserializer
+
+    def set_schema(self, table_name: str, schema: dict):
+        """
+        Registers the attribute schema of a table
+
+        :param table_name: str, The name of the table
+        :param schema: dict, A map of attribute names to type descriptors
+        :return: None
+        """
+        self._schemas[table_name] = [
+            (name, descriptor, None if descriptor == 'S' else self._deserializers[descriptor])
+            for name, descriptor in schema.items()
+        ]
+
+    def serialize(self, value):
+        """
+        Serializes a single python value
+
+        :param value: The value to serialize
+        :return: dict, The value in the DynamoDB wire format
+        """
+        if type(value) is str:
+            return {'S': value}
+        serializer = self._serializers.get(type(value))
+        if serializer is None:
+            return self.serializer.serialize(value)
+        return serializer(value)
+
+    def deserialize(self, value: dict):
+        """
+        Deserializes a single value of the DynamoDB wire format
+
+        :param value: dict, The value in the DynamoDB wire format
+        :return: The python value
+        """
+        data = value.get('S')
+        if data is not None:
+            return data
+        if len(value) != 1:
+            return self.deserializer.deserialize(value)
+        ((descriptor, data),) = value.items()
+        deserializer = self._deserializers.get(descriptor)
+        if deserializer is None:
+            return self.deserializer.deserialize(value)
+        return deserializer(data)
+
+    def serialize_item(self, item: Mapping):
+        """
+        Serializes all attributes of an item
+
+        :param item: dict, A map of attribute names to python values
+        :return: dict, A map of attribute names to values in the DynamoDB wire format
+        """
+        serializers = self._serializers
+        serialized = {}
+        for name, value in item.items():
+            if type(value) is str:
+                serialized[name] = {'S': value}
+                continue
+            serializer = serializers.get(type(value))
+            serialized[name] = self.serializer.serialize(value) if serializer is None else serializer(value)
+        return serialized
+
+    def deserialize_item(self, item: Mapping, table_name: str = None):
+        """
+        Deserializes all attributes of an item, using the schema of the table, if one is registered
+
+        :param item: dict, A map of attribute names to values in the DynamoDB wire format
+        :param table_name: str, The name of the table the item was read from
+        :return: dict, A map of attribute names to python values
+        """
+        schema = self._schemas.get(table_name)
+        if schema is None:
+            deserialize = self.deserialize
+            return {name: deserialize(value) for name, value in item.items()}
+        deserialized = {}
+        for name, descriptor, deserializer in schema:
+            value = item.get(name)
+            if value is not None:
+                data = value.get(descriptor)
+                if data is None:
+                    deserialized[name] = self.deserialize(value)
+                elif deserializer is None:
+                    deserialized[name] = data
+                else:
+                    deserialized[name] = deserializer(data)
+        if len(deserialized) != len(item):
+            for name, value in item.items():
+                if name not in deserialized:
+                    deserialized[name] = self.deserialize(value)
+        return deserialized
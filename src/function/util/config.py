@@ -1,14 +1,38 @@
 import os
+import threading
 import yaml
 
+_CONFIG = None
+_CONFIG_LOCK = threading.Lock()
+
 
 def get_data_dir():
-    while 'src' not in os.listdir('.'):
-        os.chdir('..')
-    if 'data' in os.listdir('.'):
-        return os.path.join(os.getcwd(), 'data')
-    else:
-        raise FileNotFoundError('Could not find data directory!')
+    # The project root holds src and data, it is searched above the working directory and above this module
+    for start in (os.getcwd(), os.path.dirname(os.path.abspath(__file__))):
+        directory = start
+        while not os.path.isdir(os.path.join(directory, 'src')):
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+        else:
+            if os.path.isdir(os.path.join(directory, 'data')):
+                return os.path.join(directory, 'data')
+    raise FileNotFoundError('Could not find data directory!')
+
+
+def get_config():
+    """
+    Returns the configuration of the process, it is read once on first use
+
+    :return: Config, The shared configuration
+    """
+    global _CONFIG
+    if _CONFIG is None:
+        with _CONFIG_LOCK:
+            if _CONFIG is None:
+                _CONFIG = Config()
+    return _CONFIG
 
 
 class Config:
@@ -31,3 +55,7 @@ class Config:
                     setattr(self, f'{prevKey}_{key}', data[key].replace('{data-dir}', self.data_dir))
                 else:
                     setattr(self, f'{prevKey}_{key}', data[key])
+
+    def section(self, prefix):
+        # All values below a flattened key, e.g. section('graph_cost_weights') -> {'Query.pages': 100, ...}
+        return {key[len(prefix) + 1:]: value for key, value in vars(self).items() if key.startswith(f'{prefix}_')}
@@ -0,0 +1,259 @@
+"""
+Versioned Content Storage Module keeping compressed deltas between the revisions of a page
+"""
+import difflib
+import json
+import zlib
+from botocore.exceptions import ClientError
+from .cache import ItemCache
+from .storage import Storage
+
+# Every revision of a chain is one row: a compressed snapshot of the full text or a compressed delta against
+# the previous revision. Revisions divisible by the snapshot interval are always snapshots.
+CONTENT_TABLE = {
+    'attribute_definitions': [
+        {'AttributeName': 'chain', 'AttributeType': 'S'},
+        {'AttributeName': 'revision', 'AttributeType': 'N'},
+    ],
+    'key_schema': [
+        {'AttributeName': 'chain', 'KeyType': 'HASH'},
+        {'AttributeName': 'revision', 'KeyType': 'RANGE'},
+    ],
+    'billing_mode': 'PAY_PER_REQUEST',
+}
+
+CONTENT_SCHEMA = {'chain': 'S', 'revision': 'N', 'kind': 'S', 'data': 'B'}
+
+SNAPSHOT = 'snapshot'
+DELTA = 'delta'
+
+
+def make_delta(base: str, text: str):
+    """
+    Encodes a text as line based difference to a base text
+
+    :param base: str, The text of the previous revision
+    :param text: str, The text of the new revision
+    :return: bytes, The compressed delta
+    """
+    base_lines, lines = base.splitlines(keepends=True), text.splitlines(keepends=True)
+    operations = []
+    matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+    for tag, base_start, base_end, start, end in matcher.get_opcodes():
+        if tag == 'equal':
+            operations.append([base_start, base_end])
+        elif tag in ('replace', 'insert'):
+            operations.append(''.join(lines[start:end]))
+    return zlib.compress(json.dumps(operations, separators=(',', ':')).encode('utf-8'))
+
+
+def apply_delta(base: str, delta: bytes):
+    """
+    Restores a text from its base text and delta
+
+    :param base: str, The text of the previous revision
+    :param delta: bytes, The compressed delta
+    :return: str, The text of the new revision
+    """
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for operation in json.loads(zlib.decompress(delta)):
+        if isinstance(operation, str):
+            parts.append(operation)
+        else:
+            parts.extend(base_lines[operation[0]:operation[1]])
+    return ''.join(parts)
+
+
+class ContentStore:
+    """
+    Stores the successive texts of a page (a chain) as compressed deltas with periodic compressed snapshots,
+    so reconstructing a revision reads at most one snapshot interval of rows with a single Query.
+    Revisions of different snapshot intervals are reconstructed with one Query per interval.
+    Reconstructed revisions are immutable and kept in an LRU cache.
+    """
+
+    def __init__(self, storage: Storage, table_name: str, snapshot_interval: int = 20, cache_size: int = 1000,
+                 max_retries: int = 5):
+        """
+
+        :param storage: Storage, The storage holding the content table
+        :param table_name: str, The name of the content table
+        :param snapshot_interval: int, The number of revisions between two full snapshots
+        :param cache_size: int, The number of reconstructed revisions kept in memory
+        :param max_retries: int, The number of attempts to append a revision, while others append to the same chain
+        """
+        self.storage = storage
+        self.table_name = table_name
+        self.snapshot_interval = snapshot_interval
+        self.max_retries = max_retries
+        # Revisions never change, so they never expire
+        self.cache = ItemCache(cache_size, default_ttl=float('inf'))
+        storage.codec.set_schema(table_name, CONTENT_SCHEMA)
+
+    def bootstrap(self):
+        """
+        Creates the content table, if it does not exist yet
+
+        :return: bool, Whether the table was created
+        """
+        if self.table_name in self.storage.list_tables():
+            return False
+        self.storage.create_table(self.table_name, **CONTENT_TABLE)
+        return True
+
+    def put(self, chain: str, text: str):
+        """
+        Appends a revision to a chain
+
+        :param chain: str, The id of the chain, e.g. the page the versions belong to
+        :param text: str, The text of the revision
+        :return: int, The number of the new revision
+        """
+        for _attempt in range(self.max_retries):
+            row = self.prepare(chain, [text])[0]
+            action = self.append_action(row)
+            try:
+                self.storage.create_item(self.table_name, row, conditional_expression=action['conditional_expression'],
+                                         expression_attribute_names=action['expression_attribute_names'])
+            except ClientError as error:
+                if error.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+                continue
+            self.remember([row], [text])
+            return row['revision']
+        raise RuntimeError(f'Could not append a revision to {chain} after {self.max_retries} attempts')
+
+    def prepare(self, chain: str, texts: list):
+        """
+        Builds the rows appending revisions to a chain without writing them, so they can be written in one
+        transaction with the items referencing them. The write fails, if another process appended to the chain
+        in the meantime, then the rows have to be prepared again.
+
+        :param chain: str, The id of the chain
+        :param texts: list, The texts of the new revisions in their order
+        :return: list, The rows of the revisions in the order of the texts
+        """
+        latest = self.latest(chain)
+        base = None if latest is None else self.get(chain, latest)
+        rows = []
+        for text in texts:
+            revision = 0 if latest is None else latest + 1
+            if revision % self.snapshot_interval == 0:
+                row = {'kind': SNAPSHOT, 'data': zlib.compress(text.encode('utf-8'))}
+            else:
+                row = {'kind': DELTA, 'data': make_delta(base, text)}
+            rows.append(dict(row, chain=chain, revision=revision))
+            latest, base = revision, text
+        return rows
+
+    def append_action(self, row: dict):
+        """
+        Builds the write of a prepared row, see Storage.transact_write_items
+
+        :param row: dict, The row returned by prepare
+        :return: dict, The put, which fails if the revision exists already
+        """
+        return {'table': self.table_name, 'put': row, 'conditional_expression': 'attribute_not_exists(#revision)',
+                'expression_attribute_names': {'#revision': 'revision'}}
+
+    def remember(self, rows: list, texts: list):
+        """
+        Caches the texts of written rows, so they are not reconstructed from the table
+
+        :param rows: list, The written rows returned by prepare
+        :param texts: list, The texts of the rows
+        :return: None
+        """
+        for row, text in zip(rows, texts):
+            self.cache.set(self._cache_key(row['chain'], row['revision']), text)
+
+    def latest(self, chain: str):
+        """
+        Returns the number of the newest revision of a chain
+
+        :param chain: str, The id of the chain
+        :return: int, The number of the revision or None if the chain is empty
+        """
+        rows = self.storage.query_table(self.table_name, limit=1, consistent_read=True, scan_index_forward=False,
+                                        projection_expression='#revision',
+                                        key_condition_expression='#chain = :chain',
+                                        expression_attribute_names={'#chain': 'chain', '#revision': 'revision'},
+                                        expression_attribute_values={':chain': self.storage.codec.serialize(chain)})
+        return int(rows[0]['revision']) if rows else None
+
+    def rows(self, chain: str):
+        """
+        Yields the rows of a chain as stored, in the order of their revisions, e.g. for exports
+
+        :param chain: str, The id of the chain
+        :return: generator, yielding the snapshot and delta rows
+        """
+        return self.storage.iter_query(self.table_name,
+                                       key_condition_expression='#chain = :chain',
+                                       expression_attribute_names={'#chain': 'chain'},
+                                       expression_attribute_values={':chain': self.storage.codec.serialize(chain)})
+
+    def get(self, chain: str, revision: int):
+        """
+        Reconstructs a revision
+
+        :param chain: str, The id of the chain
+        :param revision: int, The number of the revision
+        :return: str, The text of the revision or None if it does not exist
+        """
+        return self.get_many([(chain, revision)])[0]
+
+    def get_many(self, refs: list):
+        """
+        Reconstructs multiple revisions, reading the rows of every snapshot interval of a chain with a single Query
+
+        :param refs: list, The (chain, revision) tuples to reconstruct
+        :return: list, The texts in the order of the refs, None for revisions which do not exist
+        """
+        texts, missing = {}, {}
+        for chain, revision in refs:
+            hit, text = self.cache.get(self._cache_key(chain, revision))
+            if hit:
+                texts[(chain, int(revision))] = text
+            else:
+                missing.setdefault(chain, set()).add(int(revision))
+        for chain, revisions in missing.items():
+            texts.update(self._reconstruct(chain, revisions))
+        return [texts.get((chain, int(revision))) for chain, revision in refs]
+
+    def _reconstruct(self, chain: str, revisions: set):
+        # Every interval starts with a snapshot, its rows up to the newest requested revision of it are read
+        spans = {}
+        for revision in revisions:
+            start = revision - revision % self.snapshot_interval
+            spans[start] = max(revision, spans.get(start, revision))
+        texts = {}
+        for start, end in spans.items():
+            texts.update(self._reconstruct_span(chain, start, end, revisions))
+        return texts
+
+    def _reconstruct_span(self, chain: str, start: int, end: int, revisions: set):
+        texts, text = {}, None
+        serialize = self.storage.codec.serialize
+        condition = '#chain = :chain AND #revision BETWEEN :start AND :end'
+        # A revision appended by another process is read right after the write of its page version
+        for row in self.storage.iter_query(self.table_name, consistent_read=True,
+                                           key_condition_expression=condition,
+                                           expression_attribute_names={'#chain': 'chain', '#revision': 'revision'},
+                                           expression_attribute_values={':chain': serialize(chain),
+                                                                        ':start': serialize(start),
+                                                                        ':end': serialize(end)}):
+            revision, data = int(row['revision']), bytes(row['data'])
+            if row['kind'] == SNAPSHOT:
+                text = zlib.decompress(data).decode('utf-8')
+            elif text is not None:
+                text = apply_delta(text, data)
+            if text is not None:
+                self.cache.set(self._cache_key(chain, revision), text)
+                if revision in revisions:
+                    texts[(chain, revision)] = text
+        return texts
+
+    def _cache_key(self, chain: str, revision: int):
+        return self.table_name, chain, int(revision)
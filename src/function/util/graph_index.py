@@ -0,0 +1,413 @@
+"""
+In-Memory Graph Index Module for neighborhood and path queries
+"""
+import os
+import threading
+from array import array
+from collections import OrderedDict, deque
+from .change_log import ChangeLog
+from .graph_store import GraphStore
+
+
+class CompactGraph:
+    """
+    Array backed adjacency structure of a single graph.
+    Nodes and edges are mapped to integer ids, the outgoing edges of all nodes are kept in CSR form
+    (offsets into one target and one edge array). Mutations are collected in a small delta, which is
+    merged into the CSR arrays once it grows beyond a fraction of them.
+    """
+
+    def __init__(self, graph_id: str, compact_ratio: float = 0.25):
+        """
+
+        :param graph_id: str, The id of the graph
+        :param compact_ratio: float, The size of the delta relative to the CSR arrays, which triggers a compaction
+        """
+        self.graph_id = graph_id
+        self.compact_ratio = compact_ratio
+        self.node_ids = []
+        self.node_pages = []
+        self.node_index = {}
+        self.edge_ids = []
+        self.edge_index = {}
+        self.edge_keywords = []
+        self.keyword_index = {}
+        self.offsets = array('i', [0])
+        self.targets = array('i')
+        self.edges = array('i')
+        self.added = {}
+        self.removed = set()
+        self.removed_nodes = set()
+        self.delta_size = 0
+
+    @classmethod
+    def from_graph(cls, graph: dict, compact_ratio: float = 0.25):
+        """
+        Builds the index of a graph loaded by GraphStore.load_graph
+
+        :param graph: dict, The graph with its nodes and their edges
+        :param compact_ratio: float, The size of the delta relative to the CSR arrays, which triggers a compaction
+        :return: CompactGraph, The index of the graph
+        """
+        compact = cls(graph['id'], compact_ratio)
+        for node in graph['nodes']:
+            compact._node(node['id'], node.get('page'))
+        adjacency = [[] for _ in compact.node_ids]
+        for node in graph['nodes']:
+            source = compact.node_index[node['id']]
+            for edge in node['edges']:
+                target = compact._node(edge['target'])
+                if target == len(adjacency):
+                    adjacency.append([])
+                adjacency[source].append((target, compact._edge(edge['id'], edge.get('keywords'))))
+        compact._build(adjacency)
+        return compact
+
+    @property
+    def edge_count(self):
+        return len(self.targets) + self.delta_size
+
+    def _node(self, node_id: str, page_id: str = None):
+        index = self.node_index.get(node_id)
+        if index is None:
+            index = self.node_index[node_id] = len(self.node_ids)
+            self.node_ids.append(node_id)
+            self.node_pages.append(page_id)
+        elif page_id is not None:
+            self.node_pages[index] = page_id
+        return index
+
+    def _edge(self, edge_id: str, keywords: list = None):
+        index = self.edge_index.get(edge_id)
+        if index is None:
+            index = self.edge_index[edge_id] = len(self.edge_ids)
+            self.edge_ids.append(edge_id)
+            self.edge_keywords.append(())
+        if keywords is not None:
+            self.edge_keywords[index] = tuple(sorted({
+                self.keyword_index.setdefault(keyword.lower(), len(self.keyword_index)) for keyword in keywords}))
+        return index
+
+    def _build(self, adjacency: list):
+        offsets, targets, edges = array('i', [0]), array('i'), array('i')
+        for entries in adjacency:
+            for target, edge in entries:
+                targets.append(target)
+                edges.append(edge)
+            offsets.append(len(targets))
+        self.offsets, self.targets, self.edges = offsets, targets, edges
+        self.added, self.removed, self.delta_size = {}, set(), 0
+
+    def compact(self):
+        """
+        Merges the delta into the CSR arrays
+
+        :return: None
+        """
+        adjacency = [list(self.neighbors(source)) if source not in self.removed_nodes else []
+                     for source in range(len(self.node_ids))]
+        self._build(adjacency)
+
+    def _maybe_compact(self):
+        if self.delta_size > max(64, self.compact_ratio * len(self.targets)):
+            self.compact()
+
+    def neighbors(self, source: int, keyword: int = None):
+        """
+        Yields the outgoing edges of a node
+
+        :param source: int, The integer id of the node
+        :param keyword: int, The integer id of a keyword, which the followed edges have to carry
+        :return: generator, yielding (target, edge) tuples of integer ids
+        """
+        if source + 1 < len(self.offsets):
+            for position in range(self.offsets[source], self.offsets[source + 1]):
+                target, edge = self.targets[position], self.edges[position]
+                if (source, target, edge) in self.removed or target in self.removed_nodes:
+                    continue
+                if keyword is None or keyword in self.edge_keywords[edge]:
+                    yield target, edge
+        for target, edge in self.added.get(source, ()):
+            if target not in self.removed_nodes and (keyword is None or keyword in self.edge_keywords[edge]):
+                yield target, edge
+
+    def add_node(self, node_id: str, page_id: str = None):
+        self._node(node_id, page_id)
+
+    def remove_node(self, node_id: str):
+        # The integer id is retired, so a node created again with the same id starts without edges
+        index = self.node_index.pop(node_id, None)
+        if index is not None:
+            self.removed_nodes.add(index)
+            self.delta_size += 1
+            self._maybe_compact()
+
+    def add_edge(self, edge_id: str, source: str, target: str, keywords: list = None):
+        entry = (self._node(target), self._edge(edge_id, keywords))
+        source = self._node(source)
+        self.removed.discard((source,) + entry)
+        entries = self.added.setdefault(source, [])
+        if entry not in entries:
+            entries.append(entry)
+            self.delta_size += 1
+        self._maybe_compact()
+
+    def remove_edge(self, edge_id: str, source: str, target: str):
+        if source not in self.node_index or target not in self.node_index or edge_id not in self.edge_index:
+            return
+        source, entry = self.node_index[source], (self.node_index[target], self.edge_index[edge_id])
+        entries = self.added.get(source)
+        if entries and entry in entries:
+            entries.remove(entry)
+            self.delta_size -= 1
+        else:
+            self.removed.add((source,) + entry)
+            self.delta_size += 1
+            self._maybe_compact()
+
+    def keyword(self, keyword: str):
+        """
+        Maps a keyword to its integer id
+
+        :param keyword: str, The keyword
+        :return: int, The id of the keyword, -1 if no edge carries it, None if no keyword is given
+        """
+        if keyword is None:
+            return None
+        return self.keyword_index.get(keyword.lower(), -1)
+
+    def neighborhood(self, node_id: str, depth: int = 1, keyword: str = None):
+        """
+        Finds all nodes reachable from a node within the given number of hops
+
+        :param node_id: str, The id of the start node
+        :param depth: int, The maximum number of hops
+        :param keyword: str, Only follow edges carrying this keyword
+        :return: list, The ids of the reached nodes in breadth first order, starting with the start node
+        """
+        start = self.node_index.get(node_id)
+        if start is None or start in self.removed_nodes:
+            return []
+        keyword = self.keyword(keyword)
+        seen = bytearray(len(self.node_ids))
+        seen[start] = 1
+        order, frontier = [start], [start]
+        for _ in range(depth):
+            next_frontier = []
+            for source in frontier:
+                for target, _edge in self.neighbors(source, keyword):
+                    if not seen[target]:
+                        seen[target] = 1
+                        next_frontier.append(target)
+            if not next_frontier:
+                break
+            order.extend(next_frontier)
+            frontier = next_frontier
+        return [self.node_ids[index] for index in order]
+
+    def shortest_path(self, source_id: str, target_id: str, keyword: str = None):
+        """
+        Finds a shortest path between two nodes
+
+        :param source_id: str, The id of the start node
+        :param target_id: str, The id of the end node
+        :param keyword: str, Only follow edges carrying this keyword
+        :return: list, The ids of the nodes on the path including both ends, empty if there is none
+        """
+        source, target = self.node_index.get(source_id), self.node_index.get(target_id)
+        if source is None or target is None or source in self.removed_nodes or target in self.removed_nodes:
+            return []
+        keyword = self.keyword(keyword)
+        parents = array('i', [-1]) * len(self.node_ids)
+        parents[source] = source
+        queue = deque([source])
+        while queue and parents[target] == -1:
+            current = queue.popleft()
+            for neighbor, _edge in self.neighbors(current, keyword):
+                if parents[neighbor] == -1:
+                    parents[neighbor] = current
+                    queue.append(neighbor)
+        if parents[target] == -1:
+            return []
+        path = [target]
+        while path[-1] != source:
+            path.append(parents[path[-1]])
+        return [self.node_ids[index] for index in reversed(path)]
+
+    def node(self, node_id: str):
+        """
+        Returns a node as resolvers expect it
+
+        :param node_id: str, The id of the node
+        :return: dict, The node without its edges
+        """
+        node = {'id': node_id, 'graph': self.graph_id}
+        page = self.node_pages[self.node_index[node_id]]
+        if page:
+            node['page'] = page
+        return node
+
+
+class GraphIndex:
+    """
+    Process wide registry of CompactGraphs, loaded on first use from the GraphStore and kept up to date by its
+    mutations. Graphs are evicted least recently used first when the total number of edges exceeds the budget.
+
+    Processes sharing the log file (e.g. uvicorn workers) append the mutations of their GraphStore to it and
+    apply the mutations of the others before answering a query. Graphs written without the GraphStore mutations,
+    e.g. by an import, and all graphs after a rotation of the log are loaded again on their next use.
+    """
+
+    def __init__(self, store: GraphStore, max_edges: int = 2000000, log_path: str = None,
+                 log_max_size: int = 16 << 20):
+        """
+
+        :param store: GraphStore, The store to load the graphs from, its mutations are applied to loaded graphs
+        :param max_edges: int, The budget of edges kept in memory over all graphs
+        :param log_path: str, The mutation log shared with other processes, None for a single process
+        :param log_max_size: int, The size in bytes after which the log is rotated
+        """
+        self.store = store
+        self.max_edges = max_edges
+        self.graphs = OrderedDict()
+        self.node_graphs = {}
+        self.log = ChangeLog(log_path, log_max_size) if log_path else None
+        self._lock = threading.RLock()
+        if self.log is not None:
+            # Graphs are loaded after this point, so they hold every mutation logged before
+            self.log.mark()
+        store.add_listener(self)
+
+    def sync(self):
+        """
+        Applies the mutations other processes logged since the last sync to the loaded graphs
+
+        :return: None
+        """
+        if self.log is None or not self.log.changed():
+            return
+        with self._lock:
+            records = self.log.read()
+            if records is None:
+                self.graphs.clear()
+                self.node_graphs.clear()
+                return
+            pid = os.getpid()
+            for record in records:
+                if record['pid'] != pid:
+                    self._apply(record)
+
+    def graph(self, graph_id: str):
+        """
+        Returns the index of a graph, loading it if required
+
+        :param graph_id: str, The id of the graph
+        :return: CompactGraph, The index of the graph or None if the graph does not exist
+        """
+        self.sync()
+        with self._lock:
+            if graph_id in self.graphs:
+                self.graphs.move_to_end(graph_id)
+                return self.graphs[graph_id]
+        graph = self.store.load_graph(graph_id)
+        if graph is None:
+            return None
+        compact = CompactGraph.from_graph(graph)
+        with self._lock:
+            self.graphs[graph_id] = compact
+            for node_id in compact.node_ids:
+                self.node_graphs[node_id] = graph_id
+            self._evict()
+        return compact
+
+    def graph_of(self, node_id: str):
+        """
+        Returns the index of the graph a node belongs to
+
+        :param node_id: str, The id of the node
+        :return: CompactGraph, The index of the graph or None if the node does not exist
+        """
+        self.sync()
+        graph_id = self.node_graphs.get(node_id)
+        if graph_id is None:
+            node = self.store.get_node(node_id)
+            if node is None:
+                return None
+            graph_id = node['graph']
+        return self.graph(graph_id)
+
+    def neighborhood(self, node_id: str, depth: int = 1, keyword: str = None):
+        graph = self.graph_of(node_id)
+        if graph is None:
+            return []
+        with self._lock:
+            return [graph.node(found) for found in graph.neighborhood(node_id, depth, keyword)]
+
+    def shortest_path(self, source_id: str, target_id: str, keyword: str = None):
+        graph = self.graph_of(source_id)
+        if graph is None:
+            return []
+        with self._lock:
+            return [graph.node(found) for found in graph.shortest_path(source_id, target_id, keyword)]
+
+    def _evict(self):
+        total = sum(graph.edge_count for graph in self.graphs.values())
+        while total > self.max_edges and len(self.graphs) > 1:
+            graph_id = next(iter(self.graphs))
+            total -= self.graphs[graph_id].edge_count
+            self._drop(graph_id)
+
+    def _drop(self, graph_id: str):
+        graph = self.graphs.pop(graph_id, None)
+        if graph is not None:
+            for node_id in graph.node_ids:
+                if self.node_graphs.get(node_id) == graph_id:
+                    del self.node_graphs[node_id]
+
+    def _apply(self, record: dict):
+        """
+        Applies a mutation to the graph it belongs to, if it is loaded
+
+        :param record: dict, The mutation with its op, graph and the ids of its node or edge
+        :return: None
+        """
+        with self._lock:
+            op, graph_id = record['op'], record['graph']
+            graph = self.graphs.get(graph_id)
+            if op == 'invalidate_graph':
+                self._drop(graph_id)
+            elif op == 'put_node':
+                if graph is not None:
+                    graph.add_node(record['node'], record.get('page'))
+                    self.node_graphs[record['node']] = graph_id
+            elif op == 'delete_node':
+                if graph is not None:
+                    graph.remove_node(record['node'])
+                self.node_graphs.pop(record['node'], None)
+            elif graph is not None and op == 'put_edge':
+                graph.add_edge(record['edge'], record['source'], record['target'], record.get('keywords'))
+            elif graph is not None and op == 'delete_edge':
+                graph.remove_edge(record['edge'], record['source'], record['target'])
+
+    def _mutate(self, record: dict):
+        self._apply(record)
+        if self.log is not None:
+            self.log.append([dict(record, pid=os.getpid())])
+
+    # GraphStore listener, mutations are applied to graphs, which are already loaded
+    def on_put_node(self, graph_id: str, node_id: str, page_id: str):
+        self._mutate({'op': 'put_node', 'graph': graph_id, 'node': node_id, 'page': page_id})
+
+    def on_delete_node(self, graph_id: str, node_id: str):
+        self._mutate({'op': 'delete_node', 'graph': graph_id, 'node': node_id})
+
+    def on_put_edge(self, graph_id: str, edge_id: str, source: str, target: str, keywords: list = None,
+                    name: str = None):
+        self._mutate({'op': 'put_edge', 'graph': graph_id, 'edge': edge_id, 'source': source, 'target': target,
+                      'keywords': list(keywords) if keywords is not None else None})
+
+    def on_delete_edge(self, graph_id: str, edge_id: str, source: str, target: str, last: bool = True):
+        self._mutate({'op': 'delete_edge', 'graph': graph_id, 'edge': edge_id, 'source': source, 'target': target})
+
+    def on_invalidate_graph(self, graph_id: str):
+        self._mutate({'op': 'invalidate_graph', 'graph': graph_id})
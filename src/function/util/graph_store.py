@@ -0,0 +1,423 @@
+"""
+Adjacency List Storage Module for Graphs, Nodes and Edges
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from .storage import Storage
+
+BY_ID_INDEX = 'by-id'
+INVERTED_INDEX = 'inverted'
+
+# Single table layout, every row of a graph shares the partition key GRAPH#<graph id>:
+#   graph row: sk = GRAPH#<graph id>
+#   node row:  sk = NODE#<node id>
+#   edge row:  sk = EDGE#<source node id>#<target node id>#<edge id>, one row per connected pair of nodes
+# The by-id index finds any row by its id, the sparse inverted index finds the edges pointing to a node.
+GRAPH_TABLE = {
+    'attribute_definitions': [
+        {'AttributeName': 'pk', 'AttributeType': 'S'},
+        {'AttributeName': 'sk', 'AttributeType': 'S'},
+        {'AttributeName': 'id', 'AttributeType': 'S'},
+        {'AttributeName': 'target_pk', 'AttributeType': 'S'},
+    ],
+    'key_schema': [
+        {'AttributeName': 'pk', 'KeyType': 'HASH'},
+        {'AttributeName': 'sk', 'KeyType': 'RANGE'},
+    ],
+    'global_secondary_indexes': [
+        {
+            'IndexName': BY_ID_INDEX,
+            'KeySchema': [
+                {'AttributeName': 'id', 'KeyType': 'HASH'},
+                {'AttributeName': 'sk', 'KeyType': 'RANGE'},
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+        },
+        {
+            'IndexName': INVERTED_INDEX,
+            'KeySchema': [
+                {'AttributeName': 'target_pk', 'KeyType': 'HASH'},
+                {'AttributeName': 'sk', 'KeyType': 'RANGE'},
+            ],
+            'Projection': {'ProjectionType': 'ALL'},
+        },
+    ],
+    'billing_mode': 'PAY_PER_REQUEST',
+}
+
+GRAPH_SCHEMA = {'pk': 'S', 'sk': 'S', 'id': 'S', 'type': 'S', 'graph': 'S', 'page': 'S', 'source': 'S',
+                'target': 'S', 'target_pk': 'S', 'name': 'S', 'keywords': 'L'}
+
+KEY_ATTRIBUTES = ('pk', 'sk', 'target_pk')
+
+
+def graph_key(graph_id: str):
+    return f'GRAPH#{graph_id}'
+
+
+def node_key(node_id: str):
+    return f'NODE#{node_id}'
+
+
+def edge_key(edge_id: str, source: str, target: str):
+    return f'EDGE#{source}#{target}#{edge_id}'
+
+
+def strip_keys(row: dict):
+    """
+    Removes the layout attributes of a row
+
+    :param row: dict, The row read from the table
+    :return: dict, The entity stored in the row
+    """
+    return {k: v for k, v in row.items() if k not in KEY_ATTRIBUTES}
+
+
+class GraphStore:
+    """
+    Stores Graphs, Nodes and Edges in a single adjacency list table, so a whole graph loads with one paginated Query
+    """
+
+    def __init__(self, storage: Storage, table_name: str):
+        """
+
+        :param storage: Storage, The storage the table lives in
+        :param table_name: str, The name of the graph table
+        """
+        self.storage = storage
+        self.table_name = table_name
+        self.listeners = []
+        storage.codec.set_schema(table_name, GRAPH_SCHEMA)
+
+    def add_listener(self, listener):
+        """
+        Registers an object, which is notified after every write with on_put_node, on_delete_node,
+        on_put_edge, on_delete_edge and on_invalidate_graph.
+        on_delete_edge gets the keyword last, whether no row of the edge is left.
+
+        :param listener: The object to notify
+        :return: None
+        """
+        self.listeners.append(listener)
+
+    def bootstrap(self):
+        """
+        Creates the graph table and its indexes, if it does not exist yet
+
+        :return: bool, True if the table was created
+        """
+        if self.table_name in self.storage.list_tables():
+            return False
+        self.storage.create_table(self.table_name, **GRAPH_TABLE)
+        self.storage.db.get_waiter('table_exists').wait(TableName=self.table_name)
+        return True
+
+    def migrate(self, graph_table: str, node_table: str, edge_table: str):
+        """
+        Copies graphs stored in the legacy per entity tables into the adjacency list table.
+        Legacy graph rows reference their nodes by id and node rows their edges by id,
+        an edge referenced by multiple nodes of a graph connects each pair of them.
+
+        :param graph_table: str, The name of the legacy graph table
+        :param node_table: str, The name of the legacy node table
+        :param edge_table: str, The name of the legacy edge table
+        :return: int, The number of rows written
+        """
+        rows = []
+        for graph in self.storage.iter_scan(graph_table):
+            graph_id = graph['id']
+            rows.append(self._graph_row(graph_id, {k: v for k, v in graph.items() if k != 'nodes'}))
+            nodes = [node for node in self.storage.batch_get_items(
+                node_table, [{'id': node_id} for node_id in graph.get('nodes') or []]) if node]
+            edge_ids = {edge_id for node in nodes for edge_id in node.get('edges') or []}
+            edges = {edge['id']: edge for edge in self.storage.batch_get_items(
+                edge_table, [{'id': edge_id} for edge_id in edge_ids]) if edge}
+            for node in nodes:
+                rows.append(self._node_row(graph_id, node['id'], node.get('page')))
+            for edge_id, edge in edges.items():
+                connected = [node['id'] for node in nodes if edge_id in (node.get('edges') or [])]
+                for source in connected:
+                    for target in connected:
+                        if source != target:
+                            rows.append(self._edge_row(graph_id, edge_id, source, target,
+                                                       edge.get('name'), edge.get('keywords')))
+        self.storage.batch_write_items(self.table_name, put_items=rows, key_names=['pk', 'sk'])
+        return len(rows)
+
+    def load_graph(self, graph_id: str):
+        """
+        Loads a graph with all of its nodes and their outgoing edges using one paginated Query
+
+        :param graph_id: str, The id of the graph
+        :return: dict, The graph with a list of nodes, each with a list of edges, or None if it does not exist
+        """
+        graph, nodes, edges = None, {}, []
+        for row in self.storage.iter_query(self.table_name, **self._key_condition('pk', graph_key(graph_id))):
+            if row['type'] == 'graph':
+                graph = strip_keys(row)
+            elif row['type'] == 'node':
+                nodes[row['id']] = dict(strip_keys(row), edges=[])
+            else:
+                edges.append(strip_keys(row))
+        if graph is None:
+            return None
+        for edge in edges:
+            if edge['source'] in nodes:
+                nodes[edge['source']]['edges'].append(edge)
+        graph['nodes'] = list(nodes.values())
+        return graph
+
+    def rows(self, graph_id: str):
+        """
+        Yields the rows of a graph as stored, including the layout attributes, e.g. for exports
+
+        :param graph_id: str, The id of the graph
+        :return: generator, yielding the graph row, the node rows and the edge rows
+        """
+        return self.storage.iter_query(self.table_name, **self._key_condition('pk', graph_key(graph_id)))
+
+    def get_node(self, node_id: str):
+        """
+        Loads a node with its outgoing edges
+
+        :param node_id: str, The id of the node
+        :return: dict, The node or None if it does not exist
+        """
+        node = next(self.storage.iter_query(self.table_name, max_items=1, index_name=BY_ID_INDEX,
+                                            **self._key_condition('id', node_id)), None)
+        if node is None or node['type'] != 'node':
+            return None
+        node = strip_keys(node)
+        node['edges'] = self.outgoing_edges(node['graph'], node_id)
+        return node
+
+    def get_edge(self, edge_id: str):
+        """
+        Loads an edge
+
+        :param edge_id: str, The id of the edge
+        :return: dict, The edge with the lists of the nodes it connects or None if it does not exist
+        """
+        rows = list(self.storage.iter_query(self.table_name, index_name=BY_ID_INDEX,
+                                            **self._key_condition('id', edge_id)))
+        rows = [strip_keys(row) for row in rows if row['type'] == 'edge']
+        if not rows:
+            return None
+        edge = dict(rows[0])
+        edge['sources'] = sorted({row['source'] for row in rows})
+        edge['targets'] = sorted({row['target'] for row in rows})
+        return edge
+
+    def get_edges(self, edge_ids: list):
+        """
+        Loads multiple edges with concurrent queries, as BatchGetItem cannot read the by-id index
+
+        :param edge_ids: list, The ids of the edges
+        :return: list, The edges in the order of the ids, None for edges which do not exist
+        """
+        return self._concurrently(self.get_edge, edge_ids)
+
+    def outgoing_edges(self, graph_id: str, node_id: str):
+        """
+        Loads the edges starting at a node
+
+        :param graph_id: str, The id of the graph the node belongs to
+        :param node_id: str, The id of the node
+        :return: list, The edges
+        """
+        return [strip_keys(row) for row in self.storage.iter_query(
+            self.table_name,
+            key_condition_expression='pk = :pk AND begins_with(sk, :prefix)',
+            expression_attribute_values={':pk': self.storage.codec.serialize(graph_key(graph_id)),
+                                         ':prefix': self.storage.codec.serialize(f'EDGE#{node_id}#')})]
+
+    def incoming_edges(self, node_id: str):
+        """
+        Loads the edges pointing to a node using the inverted index
+
+        :param node_id: str, The id of the node
+        :return: list, The edges
+        """
+        return [strip_keys(row) for row in self.storage.iter_query(
+            self.table_name, index_name=INVERTED_INDEX, **self._key_condition('target_pk', node_key(node_id)))]
+
+    def scan(self, row_type: str, contains: dict = None, **equals):
+        """
+        Scans all rows of a type, optionally filtered by their attributes
+
+        :param row_type: str, The type of the rows: graph, node or edge
+        :param contains: dict, Attributes, which have to contain the given value
+        :param equals: Attributes, which have to be equal to the given value
+        :return: generator, yielding the entities
+        """
+        conditions, names = ['#type = :type'], {'#type': 'type'}
+        values = {':type': self.storage.codec.serialize(row_type)}
+        for i, (attribute, value) in enumerate(equals.items()):
+            if value is not None:
+                conditions.append(f'#eq{i} = :eq{i}')
+                names[f'#eq{i}'] = attribute
+                values[f':eq{i}'] = self.storage.codec.serialize(value)
+        for i, (attribute, value) in enumerate((contains or {}).items()):
+            if value is not None:
+                conditions.append(f'contains(#ct{i}, :ct{i})')
+                names[f'#ct{i}'] = attribute
+                values[f':ct{i}'] = self.storage.codec.serialize(value)
+        for row in self.storage.iter_scan(self.table_name,
+                                          filter_expression=' AND '.join(conditions),
+                                          expression_attribute_names=names,
+                                          expression_attribute_values=values):
+            yield strip_keys(row)
+
+    def put_graph(self, graph_id: str, **attributes):
+        """
+        Creates or replaces the row of a graph
+
+        :param graph_id: str, The id of the graph
+        :param attributes: Further attributes of the graph
+        :return: None
+        """
+        self.storage.create_item(self.table_name, self._graph_row(graph_id, attributes))
+
+    def put_node(self, graph_id: str, node_id: str, page_id: str):
+        """
+        Creates or replaces the row of a node
+
+        :param graph_id: str, The id of the graph the node belongs to
+        :param node_id: str, The id of the node
+        :param page_id: str, The id of the PageVersion the node represents
+        :return: None
+        """
+        self.storage.create_item(self.table_name, self._node_row(graph_id, node_id, page_id))
+        for listener in self.listeners:
+            listener.on_put_node(graph_id, node_id, page_id)
+
+    def put_edge(self, graph_id: str, edge_id: str, source: str, target: str, name: str = None, keywords: list = None):
+        """
+        Creates or replaces the row of an edge between two nodes
+
+        :param graph_id: str, The id of the graph the nodes belong to
+        :param edge_id: str, The id of the edge
+        :param source: str, The id of the node the edge starts at
+        :param target: str, The id of the node the edge points to
+        :param name: str, The name of the edge
+        :param keywords: list, The keywords of the edge
+        :return: None
+        """
+        self.storage.create_item(self.table_name, self._edge_row(graph_id, edge_id, source, target, name, keywords))
+        for listener in self.listeners:
+            listener.on_put_edge(graph_id, edge_id, source, target, keywords, name)
+
+    def delete_edge(self, graph_id: str, edge_id: str, source: str, target: str):
+        """
+        Deletes the row of an edge between two nodes
+
+        :param graph_id: str, The id of the graph the nodes belong to
+        :param edge_id: str, The id of the edge
+        :param source: str, The id of the node the edge starts at
+        :param target: str, The id of the node the edge points to
+        :return: None
+        """
+        key = {'pk': graph_key(graph_id), 'sk': edge_key(edge_id, source, target)}
+        self.storage.delete_item(self.table_name, key)
+        removed = self._removed_edges({edge_id: [key]}) if self.listeners else set()
+        for listener in self.listeners:
+            listener.on_delete_edge(graph_id, edge_id, source, target, last=edge_id in removed)
+
+    def invalidate_graph(self, graph_id: str):
+        """
+        Notifies the listeners, that the rows of a graph were written in bulk instead of with put_node and put_edge
+
+        :param graph_id: str, The id of the graph
+        :return: None
+        """
+        for listener in self.listeners:
+            listener.on_invalidate_graph(graph_id)
+
+    def delete_node(self, graph_id: str, node_id: str):
+        """
+        Deletes a node together with all edges starting at or pointing to it.
+        The listeners are notified of every deleted edge row before the node.
+
+        :param graph_id: str, The id of the graph the node belongs to
+        :param node_id: str, The id of the node
+        :return: None
+        """
+        keys, edges = {node_key(node_id): {'pk': graph_key(graph_id), 'sk': node_key(node_id)}}, {}
+        # The inverted index spans all graphs, a self-loop is both an outgoing and an incoming edge
+        incoming = [edge for edge in self.incoming_edges(node_id) if edge.get('graph') == graph_id]
+        for edge in self.outgoing_edges(graph_id, node_id) + incoming:
+            sk = edge_key(edge['id'], edge['source'], edge['target'])
+            keys[sk], edges[sk] = {'pk': graph_key(graph_id), 'sk': sk}, edge
+        self.storage.batch_write_items(self.table_name, delete_keys=list(keys.values()))
+        deleted = {}
+        for sk, edge in edges.items():
+            deleted.setdefault(edge['id'], []).append(keys[sk])
+        removed = self._removed_edges(deleted) if self.listeners else set()
+        for listener in self.listeners:
+            for edge in edges.values():
+                listener.on_delete_edge(graph_id, edge['id'], edge['source'], edge['target'],
+                                        last=edge['id'] in removed)
+            listener.on_delete_node(graph_id, node_id)
+
+    def _removed_edges(self, deleted: dict):
+        """
+        Checks which edges lost their last row. The by-id index is eventually consistent and may still return
+        deleted rows, so the rows the deleting call removed are left out and the others are read again consistently.
+
+        :param deleted: dict, The id of every edge mapped to the keys of its deleted rows
+        :return: set, The ids of the edges without rows
+        """
+        def candidates(edge_id):
+            gone = {(key['pk'], key['sk']) for key in deleted[edge_id]}
+            return [{'pk': row['pk'], 'sk': row['sk']} for row in self.storage.iter_query(
+                self.table_name, index_name=BY_ID_INDEX, **self._key_condition('id', edge_id))
+                if row['type'] == 'edge' and (row['pk'], row['sk']) not in gone]
+
+        edge_ids = list(deleted)
+        keys = [key for found in self._concurrently(candidates, edge_ids) for key in found]
+        rows = self.storage.batch_get_items(self.table_name, keys, consistent_read=True, projection_expression='#id',
+                                            expression_attribute_names={'#id': 'id'}) if keys else []
+        remaining = {row['id'] for row in rows if row is not None}
+        return {edge_id for edge_id in edge_ids if edge_id not in remaining}
+
+    def _concurrently(self, fn, values: list):
+        """
+        Calls a function for every value, concurrently if there is more than one
+
+        :param fn: callable, The function, e.g. a query
+        :param values: list, The arguments of the calls
+        :return: list, The results in the order of the values
+        """
+        if len(values) <= 1:
+            return [fn(value) for value in values]
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=min(self.storage.max_workers, len(values))) as executor:
+            return list(executor.map(lambda value: context.copy().run(fn, value), values))
+
+    def _key_condition(self, attribute: str, value: str):
+        return {
+            'key_condition_expression': '#key = :key',
+            'expression_attribute_names': {'#key': attribute},
+            'expression_attribute_values': {':key': self.storage.codec.serialize(value)}
+        }
+
+    @staticmethod
+    def _graph_row(graph_id: str, attributes: dict):
+        return dict(attributes, pk=graph_key(graph_id), sk=graph_key(graph_id), id=graph_id, type='graph')
+
+    @staticmethod
+    def _node_row(graph_id: str, node_id: str, page_id: str):
+        row = {'pk': graph_key(graph_id), 'sk': node_key(node_id), 'id': node_id, 'type': 'node', 'graph': graph_id}
+        if page_id:
+            row['page'] = page_id
+        return row
+
+    @staticmethod
+    def _edge_row(graph_id: str, edge_id: str, source: str, target: str, name: str = None, keywords: list = None):
+        row = {'pk': graph_key(graph_id), 'sk': edge_key(edge_id, source, target), 'id': edge_id, 'type': 'edge',
+               'graph': graph_id, 'source': source, 'target': target, 'target_pk': node_key(target)}
+        if name is not None:
+            row['name'] = name
+        if keywords is not None:
+            row['keywords'] = list(keywords)
+        return row
@@ -0,0 +1,174 @@
+"""
+Length prefixed frames over unix sockets, which the processes of one host exchange messages with
+"""
+import asyncio
+import os
+import socket
+import struct
+import threading
+import time
+
+HEADER = struct.Struct('>I')
+PUBLISHER = b'P'
+SUBSCRIBER = b'S'
+
+
+async def read_frame(reader: asyncio.StreamReader):
+    """
+    Reads a length prefixed frame
+
+    :param reader: asyncio.StreamReader, The connection to read from
+    :return: bytes, The payload of the frame
+    :raises asyncio.IncompleteReadError: If the connection closed
+    """
+    size, = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return await reader.readexactly(size)
+
+
+def frame(payload: bytes):
+    """
+    Prefixes a payload with its length
+
+    :param payload: bytes, The payload
+    :return: bytes, The frame
+    """
+    return HEADER.pack(len(payload)) + payload
+
+
+class IPCHub:
+    """
+    Fans the frames of all publishers out to all subscribers over a unix socket, so the workers of a single host
+    share their broadcasts without an outside broker. Subscribers, which do not keep up, are disconnected
+    instead of buffering without limit, they reconnect on their own.
+    """
+
+    def __init__(self, path: str, max_buffer: int = 16 * 1024 * 1024):
+        """
+
+        :param path: str, The path of the unix socket
+        :param max_buffer: int, The number of bytes buffered per subscriber before it is disconnected
+        """
+        self.path = path
+        self.max_buffer = max_buffer
+        self.subscribers = set()
+        self.server = None
+
+    async def start(self):
+        """
+        Starts listening on the unix socket, a stale socket file of a previous run is replaced
+
+        :return: None
+        """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.server = await asyncio.start_unix_server(self._connection, self.path)
+
+    async def serve_forever(self):
+        """
+        Starts the hub and serves until cancelled
+
+        :return: None
+        """
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            role = await reader.readexactly(1)
+            if role == SUBSCRIBER:
+                self.subscribers.add(writer)
+                # Subscribers never send, wait until they close the connection
+                await reader.read()
+                return
+            while True:
+                payload = await read_frame(reader)
+                self.publish(frame(payload))
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Connections are cancelled, when the hub shuts down
+            pass
+        finally:
+            self.subscribers.discard(writer)
+            writer.close()
+
+    def publish(self, data: bytes):
+        """
+        Sends a frame to all subscribers
+
+        :param data: bytes, The frame
+        :return: None
+        """
+        for subscriber in list(self.subscribers):
+            if subscriber.transport.get_write_buffer_size() > self.max_buffer:
+                self.subscribers.discard(subscriber)
+                subscriber.close()
+            else:
+                subscriber.write(data)
+
+
+class IPCPublisher:
+    """
+    Blocking, thread safe publisher of an IPCHub for processes without an event loop, e.g. the GraphQL server.
+    Publishing never raises, frames are dropped while the hub is unreachable.
+    """
+
+    def __init__(self, path: str, timeout: float = 1.0, retry_interval: float = 1.0):
+        """
+
+        :param path: str, The path of the unix socket of the hub
+        :param timeout: float, The seconds a send may block
+        :param retry_interval: float, The seconds to wait after a failed connection before trying again
+        """
+        self.path = path
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._socket = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def publish(self, payload: bytes):
+        """
+        Sends a payload to the subscribers of the hub
+
+        :param payload: bytes, The payload
+        :return: bool, Whether the payload was sent
+        """
+        data = frame(payload)
+        with self._lock:
+            for _attempt in range(2):
+                try:
+                    if self._socket is None:
+                        self._connect()
+                    if self._socket is None:
+                        return False
+                    self._socket.sendall(data)
+                    return True
+                except OSError:
+                    self.close()
+            return False
+
+    def close(self):
+        """
+        Closes the connection to the hub, the next publish reconnects
+
+        :return: None
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _connect(self):
+        now = time.monotonic()
+        if now < self._retry_at:
+            return
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(self.timeout)
+        try:
+            connection.connect(self.path)
+            connection.sendall(PUBLISHER)
+        except OSError:
+            connection.close()
+            self._retry_at = now + self.retry_interval
+            return
+        self._socket = connection
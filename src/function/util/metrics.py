@@ -0,0 +1,228 @@
+"""
+Metrics Module collecting latency and consumed capacity of the Storage
+"""
+import bisect
+import contextvars
+import threading
+import time
+from inspect import isawaitable
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+READ_OPERATIONS = ('GetItem', 'BatchGetItem', 'Query', 'Scan', 'TransactGetItems')
+
+# The GraphQL field (e.g. Query.notebooks) currently being resolved, storage calls are attributed to it
+current_field = contextvars.ContextVar('current_field', default=None)
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        """
+
+        :param buckets: tuple, The sorted upper bounds of the buckets
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """
+        Records a single value
+
+        :param value: float, The value to record
+        :return: None
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Returns the cumulative counts per bucket, including the +Inf bucket
+
+        :return: list, A list of (upper bound, count) tuples
+        """
+        total, result = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics:
+    """
+    Thread safe registry of the storage metrics, labeled by table, operation and GraphQL field
+    """
+
+    COUNTERS = ('calls', 'items', 'consumed_rcu', 'consumed_wcu', 'retries', 'throttles', 'errors')
+
+    def __init__(self, prefix: str = 'hyperwiki_storage'):
+        """
+
+        :param prefix: str, The prefix of all metric names
+        """
+        self.prefix = prefix
+        self.latency = {}
+        self.counters = {name: {} for name in self.COUNTERS}
+        self._lock = threading.Lock()
+
+    def observe(self, table: str, operation: str, seconds: float,
+                items: int = 0, rcu: float = 0, wcu: float = 0,
+                retries: int = 0, throttled: bool = False, error: bool = False,
+                field: str = None):
+        """
+        Records a single storage call
+
+        :param table: str, The name of the table
+        :param operation: str, The name of the DynamoDB operation
+        :param seconds: float, The latency of the call including retries
+        :param items: int, The number of items returned or written
+        :param rcu: float, The consumed read capacity units
+        :param wcu: float, The consumed write capacity units
+        :param retries: int, The number of retries of the client
+        :param throttled: bool, Whether the call was throttled
+        :param error: bool, Whether the call failed
+        :param field: str, The GraphQL field that triggered the call, defaults to the current field
+        :return: None
+        """
+        labels = (table or '', operation, field if field is not None else current_field.get() or '')
+        with self._lock:
+            histogram = self.latency.get(labels)
+            if histogram is None:
+                histogram = self.latency[labels] = Histogram()
+            histogram.observe(seconds)
+            for name, value in (('calls', 1), ('items', items), ('consumed_rcu', rcu), ('consumed_wcu', wcu),
+                                ('retries', retries), ('throttles', int(throttled)), ('errors', int(error))):
+                if value:
+                    self.counters[name][labels] = self.counters[name].get(labels, 0) + value
+
+    def snapshot(self):
+        """
+        Returns a copy of all metrics
+
+        :return: dict, The counters and latency histograms keyed by (table, operation, field)
+        """
+        with self._lock:
+            return {
+                'latency': {labels: (h.cumulative(), h.sum, h.count) for labels, h in self.latency.items()},
+                'counters': {name: dict(values) for name, values in self.counters.items()}
+            }
+
+    def render(self):
+        """
+        Renders all metrics in the Prometheus text exposition format
+
+        :return: str, The rendered metrics
+        """
+        snapshot = self.snapshot()
+        lines = [f'# TYPE {self.prefix}_latency_seconds histogram']
+        for labels, (buckets, total, count) in sorted(snapshot['latency'].items()):
+            label_text = self._labels(labels)
+            for bound, value in buckets:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.prefix}_latency_seconds_bucket{{{label_text},le="{le}"}} {value}')
+            lines.append(f'{self.prefix}_latency_seconds_sum{{{label_text}}} {total}')
+            lines.append(f'{self.prefix}_latency_seconds_count{{{label_text}}} {count}')
+        for name, values in snapshot['counters'].items():
+            lines.append(f'# TYPE {self.prefix}_{name}_total counter')
+            for labels, value in sorted(values.items()):
+                lines.append(f'{self.prefix}_{name}_total{{{self._labels(labels)}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _labels(labels: tuple):
+        table, operation, field = (str(value).replace('\\', '\\\\').replace('"', '\\"') for value in labels)
+        return f'table="{table}",operation="{operation}",field="{field}"'
+
+    def instrument(self, client):
+        """
+        Registers event handlers on a boto3 DynamoDB client, which record every call it makes
+
+        :param client: The boto3 client
+        :return: None
+        """
+        events = client.meta.events
+        events.register('provide-client-params.dynamodb', self._request_capacity)
+        events.register('before-call.dynamodb', self._before_call)
+        events.register('after-call.dynamodb', self._after_call)
+        events.register('after-call-error.dynamodb', self._after_call_error)
+
+    @staticmethod
+    def _request_capacity(params, model, context, **kwargs):
+        if 'ReturnConsumedCapacity' in model.input_shape.members:
+            params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+        context['metrics_table'] = params.get('TableName') or next(iter(params.get('RequestItems') or ()), None)
+        context['metrics_operation'] = model.name
+
+    @staticmethod
+    def _before_call(params, context, **kwargs):
+        context['metrics_start'] = time.perf_counter()
+
+    def _after_call(self, http_response, parsed, model, context, **kwargs):
+        seconds = time.perf_counter() - context.get('metrics_start', time.perf_counter())
+        error = parsed.get('Error', {}).get('Code')
+        capacities = parsed.get('ConsumedCapacity') or []
+        if isinstance(capacities, dict):
+            capacities = [capacities]
+        table = context.get('metrics_table') or (capacities[0].get('TableName') if capacities else None)
+        is_read = model.name in READ_OPERATIONS
+        rcu = wcu = 0
+        for capacity in capacities:
+            units = capacity.get('CapacityUnits', 0)
+            rcu += capacity.get('ReadCapacityUnits', units if is_read else 0)
+            wcu += capacity.get('WriteCapacityUnits', 0 if is_read else units)
+        if 'Items' in parsed:
+            items = len(parsed['Items'])
+        elif 'Responses' in parsed:
+            items = sum(len(found) for found in parsed['Responses'].values())
+        else:
+            items = int('Item' in parsed)
+        self.observe(table, model.name, seconds,
+                     items=items, rcu=rcu, wcu=wcu,
+                     retries=parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+                     throttled=error in ('ProvisionedThroughputExceededException', 'ThrottlingException',
+                                         'RequestLimitExceeded'),
+                     error=bool(error))
+
+    def _after_call_error(self, exception, context, **kwargs):
+        seconds = time.perf_counter() - context.get('metrics_start', time.perf_counter())
+        self.observe(context.get('metrics_table'), context.get('metrics_operation', ''), seconds, error=True)
+
+
+def field_middleware(resolver, obj, info, **args):
+    """
+    GraphQL middleware, which attributes the storage calls of a resolver to its field
+
+    :param resolver: callable, The resolver of the field
+    :param obj: The parent value
+    :param info: GraphQLResolveInfo, The info of the resolver
+    :param args: The arguments of the field
+    :return: The result of the resolver
+    """
+    field = f'{info.parent_type.name}.{info.field_name}'
+    token = current_field.set(field)
+    try:
+        result = resolver(obj, info, **args)
+    finally:
+        current_field.reset(token)
+    if isawaitable(result):
+        return _attributed(result, field)
+    return result
+
+
+async def _attributed(awaitable, field: str):
+    # Asynchronous resolvers continue after the middleware returned, the field is set again while they run
+    token = current_field.set(field)
+    try:
+        return await awaitable
+    finally:
+        current_field.reset(token)
+
+
+# Process wide metrics of all Storage instances
+METRICS = Metrics()
@@ -0,0 +1,317 @@
+"""
+Authorization Module with a precomputed principal -> (resource, right) index over the permissions of notebooks and
+page versions, so checking an item costs a few dictionary lookups instead of a storage read
+"""
+import threading
+from collections import OrderedDict
+from .change_log import ChangeLog
+from .storage import Storage
+
+# Every right includes the rights before it
+RIGHTS = ('read', 'write', 'control')
+LEVELS = {right: level for level, right in enumerate(RIGHTS)}
+
+# Principal every request holds, grants to it make a restricted resource readable for everyone
+EVERYONE = '*'
+
+# Entities checked by the index, their items carry these attributes besides the id
+ENTITIES = ('notebook', 'folder', 'page', 'page_version')
+ITEM_ATTRIBUTES = {'page_version': ('page',)}
+
+
+def resource(entity: str, item_id: str):
+    return f'{entity}:{item_id}'
+
+
+def parse_principals(header: str):
+    """
+    Parses the principals of a request, e.g. the user and its groups
+
+    :param header: str, The comma separated principals, may be empty
+    :return: frozenset, The principals, including EVERYONE
+    """
+    principals = {principal.strip() for principal in (header or '').split(',')}
+    principals.discard('')
+    principals.add(EVERYONE)
+    return frozenset(principals)
+
+
+class PermissionIndex:
+    """
+    Keeps the permissions of all notebooks and page versions in memory, indexed by principal.
+    A page inherits the permissions of its notebook (directly or through a folder), a page version those of its page:
+    a resource is restricted, if any resource of its chain has permissions, and accessible with the highest right
+    any of them grants. Resources without permissions in their chain are open to everyone.
+
+    The index is loaded on first use and updated incrementally by put. Processes sharing the log file
+    (e.g. uvicorn workers) append their changes to it and apply the changes of the others on sync,
+    a rotated log makes them load the index again.
+    """
+
+    def __init__(self, storage: Storage, tables: dict, log_path: str = None, log_max_size: int = 16 << 20,
+                 cache_size: int = 1024):
+        """
+
+        :param storage: Storage, The storage holding the tables
+        :param tables: dict, The table names of the entities notebook, folder and page_version
+        :param log_path: str, The change log shared with other processes, None for a single process
+        :param log_max_size: int, The size in bytes after which the log is rotated
+        :param cache_size: int, The number of principal sets whose accessible resources are cached
+        """
+        self.storage = storage
+        self.tables = tables
+        self.log = ChangeLog(log_path, log_max_size) if log_path else None
+        self.cache_size = cache_size
+        # principal -> {resource: level}, resource -> {principal: level}, child resource -> parent resource
+        self.grants = {}
+        self.acl = {}
+        self.parents = {}
+        self.children = {}
+        self.version = 0
+        self.loaded = False
+        self._views = OrderedDict()
+        self._lock = threading.RLock()
+
+    def load(self):
+        """
+        Reads the permissions and the notebook structure from the tables, replacing the index
+
+        :return: None
+        """
+        with self._lock:
+            # Changes logged while reading are read from the log afterwards, applying them twice does no harm
+            if self.log is not None:
+                self.log.mark()
+            self.grants, self.acl, self.parents, self.children = {}, {}, {}, {}
+            names = {'#id': 'id', '#permissions': 'permissions', '#pages': 'pages', '#folders': 'folders'}
+            for notebook in self.storage.iter_scan(self.tables['notebook'],
+                                                   projection_expression='#id, #permissions, #pages, #folders',
+                                                   expression_attribute_names=names):
+                self._apply('notebook', notebook)
+            for folder in self.storage.iter_scan(self.tables['folder'], projection_expression='#id, #pages',
+                                                 expression_attribute_names={'#id': 'id', '#pages': 'pages'}):
+                self._apply('folder', folder)
+            for page_version in self.storage.iter_scan(self.tables['page_version'],
+                                                       projection_expression='#id, #permissions',
+                                                       filter_expression='attribute_exists(#permissions)',
+                                                       expression_attribute_names={'#id': 'id',
+                                                                                   '#permissions': 'permissions'}):
+                self._apply('page_version', page_version)
+            self.loaded = True
+            self._changed()
+
+    def sync(self):
+        """
+        Loads the index on first use and applies the changes other processes logged since the last sync
+
+        :return: None
+        """
+        if not self.loaded:
+            with self._lock:
+                if not self.loaded:
+                    self.load()
+            return
+        if self.log is None or not self.log.changed():
+            return
+        with self._lock:
+            records = self.log.read()
+            if records is None:
+                self.load()
+                return
+            for record in records:
+                self._apply(record['entity'], record['item'])
+            if records:
+                self._changed()
+
+    def put(self, entity: str, item: dict):
+        """
+        Records the permissions and references of a written item and logs them for the other processes.
+        Only the attributes the item holds are changed, e.g. an update of the name keeps the permissions.
+
+        :param entity: str, The entity of the item
+        :param item: dict, The item as stored
+        :return: None
+        """
+        self.put_many(entity, [item])
+
+    def put_many(self, entity: str, items: list):
+        """
+        Records multiple written items of one entity, see put
+
+        :param entity: str, The entity of the items
+        :param items: list, The items as stored
+        :return: None
+        """
+        records = [{'entity': entity, 'item': self._relevant(entity, item)} for item in items]
+        records = [record for record in records if len(record['item']) > 1]
+        if not records:
+            return
+        with self._lock:
+            if self.loaded:
+                for record in records:
+                    self._apply(record['entity'], record['item'])
+                self._changed()
+            if self.log is not None:
+                self.log.append(records)
+
+    def access(self, principals: frozenset):
+        """
+        Returns the view of the index for the principals of a request
+
+        :param principals: frozenset, The principals, see parse_principals
+        :return: Access, The view checking the items of the request
+        """
+        self.sync()
+        with self._lock:
+            cached = self._views.get(principals)
+            if cached is not None and cached[0] == self.version:
+                self._views.move_to_end(principals)
+                return Access(self, cached[1])
+            allowed = {}
+            for principal in principals:
+                for granted, level in self.grants.get(principal, {}).items():
+                    if level > allowed.get(granted, -1):
+                        allowed[granted] = level
+            self._views[principals] = (self.version, allowed)
+            while len(self._views) > self.cache_size:
+                self._views.popitem(last=False)
+            return Access(self, allowed)
+
+    def _relevant(self, entity: str, item: dict):
+        keys = {'notebook': ('permissions', 'pages', 'folders'), 'folder': ('pages',),
+                'page_version': ('permissions',)}.get(entity, ())
+        relevant = {key: item[key] for key in keys if key in item}
+        for key, value in relevant.items():
+            if key == 'permissions':
+                relevant[key] = [{'principals': list(permission.get('principals') or ()),
+                                  'right': permission.get('right')} for permission in value or ()]
+            else:
+                relevant[key] = list(value or ())
+        relevant['id'] = item['id']
+        return relevant
+
+    def _apply(self, entity: str, item: dict):
+        own = resource(entity, item['id'])
+        if 'permissions' in item:
+            for principal in self.acl.pop(own, {}):
+                granted = self.grants.get(principal)
+                if granted is not None:
+                    granted.pop(own, None)
+                    if not granted:
+                        del self.grants[principal]
+            acl = {}
+            for permission in item['permissions'] or ():
+                level = LEVELS.get(permission.get('right') or 'read', 0)
+                for principal in permission.get('principals') or ():
+                    acl[principal] = max(level, acl.get(principal, -1))
+            if acl:
+                self.acl[own] = acl
+                for principal, level in acl.items():
+                    self.grants.setdefault(principal, {})[own] = level
+        references = [resource(child, child_id) for field, child in (('pages', 'page'), ('folders', 'folder'))
+                      if field in item for child_id in item[field] or ()]
+        if references or any(field in item for field in ('pages', 'folders')):
+            for child in self.children.pop(own, ()):
+                if self.parents.get(child) == own:
+                    del self.parents[child]
+            for child in references:
+                self.parents[child] = own
+            if references:
+                self.children[own] = set(references)
+
+    def _changed(self):
+        self.version += 1
+
+
+class Access:
+    """
+    View of the PermissionIndex for the principals of one request.
+    The levels of the resources, e.g. of the notebook shared by many pages, are memoized for the request.
+    """
+
+    def __init__(self, index: PermissionIndex, allowed: dict):
+        """
+
+        :param index: PermissionIndex, The index
+        :param allowed: dict, The highest level the principals hold per resource with permissions
+        """
+        self.index = index
+        self.allowed = allowed
+        self._levels = {}
+
+    def level(self, entity: str, item: dict):
+        """
+        Returns the right the principals hold on an item
+
+        :param entity: str, The entity of the item
+        :param item: dict, The item, holding the id and the ITEM_ATTRIBUTES of its entity
+        :return: int, The index of the right in RIGHTS, -1 without any right
+        """
+        own = resource(entity, item['id'])
+        parent = resource('page', item['page']) if entity == 'page_version' and item.get('page') else \
+            self.index.parents.get(own)
+        restricted, best = (False, -1) if parent is None else self._chain(parent)
+        if own in self.index.acl:
+            restricted, best = True, max(best, self.allowed.get(own, -1))
+        return best if restricted else LEVELS['control']
+
+    def can(self, entity: str, item: dict, right: str = 'read'):
+        """
+        Checks a right on an item
+
+        :param entity: str, The entity of the item
+        :param item: dict, The item
+        :param right: str, The right: read, write or control
+        :return: bool
+        """
+        if entity not in ENTITIES or item is None:
+            return True
+        return self.level(entity, item) >= LEVELS[right]
+
+    def check(self, entity: str, item: dict, right: str = 'read'):
+        """
+        Checks a right on an item
+
+        :param entity: str, The entity of the item
+        :param item: dict, The item
+        :param right: str, The right: read, write or control
+        :return: dict, The item
+        :raises PermissionError: If the principals do not hold the right
+        """
+        if not self.can(entity, item, right):
+            raise PermissionError(f'Not allowed to {right} {entity} {item["id"]}')
+        return item
+
+    def filter(self, entity: str, items: list, right: str = 'read'):
+        """
+        Removes the items the principals do not hold a right on
+
+        :param entity: str, The entity of the items
+        :param items: list, The items, None entries are kept
+        :param right: str, The right: read, write or control
+        :return: list, The accessible items in their order
+        """
+        if entity not in ENTITIES or not self.index.acl:
+            return items
+        level = LEVELS[right]
+        return [item for item in items if item is None or self.level(entity, item) >= level]
+
+    def _chain(self, start: str):
+        """
+        Returns whether a resource or one of its ancestors has permissions and the highest level they grant
+
+        :param start: str, The resource
+        :return: tuple, The restriction as bool and the level
+        """
+        chain = self._levels.get(start)
+        if chain is not None:
+            return chain
+        restricted, best = False, -1
+        current, visited = start, set()
+        while current is not None and current not in visited:
+            visited.add(current)
+            if current in self.index.acl:
+                restricted, best = True, max(best, self.allowed.get(current, -1))
+            current = self.index.parents.get(current)
+        chain = self._levels[start] = (restricted, best)
+        return chain
@@ -0,0 +1,614 @@
+"""
+Full-Text Search Module with an inverted index persisted in memory mapped segment files
+"""
+import bisect
+import fcntl
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+from array import array
+
+TOKEN_PATTERN = re.compile(r'\w+')
+SEGMENT_MAGIC = b'HWSI0002'
+# Segments with the term dictionary in the JSON header, still read until they are merged
+LEGACY_MAGIC = b'HWSI0001'
+# A row of the term table: the offset of the term in the term block and of its postings in the posting lists
+TERM_ROW = struct.Struct('II')
+# A row with its successor, which ends the term and its postings
+TERM_SPAN = struct.Struct('IIII')
+# Every this many terms one is kept in memory, so a lookup searches only one block of the term table
+TERM_SAMPLE = 64
+
+# Parameters of the BM25 ranking
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(value):
+    """
+    Splits a text or a list of texts into lower case word tokens
+
+    :param value: str or list, The text to tokenize
+    :return: list, The tokens in order of their occurrence
+    """
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [token for element in value for token in tokenize(element)]
+    return TOKEN_PATTERN.findall(str(value).lower())
+
+
+class Segment:
+    """
+    Immutable segment of the index, stored in a single file:
+    magic, header length (uint32), JSON header (documents, field lengths, deletions, number of terms),
+    the term table, the term block and the posting lists.
+    The term block holds the UTF-8 encoded terms in sorted order, the term table one row (uint32 pairs) per term
+    with the offsets of the term and its postings and a final row with the sizes of both.
+    The posting lists are pairs of uint32 (document number, term frequency), all numbers in native byte order.
+    Only the header is parsed when the segment is opened. Terms are found with a sample of every TERM_SAMPLE-th
+    term, loaded on the first lookup, and a binary search of one block of the term table in the memory map.
+    Their posting lists are read on demand.
+    """
+
+    def __init__(self, path: str):
+        """
+
+        :param path: str, The path of the segment file
+        """
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, 'rb') as segment_file:
+            self._map = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic = self._map[:len(SEGMENT_MAGIC)]
+        if magic not in (SEGMENT_MAGIC, LEGACY_MAGIC):
+            raise ValueError(f'{path} is not a search segment')
+        start = len(SEGMENT_MAGIC) + 4
+        header_size = int.from_bytes(self._map[len(SEGMENT_MAGIC):start], 'little')
+        header = json.loads(self._map[start:start + header_size])
+        self.docs = header['docs']
+        self.lengths = header['lengths']
+        self.deleted = header['deleted']
+        self._ids = None
+        self._legacy = header['terms'] if magic == LEGACY_MAGIC else None
+        if self._legacy is not None:
+            self.base = start + header_size
+            return
+        self.count = header['terms']
+        self._sample = None
+        self._table = start + header_size
+        self._keys = self._table + (self.count + 1) * TERM_ROW.size
+        keys_size, _ = TERM_ROW.unpack_from(self._map, self._table + self.count * TERM_ROW.size)
+        self.base = self._keys + keys_size
+
+    def contains(self, doc_id: str):
+        """
+        Checks whether the segment holds a document, even one replaced by a newer segment
+
+        :param doc_id: str, The id of the document
+        :return: bool, Whether the document is stored in the segment
+        """
+        if self._ids is None:
+            self._ids = set(self.docs)
+        return doc_id in self._ids
+
+    def postings(self, term: str):
+        """
+        Reads the posting list of a term
+
+        :param term: str, The field qualified term
+        :return: array, Alternating document numbers and term frequencies
+        """
+        if self._legacy is not None:
+            entry = self._legacy.get(term)
+            return self._read(*entry) if entry is not None else array('I')
+        if self._sample is None:
+            self._sample = [self._term(number) for number in range(0, self.count, TERM_SAMPLE)]
+        key = term.encode('utf-8')
+        block = bisect.bisect_right(self._sample, key) - 1
+        if block < 0:
+            return array('I')
+        low, high = block * TERM_SAMPLE, min((block + 1) * TERM_SAMPLE, self.count)
+        while low < high:
+            middle = (low + high) // 2
+            start, offset, end, next_offset = TERM_SPAN.unpack_from(self._map, self._table + middle * TERM_ROW.size)
+            found = self._map[self._keys + start:self._keys + end]
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                return self._read(offset, (next_offset - offset) // 8)
+        return array('I')
+
+    def items(self):
+        """
+        Yields the terms in sorted order with their posting lists, e.g. to merge segments
+
+        :return: generator, yielding (term, postings) tuples
+        """
+        if self._legacy is not None:
+            for term in sorted(self._legacy):
+                yield term, self._read(*self._legacy[term])
+            return
+        for number in range(self.count):
+            _, offset, _, next_offset = TERM_SPAN.unpack_from(self._map, self._table + number * TERM_ROW.size)
+            yield self._term(number).decode('utf-8'), self._read(offset, (next_offset - offset) // 8)
+
+    def _term(self, number: int):
+        start, _, end, _ = TERM_SPAN.unpack_from(self._map, self._table + number * TERM_ROW.size)
+        return self._map[self._keys + start:self._keys + end]
+
+    def _read(self, offset: int, count: int):
+        postings = array('I')
+        postings.frombytes(self._map[self.base + offset:self.base + offset + count * 8])
+        return postings
+
+    def close(self):
+        self._map.close()
+
+    @staticmethod
+    def write(path: str, docs: list, lengths: list, deleted: list, postings):
+        """
+        Writes a segment file atomically
+
+        :param path: str, The path of the segment file
+        :param docs: list, The ids of the documents, their position is their document number
+        :param lengths: list, The number of tokens of every field per document
+        :param deleted: list, The ids of documents of older segments, which are deleted
+        :param postings: dict or iterable, Terms mapped to lists of (document number, term frequency), an iterable
+        of (term, entries) tuples has to be sorted by term
+        :return: None
+        """
+        items = sorted(postings.items()) if isinstance(postings, dict) else postings
+        table, keys, body = array('I'), bytearray(), array('I')
+        for term, entries in items:
+            if not entries:
+                continue
+            table.extend((len(keys), len(body) * 4))
+            keys += term.encode('utf-8')
+            for number, frequency in entries:
+                body.append(number)
+                body.append(frequency)
+        count = len(table) // 2
+        table.extend((len(keys), len(body) * 4))
+        header = json.dumps({'docs': docs, 'lengths': lengths, 'deleted': deleted, 'terms': count},
+                            separators=(',', ':')).encode('utf-8')
+        with open(f'{path}.tmp', 'wb') as segment_file:
+            segment_file.write(SEGMENT_MAGIC)
+            segment_file.write(len(header).to_bytes(4, 'little'))
+            segment_file.write(header)
+            table.tofile(segment_file)
+            segment_file.write(keys)
+            body.tofile(segment_file)
+        os.replace(f'{path}.tmp', path)
+
+
+class MemorySegment:
+    """
+    The mutable segment collecting the changes since the last flush
+    """
+
+    def __init__(self):
+        self.docs = []
+        self.lengths = []
+        self.deleted = set()
+        self.terms = {}
+
+    def postings(self, term: str):
+        return [value for entry in self.terms.get(term, ()) for value in entry]
+
+
+class SearchIndex:
+    """
+    Inverted index over a few text fields of one entity, e.g. the name and content of page versions.
+    Changes are collected in memory and flushed as immutable segment files, which are merged with their
+    predecessors once those are not much larger (log structured), so a flush stays cheap while the number
+    of segments stays logarithmic. A manifest lists the segments in order, processes sharing the directory
+    (e.g. uvicorn workers) pick up each other's flushes on their next search.
+    Searches read only the posting lists of the query terms, so their cost depends on the number of matches.
+    """
+
+    def __init__(self, directory: str, name: str, fields: tuple, flush_size: int = 1, merge_factor: int = 4):
+        """
+
+        :param directory: str, The directory of the segment files, created if required
+        :param name: str, The name of the index, used as prefix of its files
+        :param fields: tuple, The names of the indexed fields
+        :param flush_size: int, The number of changes collected in memory before they are flushed
+        :param merge_factor: int, A segment is merged with its predecessor, if that is at most this much larger
+        """
+        self.directory = directory
+        self.name = name
+        self.fields = tuple(fields)
+        self.flush_size = flush_size
+        self.merge_factor = merge_factor
+        self.segments = []
+        self.latest = {}
+        self.totals = [0] * len(self.fields)
+        self.memory = MemorySegment()
+        self.changes = 0
+        self._counter = 0
+        self._manifest_stamp = None
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, f'{self.name}.manifest')
+
+    def __len__(self):
+        return len(self.latest)
+
+    def add(self, doc_id: str, **values):
+        """
+        Adds or replaces a document
+
+        :param doc_id: str, The id of the document
+        :param values: The texts of the indexed fields, fields not given are indexed as empty
+        :return: None
+        """
+        tokens = [tokenize(values.get(field)) for field in self.fields]
+        with self._lock:
+            self._add(doc_id, tokens)
+            self._changed()
+
+    def add_many(self, documents):
+        """
+        Adds or replaces multiple documents, which are flushed at most once, e.g. during bulk imports
+
+        :param documents: iterable, The (doc_id, values) tuples, values a dict of the texts of the indexed fields
+        :return: int, The number of added documents
+        """
+        tokenized = [(doc_id, [tokenize(values.get(field)) for field in self.fields]) for doc_id, values in documents]
+        if not tokenized:
+            return 0
+        with self._lock:
+            for doc_id, tokens in tokenized:
+                self._add(doc_id, tokens)
+            self.changes += len(tokenized) - 1
+            self._changed()
+        return len(tokenized)
+
+    def _add(self, doc_id: str, tokens: list):
+        self._unset(doc_id)
+        number = len(self.memory.docs)
+        self.memory.docs.append(doc_id)
+        self.memory.lengths.append([len(field_tokens) for field_tokens in tokens])
+        for field, field_tokens in zip(self.fields, tokens):
+            frequencies = {}
+            for token in field_tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, frequency in frequencies.items():
+                self.memory.terms.setdefault(f'{field}:{token}', []).append((number, frequency))
+        self._set(doc_id, self.memory, number)
+
+    def delete(self, doc_id: str):
+        """
+        Removes a document
+
+        :param doc_id: str, The id of the document
+        :return: None
+        """
+        with self._lock:
+            self._unset(doc_id)
+            self.memory.deleted.add(doc_id)
+            self._changed()
+
+    def search(self, query: str = None, limit: int = None, offset: int = 0, **fielded):
+        """
+        Finds the documents containing all tokens of the query, ranked by BM25
+
+        :param query: str, Tokens, which may occur in any field
+        :param limit: int, The maximum number of results, None for all
+        :param offset: int, The number of best results to skip
+        :param fielded: Tokens, which have to occur in the given field, e.g. content='hello world'
+        :return: tuple, The total number of matches and a list of (document id, score) tuples, best first
+        """
+        groups = [(token, self.fields) for token in tokenize(query)]
+        for field, text in fielded.items():
+            if field not in self.fields:
+                raise ValueError(f'{field} is not indexed in {self.name}')
+            groups.extend((token, (field,)) for token in tokenize(text))
+        if not groups:
+            return 0, []
+        with self._lock:
+            self.refresh()
+            scores = None
+            for token, fields in groups:
+                token_scores = self._score(token, fields, scores)
+                scores = token_scores if scores is None else {
+                    doc_id: score + token_scores[doc_id] for doc_id, score in scores.items() if doc_id in token_scores}
+                if not scores:
+                    return 0, []
+        count = len(scores) if limit is None else offset + limit
+        ranked = heapq.nsmallest(count, scores.items(), key=lambda entry: (-entry[1], entry[0]))
+        return len(scores), ranked[offset:]
+
+    def _score(self, token: str, fields: tuple, candidates: dict = None):
+        documents = max(len(self.latest), 1)
+        scores = {}
+        for field in fields:
+            position = self.fields.index(field)
+            average = self.totals[position] / documents or 1
+            matches = []
+            for segment in self.segments + [self.memory]:
+                postings = segment.postings(f'{field}:{token}')
+                for i in range(0, len(postings), 2):
+                    number, frequency = postings[i], postings[i + 1]
+                    doc_id = segment.docs[number]
+                    if self.latest.get(doc_id) == (segment, number):
+                        matches.append((doc_id, frequency, segment.lengths[number][position]))
+            if not matches:
+                continue
+            idf = math.log(1 + (documents - len(matches) + 0.5) / (len(matches) + 0.5))
+            for doc_id, frequency, length in matches:
+                if candidates is not None and doc_id not in candidates:
+                    continue
+                score = idf * frequency * (BM25_K1 + 1) / (
+                    frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average))
+                scores[doc_id] = scores.get(doc_id, 0) + score
+        return scores
+
+    def _set(self, doc_id: str, segment, number: int):
+        self.latest[doc_id] = (segment, number)
+        for position, length in enumerate(segment.lengths[number]):
+            self.totals[position] += length
+
+    def _unset(self, doc_id: str):
+        entry = self.latest.pop(doc_id, None)
+        if entry is not None:
+            segment, number = entry
+            for position, length in enumerate(segment.lengths[number]):
+                self.totals[position] -= length
+
+    def _changed(self):
+        self.changes += 1
+        if self.changes >= self.flush_size:
+            self.flush()
+
+    def refresh(self):
+        """
+        Loads the segments flushed or merged by other processes since the last refresh
+
+        :return: None
+        """
+        with self._lock:
+            while True:
+                try:
+                    stamp = os.stat(self.manifest_path).st_mtime_ns
+                    if stamp == self._manifest_stamp:
+                        return
+                    with open(self.manifest_path, 'r', encoding='utf-8') as manifest_file:
+                        names = json.load(manifest_file)['segments']
+                    self._load(names)
+                    self._manifest_stamp = stamp
+                    return
+                except FileNotFoundError:
+                    # A segment was merged away while the manifest was read, read the new one
+                    if not os.path.exists(self.manifest_path):
+                        return
+
+    def _load(self, names: list):
+        """
+        Replaces the segments after the prefix shared with the given list.
+        Merges only ever replace the newest segments with one holding all of their documents and their deletions
+        of documents in older segments, so forgetting the documents of the replaced segments and replaying the new
+        ones is sufficient.
+
+        :param names: list, The names of the segments in order
+        :return: None
+        """
+        prefix = 0
+        while prefix < min(len(names), len(self.segments)) and self.segments[prefix].name == names[prefix]:
+            prefix += 1
+        added = [Segment(os.path.join(self.directory, name)) for name in names[prefix:]]
+        removed, self.segments = self.segments[prefix:], self.segments[:prefix] + added
+        pending = [(doc_id, number) for number, doc_id in enumerate(self.memory.docs)
+                   if self.latest.get(doc_id) == (self.memory, number)]
+        for segment in removed:
+            for number, doc_id in enumerate(segment.docs):
+                if self.latest.get(doc_id) == (segment, number):
+                    self._unset(doc_id)
+            segment.close()
+        for segment in added:
+            for doc_id in segment.deleted:
+                self._unset(doc_id)
+            for number, doc_id in enumerate(segment.docs):
+                self._unset(doc_id)
+                self._set(doc_id, segment, number)
+        # Changes still in memory are newer than any flushed segment
+        for doc_id in self.memory.deleted:
+            self._unset(doc_id)
+        for doc_id, number in pending:
+            self._unset(doc_id)
+            self._set(doc_id, self.memory, number)
+
+    def flush(self):
+        """
+        Writes the changes collected in memory as a new segment and merges segments of similar size
+
+        :return: None
+        """
+        with self._lock:
+            if not self.changes:
+                return
+            with open(os.path.join(self.directory, f'{self.name}.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self.refresh()
+                names = [segment.name for segment in self.segments] + [self._write_memory()]
+                while len(names) > 1 and self._size(names[-2]) <= self.merge_factor * self._size(names[-1]):
+                    names[-2:] = [self._merge(names[-2], names[-1], names[:-2])]
+                self._write_manifest(names)
+                obsolete = [segment.path for segment in self.segments if segment.name not in names]
+                for number, doc_id in enumerate(self.memory.docs):
+                    if self.latest.get(doc_id) == (self.memory, number):
+                        self._unset(doc_id)
+                self.memory, self.changes = MemorySegment(), 0
+                self._load(names)
+                self._manifest_stamp = os.stat(self.manifest_path).st_mtime_ns
+                for path in obsolete:
+                    os.remove(path)
+
+    def _size(self, name: str):
+        return os.path.getsize(os.path.join(self.directory, name))
+
+    def _segment_name(self):
+        self._counter += 1
+        return f'{self.name}-{os.getpid()}-{self._counter}-{os.urandom(4).hex()}.seg'
+
+    def _write_memory(self):
+        name = self._segment_name()
+        docs, lengths, numbers = [], [], {}
+        for number, doc_id in enumerate(self.memory.docs):
+            if self.latest.get(doc_id) == (self.memory, number):
+                numbers[number] = len(docs)
+                docs.append(doc_id)
+                lengths.append(self.memory.lengths[number])
+        postings = {term: [(numbers[number], frequency) for number, frequency in entries if number in numbers]
+                    for term, entries in self.memory.terms.items()}
+        Segment.write(os.path.join(self.directory, name), docs, lengths, sorted(self.memory.deleted), postings)
+        return name
+
+    def _merge(self, older_name: str, newer_name: str, previous: list):
+        """
+        Merges two consecutive segments into one
+
+        :param older_name: str, The name of the older segment
+        :param newer_name: str, The name of the newer segment
+        :param previous: list, The names of the segments before both, deletions of documents none of them holds
+        are dropped
+        :return: str, The name of the merged segment
+        """
+        older = Segment(os.path.join(self.directory, older_name))
+        newer = Segment(os.path.join(self.directory, newer_name))
+        replaced = set(newer.docs) | set(newer.deleted)
+        numbers, docs, lengths = {}, [], []
+        for number, doc_id in enumerate(older.docs):
+            if doc_id not in replaced:
+                numbers[number] = len(docs)
+                docs.append(doc_id)
+                lengths.append(older.lengths[number])
+        shift = len(docs)
+        docs.extend(newer.docs)
+        lengths.extend(newer.lengths)
+
+        def entries(older_postings, newer_postings):
+            merged = []
+            for i in range(0, len(older_postings), 2):
+                if older_postings[i] in numbers:
+                    merged.append((numbers[older_postings[i]], older_postings[i + 1]))
+            for i in range(0, len(newer_postings), 2):
+                merged.append((newer_postings[i] + shift, newer_postings[i + 1]))
+            return merged
+
+        def postings():
+            # Both term dictionaries are sorted, so they are merged in one pass
+            empty = array('I')
+            older_items, newer_items = older.items(), newer.items()
+            older_item, newer_item = next(older_items, None), next(newer_items, None)
+            while older_item is not None or newer_item is not None:
+                if newer_item is None or older_item is not None and older_item[0] < newer_item[0]:
+                    yield older_item[0], entries(older_item[1], empty)
+                    older_item = next(older_items, None)
+                elif older_item is None or newer_item[0] < older_item[0]:
+                    yield newer_item[0], entries(empty, newer_item[1])
+                    newer_item = next(newer_items, None)
+                else:
+                    yield older_item[0], entries(older_item[1], newer_item[1])
+                    older_item, newer_item = next(older_items, None), next(newer_items, None)
+
+        segments = [segment for segment in self.segments if segment.name in previous]
+        deleted = sorted(doc_id for doc_id in set(older.deleted) | set(newer.deleted)
+                         if any(segment.contains(doc_id) for segment in segments))
+        name = self._segment_name()
+        Segment.write(os.path.join(self.directory, name), docs, lengths, deleted, postings())
+        older.close()
+        newer.close()
+        # Segments, which were only written during this flush, are not referenced by any manifest
+        for obsolete in (older_name, newer_name):
+            if all(segment.name != obsolete for segment in self.segments):
+                os.remove(os.path.join(self.directory, obsolete))
+        return name
+
+    def _write_manifest(self, names: list):
+        with open(f'{self.manifest_path}.tmp', 'w', encoding='utf-8') as manifest_file:
+            json.dump({'segments': names}, manifest_file)
+        os.replace(f'{self.manifest_path}.tmp', self.manifest_path)
+
+    def rebuild(self, documents):
+        """
+        Replaces the whole index, e.g. after the index files were lost
+
+        :param documents: iterable, yielding (document id, dict of field values) tuples
+        :return: int, The number of indexed documents
+        """
+        with self._lock:
+            flush_size, self.flush_size = self.flush_size, float('inf')
+            try:
+                previous = self.segments
+                self.segments, self.latest, self.totals = [], {}, [0] * len(self.fields)
+                self.memory, self.changes = MemorySegment(), 0
+                for doc_id, values in documents:
+                    self.add(doc_id, **values)
+                self.memory.deleted = set()
+                self.changes = max(self.changes, 1)
+                self.flush()
+                for segment in previous:
+                    segment.close()
+                    if os.path.exists(segment.path) and segment.name not in (s.name for s in self.segments):
+                        os.remove(segment.path)
+                return len(self.latest)
+            finally:
+                self.flush_size = flush_size
+
+    def close(self):
+        """
+        Flushes pending changes and releases the memory maps
+
+        :return: None
+        """
+        with self._lock:
+            self.flush()
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+
+
+class GraphSearchListener:
+    """
+    GraphStore listener, which indexes the names and keywords of edges.
+    An edge is stored once per connected pair of nodes, so it is removed from the index with its last row.
+    """
+
+    def __init__(self, index: SearchIndex):
+        """
+
+        :param index: SearchIndex, The index of the edges with the fields name and keywords
+        """
+        self.index = index
+
+    def on_put_node(self, graph_id: str, node_id: str, page_id: str):
+        pass
+
+    def on_delete_node(self, graph_id: str, node_id: str):
+        # The edges of the node are deleted before it, each with on_delete_edge
+        pass
+
+    def on_put_edge(self, graph_id: str, edge_id: str, source: str, target: str, keywords: list = None,
+                    name: str = None):
+        self.index.add(edge_id, name=name, keywords=keywords)
+
+    def on_delete_edge(self, graph_id: str, edge_id: str, source: str, target: str, last: bool = True):
+        if last:
+            self.index.delete(edge_id)
+
+    def on_invalidate_graph(self, graph_id: str):
+        # Bulk writers, e.g. the notebook import, index the edges they write themselves
+        pass
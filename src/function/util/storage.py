@@ -1,35 +1,157 @@
 """
 Base Storage Module for DynamoDB
 """
-import boto3
-from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+import contextvars
+import queue
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .cache import ItemCache
+from .codec import ItemCodec
+from .metrics import METRICS, Metrics
+
+# Per request limits of BatchGetItem, BatchWriteItem and TransactWriteItems
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 25
+TRANSACT_WRITE_LIMIT = 100
+
+# Reasons of a cancelled transaction, which succeeds when it is sent again
+TRANSIENT_CANCELLATIONS = {'None', 'TransactionConflict', 'ThrottlingError', 'ProvisionedThroughputExceeded'}
+
+
+class UnprocessedItemsError(Exception):
+    """
+    Raised when a batch operation still has unprocessed keys or items after all retries
+    """
+
+    def __init__(self, table_name: str, unprocessed: list):
+        super().__init__(f'{len(unprocessed)} request(s) on table {table_name} were not processed')
+        self.table_name = table_name
+        self.unprocessed = unprocessed
+
+
+def chunk(items: list, size: int):
+    """
+    Splits a list into consecutive chunks of at most the given size
+
+    :param items: list, The items to split
+    :param size: int, The maximum size of a chunk
+    :return: list, A list of chunks
+    """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def without_none(**kwargs):
+    """
+    Drops all parameters, which are not set, as boto3 does not accept None for optional parameters
+
+    :param kwargs: The parameters of the request
+    :return: dict, The parameters, which are set
+    """
+    return {k: v for k, v in kwargs.items() if v is not None}
+
+
+def projected_attributes(projection_expression: str, expression_attribute_names: dict = None):
+    """
+    Returns the top-level attributes of a projection, e.g. {'id', 'tags', 'meta'} for "id, #t[0], meta.size"
+    with #t standing for tags. Adding any of them to the projection would overlap a projected path.
+
+    :param projection_expression: str, The projection, paths separated by commas
+    :param expression_attribute_names: dict, The substitution tokens of the projection
+    :return: set, The names of the attributes the projection reads whole or in parts
+    """
+    names = expression_attribute_names or {}
+    attributes = set()
+    for path in projection_expression.split(','):
+        attribute = re.split(r'[.\[]', path.strip(), maxsplit=1)[0].strip()
+        attributes.add(names.get(attribute, attribute))
+    return attributes
+
+
+def write_result(code: str = None, message: str = None):
+    """
+    Builds the result of a single write of a batch or transaction
+
+    :param code: str, The error code, None if the write succeeded
+    :param message: str, The description of the error
+    :return: dict, The result with error, code and message
+    """
+    return {'error': code is not None, 'code': code, 'message': message}
+
+
+def backoff(attempt: int, base: float = 0.05, cap: float = 5.0):
+    """
+    Sleeps for an exponentially growing, fully jittered amount of time
+
+    :param attempt: int, The number of the retry, starting at 0
+    :param base: float, The base delay in seconds
+    :param cap: float, The maximum delay in seconds
+    :return: None
+    """
+    time.sleep(random.uniform(0, min(cap, base * 2 ** attempt)))
 
 
 class Storage:
     """
-    Base Storage class to connect and execute commands on DynamoDB
+    Base Storage class to connect and execute commands on DynamoDB.
+    boto3 is imported and the client is created with the first request, which keeps the start of the servers fast.
     """
 
-    def __init__(self, endpoint=None, access_key=None, secret_key=None):
+    def __init__(self, endpoint=None, access_key=None, secret_key=None, max_workers: int = 8,
+                 cache: ItemCache = None, max_pool_connections: int = None, schemas: dict = None,
+                 metrics: Metrics = None):
         """
 
         :param endpoint: The endpoint to use as DynamoDB Connection
         :param access_key: The Access Key to use to authenticate with DynamoDB
         :param secret_key:The Secret Key to use to authenticate with DynamoDB
+        :param max_workers: The maximum number of batch requests sent concurrently
+        :param cache: An optional ItemCache, which caches get_item and query_table reads until they are written
+        :param max_pool_connections: The maximum number of HTTP connections kept in the pool of the client, defaults to max_workers but at least 10
+        :param schemas: A map of table names to attribute schemas (attribute name -> type descriptor) to speed up deserialization
+        :param metrics: The Metrics recording latency and consumed capacity of every call, defaults to the process wide METRICS
         """
-        self.serializer = TypeSerializer()
-        self.deserializer = TypeDeserializer()
+        self.codec = ItemCodec(schemas)
+        self.max_workers = max_workers
+        self.cache = cache
+        self.metrics = metrics or METRICS
+        self._options = {'max_pool_connections': max_pool_connections or max(max_workers, 10)}
         if access_key and secret_key:
-            self.db = boto3.client('dynamodb',
-                                   aws_access_key_id=access_key,
-                                   aws_secret_access_key=secret_key)
-        if access_key and secret_key and endpoint:
-            self.db = boto3.client('dynamodb',
-                                   aws_access_key_id=access_key,
-                                   aws_secret_access_key=secret_key,
-                                   endpoint_url=endpoint)
-        else:
-            self.db = boto3.client('dynamodb')
+            self._options.update(aws_access_key_id=access_key, aws_secret_access_key=secret_key)
+        if endpoint:
+            self._options['endpoint_url'] = endpoint
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._key_names = {}
+
+    @property
+    def db(self):
+        """
+        The DynamoDB client, created on first use
+
+        :return: botocore.client.DynamoDB
+        """
+        if self._db is None:
+            with self._db_lock:
+                if self._db is None:
+                    import boto3
+                    from botocore.config import Config as BotoConfig
+                    options = dict(self._options)
+                    options['config'] = BotoConfig(max_pool_connections=options.pop('max_pool_connections'))
+                    db = boto3.client('dynamodb', **options)
+                    self.metrics.instrument(db)
+                    self._db = db
+        return self._db
+
+    @property
+    def serializer(self):
+        return self.codec.serializer
+
+    @property
+    def deserializer(self):
+        return self.codec.deserializer
 
     def create_table(self, table_name: str, attribute_definitions: list, key_schema: list,
                      local_secondary_indexes: list = None,
@@ -58,7 +180,7 @@ class Storage:
         :param deletion_protection_enabled: bool, Indicates whether deletion protection is to be enabled (true) or disabled (false) on the table.
         :return: None
         """
-        self.db.create_table(
+        self.db.create_table(**without_none(
             AttributeDefinitions=attribute_definitions,
             TableName=table_name,
             KeySchema=key_schema,
@@ -71,7 +193,7 @@ class Storage:
             Tags=tags,
             TableClass=table_class,
             DeletionProtectionEnabled=deletion_protection_enabled
-        )
+        ))
 
     def delete_table(self, table_name):
         """
@@ -118,7 +240,7 @@ class Storage:
         :param deletion_protection_enabled: bool, Indicates whether deletion protection is to be enabled (true) or disabled (false) on the table.
         :return: None
         """
-        self.db.update_table(
+        self.db.update_table(**without_none(
             AttributeDefinitions=attribute_definitions,
             TableName=table_name,
             KeySchema=key_schema,
@@ -131,7 +253,7 @@ class Storage:
             Tags=tags,
             TableClass=table_class,
             DeletionProtectionEnabled=deletion_protection_enabled
-        )
+        ))
 
     def create_item(self, table_name: str, item: dict,
                     return_values: str = None,
@@ -155,19 +277,20 @@ class Storage:
         :param expression_attribute_values: dict, One or more values that can be substituted in an expression.
         :return: None
         """
-
-        item = {k: self.serializer.serialize(v) for k, v in item.items()}
-        self.db.put_item(
-            TableName=table_name,
-            Item=item,
-            ReturnValues=return_values,
-            ReturnConsumedCapacity=return_consumed_capacity,
-            ReturnItemCollectionMetrics=return_item_collection_metrics,
-            ConditionalOperator=conditional_operator,
-            ConditionExpression=conditional_expression,
-            ExpressionAttributeNames=expression_attribute_names,
-            ExpressionAttributeValues=expression_attribute_values
-        )
+        try:
+            self.db.put_item(**without_none(
+                TableName=table_name,
+                Item=self.codec.serialize_item(item),
+                ReturnValues=return_values,
+                ReturnConsumedCapacity=return_consumed_capacity,
+                ReturnItemCollectionMetrics=return_item_collection_metrics,
+                ConditionalOperator=conditional_operator,
+                ConditionExpression=conditional_expression,
+                ExpressionAttributeNames=expression_attribute_names,
+                ExpressionAttributeValues=expression_attribute_values
+            ))
+        finally:
+            self._invalidate(table_name, [item])
 
     def delete_item(self, table_name: str, key: dict,
                     return_values: str = None,
@@ -189,20 +312,68 @@ class Storage:
         :param conditional_expression: str, A condition that must be satisfied in order for a conditional PutItem operation to succeed.
         :param expression_attribute_names: dict, One or more substitution tokens for attribute names in an expression.
         :param expression_attribute_values: dict, One or more values that can be substituted in an expression.
-        :return: None
+        :return: dict, The attributes of the deleted item, if return_values is ALL_OLD, else None
         """
-        key = {k: self.serializer.serialize(v) for k, v in key.items()}
-        self.db.delete_item(
-            TableName=table_name,
-            Key=key,
-            ReturnValues=return_values,
-            ReturnConsumedCapacity=return_consumed_capacity,
-            ReturnItemCollectionMetrics=return_item_collection_metrics,
-            ConditionalOperator=conditional_operator,
-            ConditionExpression=conditional_expression,
-            ExpressionAttributeNames=expression_attribute_names,
-            ExpressionAttributeValues=expression_attribute_values
-        )
+        try:
+            res = self.db.delete_item(**without_none(
+                TableName=table_name,
+                Key=self.codec.serialize_item(key),
+                ReturnValues=return_values,
+                ReturnConsumedCapacity=return_consumed_capacity,
+                ReturnItemCollectionMetrics=return_item_collection_metrics,
+                ConditionalOperator=conditional_operator,
+                ConditionExpression=conditional_expression,
+                ExpressionAttributeNames=expression_attribute_names,
+                ExpressionAttributeValues=expression_attribute_values
+            ))
+        finally:
+            self._invalidate(table_name, [key])
+        if "Attributes" in res.keys():
+            return self.codec.deserialize_item(res["Attributes"], table_name)
+        return None
+
+    def update_item(self, table_name: str, key: dict,
+                    update_expression: str = None,
+                    return_values: str = None,
+                    return_consumed_capacity: str = None,
+                    return_item_collection_metrics: str = None,
+                    conditional_expression: str = None,
+                    expression_attribute_names: dict = None,
+                    expression_attribute_values: dict = None):
+        """
+        Update the attributes of an item in the specified Table.
+
+        :param table_name: str, The name of the table containing the item to update.
+        :param key: dict, A map of attribute names to values, representing the primary key of the item to update.
+        :param update_expression: str, An expression that defines one or more attributes to be updated, the action to be performed on them, and new values for them.
+        :param return_values: str, Use ReturnValues if you want to get the item attributes as they appear before or after they are updated.
+        :param return_consumed_capacity: str, Determines the level of detail about either provisioned or on-demand throughput consumption that is returned in the response
+        :param return_item_collection_metrics: str, Determines whether item collection metrics are returned.
+        :param conditional_expression: str, A condition that must be satisfied in order for a conditional update to succeed.
+        :param expression_attribute_names: dict, One or more substitution tokens for attribute names in an expression.
+        :param expression_attribute_values: dict, One or more values that can be substituted in an expression, given as python values.
+        :return: dict, The attributes requested with return_values or None
+        """
+        serialized_key = self.codec.serialize_item(key)
+        if expression_attribute_values:
+            expression_attribute_values = self.codec.serialize_item(expression_attribute_values)
+        try:
+            res = self.db.update_item(**without_none(
+                TableName=table_name,
+                Key=serialized_key,
+                UpdateExpression=update_expression,
+                ReturnValues=return_values,
+                ReturnConsumedCapacity=return_consumed_capacity,
+                ReturnItemCollectionMetrics=return_item_collection_metrics,
+                ConditionExpression=conditional_expression,
+                ExpressionAttributeNames=expression_attribute_names,
+                ExpressionAttributeValues=expression_attribute_values
+            ))
+        finally:
+            self._invalidate(table_name, [key])
+        if "Attributes" in res.keys():
+            return self.codec.deserialize_item(res["Attributes"], table_name)
+        return None
 
     def get_item(self, table_name: str, key: dict,
                  consistent_read: bool = None,
@@ -220,20 +391,29 @@ class Storage:
         :param expression_attribute_names: dict, One or more substitution tokens for attribute names in an expression.
         :return: dict, The Item found in the given Table or None, if no item was found
         """
-        key = {k: self.serializer.serialize(v) for k, v in key.items()}
-        res = self.db.get_item(
+        cache_key = None
+        if self.cache and not consistent_read:
+            cache_key = self.cache.make_key(table_name, 'get', {
+                'key': key, 'projection': projection_expression, 'names': expression_attribute_names})
+            hit, item = self.cache.get(cache_key)
+            if hit:
+                return item
+        serialized_key = self.codec.serialize_item(key)
+        res = self.db.get_item(**without_none(
             TableName=table_name,
-            Key=key,
+            Key=serialized_key,
             ConsistentRead=consistent_read,
             ReturnConsumedCapacity=return_consumed_capacity,
             ProjectionExpression=projection_expression,
             ExpressionAttributeNames=expression_attribute_names
-        )
+        ))
+        item = None
         if "Item" in res.keys():
             item = res["Item"]
-            item = {k: self.deserializer.deserialize(v) for k, v in item.items()}
-            return item
-        return None
+            item = self.codec.deserialize_item(item, table_name)
+        if cache_key:
+            self.cache.set(cache_key, item, key)
+        return item
 
     def query_table(self, table_name: str,
                     index_name: str = None,
@@ -266,7 +446,7 @@ class Storage:
         :param expression_attribute_values: dict, One or more values that can be substituted in an expression.
         :return: list, a list of items that match the query or None, if no items were found
         """
-        res = self.db.query(
+        params = without_none(
             TableName=table_name,
             IndexName=index_name,
             Select=select,
@@ -281,14 +461,22 @@ class Storage:
             ExpressionAttributeNames=expression_attribute_names,
             ExpressionAttributeValues=expression_attribute_values
         )
+        cache_key = None
+        if self.cache and not consistent_read:
+            cache_key = self.cache.make_key(table_name, 'query', params)
+            hit, items = self.cache.get(cache_key)
+            if hit:
+                return items
+        res = self.db.query(**params)
+        items = None
         if "Count" in res.keys():
             count = res["Count"]
             if count > 0 and "Items" in res.keys():
                 items = res["Items"]
-                items = [{k: self.deserializer.deserialize(v) for k, v in item.items()} for item in items]
-                return items
-            return None
-        return None
+                items = [self.codec.deserialize_item(item, table_name) for item in items]
+        if cache_key:
+            self.cache.set(cache_key, items)
+        return items
 
     def scan_table(self, table_name: str,
                    index_name: str = None,
@@ -320,7 +508,7 @@ class Storage:
         :param expression_attribute_values: dict, One or more values that can be substituted in an expression.
         :return:
         """
-        res = self.db.scan(
+        res = self.db.scan(**without_none(
             TableName=table_name,
             IndexName=index_name,
             Select=select,
@@ -334,12 +522,533 @@ class Storage:
             FilterExpression=filter_expression,
             ExpressionAttributeNames=expression_attribute_names,
             ExpressionAttributeValues=expression_attribute_values
-        )
+        ))
         if "Count" in res.keys():
             count = res["Count"]
             if count > 0 and "Items" in res.keys():
                 items = res["Items"]
-                items = [{k: self.deserializer.deserialize(v) for k, v in item.items()} for item in items]
+                items = [self.codec.deserialize_item(item, table_name) for item in items]
                 return items
             return None
         return None
+
+    def iter_query(self, table_name: str,
+                   max_items: int = None,
+                   index_name: str = None,
+                   select: str = None,
+                   limit: int = None,
+                   consistent_read: bool = None,
+                   scan_index_forward: bool = None,
+                   exclusive_start_key: dict = None,
+                   return_consumed_capacity: str = None,
+                   projection_expression: str = None,
+                   filter_expression: str = None,
+                   key_condition_expression: str = None,
+                   expression_attribute_names: dict = None,
+                   expression_attribute_values: dict = None):
+        """
+        Queries a Table and lazily yields all matching items, following LastEvaluatedKey across pages.
+        The next page is fetched in the background while the current one is consumed.
+
+        :param table_name: str, The name of the table containing the requested items.
+        :param max_items: int, The maximum number of items to yield, all items are yielded if not set.
+        :param index_name: str, The name of an index to query.
+        :param select: str, The attributes to be returned in the result.
+        :param limit: int, The maximum number of items to evaluate per page (not necessarily the number of matching items).
+        :param consistent_read: bool, Determines the read consistency model: If set to true, then the operation uses strongly consistent reads; otherwise, the operation uses eventually consistent reads.
+        :param scan_index_forward: bool, Specifies the order for index traversal: If true (default), the traversal is performed in ascending order; if false, the traversal is performed in descending order.
+        :param exclusive_start_key: dict, The primary key of the first item that this operation will evaluate.
+        :param return_consumed_capacity: str, Determines the level of detail about either provisioned or on-demand throughput consumption that is returned in the response
+        :param projection_expression: str, A string that identifies one or more attributes to retrieve from the table.
+        :param filter_expression: str, A string that contains conditions that DynamoDB applies after the Query operation, but before the data is returned to you.
+        :param key_condition_expression: str, The condition that specifies the key values for items to be retrieved by the Query action.
+        :param expression_attribute_names: dict, One or more substitution tokens for attribute names in an expression.
+        :param expression_attribute_values: dict, One or more values that can be substituted in an expression.
+        :return: generator, yielding the items that match the query
+        """
+        params = without_none(
+            TableName=table_name,
+            IndexName=index_name,
+            Select=select,
+            Limit=limit,
+            ConsistentRead=consistent_read,
+            ScanIndexForward=scan_index_forward,
+            ExclusiveStartKey=exclusive_start_key,
+            ReturnConsumedCapacity=return_consumed_capacity,
+            ProjectionExpression=projection_expression,
+            FilterExpression=filter_expression,
+            KeyConditionExpression=key_condition_expression,
+            ExpressionAttributeNames=expression_attribute_names,
+            ExpressionAttributeValues=expression_attribute_values
+        )
+        return self._iter_pages(self.db.query, params, max_items)
+
+    def iter_scan(self, table_name: str,
+                  max_items: int = None,
+                  index_name: str = None,
+                  limit: int = None,
+                  select: str = None,
+                  exclusive_start_key: dict = None,
+                  return_consumed_capacity: str = None,
+                  total_segments: int = None,
+                  segment: int = None,
+                  projection_expression: str = None,
+                  filter_expression: str = None,
+                  consistent_read: bool = None,
+                  expression_attribute_names: dict = None,
+                  expression_attribute_values: dict = None):
+        """
+        Scans a Table and lazily yields all matching items, following LastEvaluatedKey across pages.
+        The next page is fetched in the background while the current one is consumed.
+
+        :param table_name: str, The name of the table containing the requested items; or, if you provide IndexName, the name of the table to which that index belongs.
+        :param max_items: int, The maximum number of items to yield, all items are yielded if not set.
+        :param index_name: str, The name of a secondary index to scan.
+        :param limit: int, The maximum number of items to evaluate per page (not necessarily the number of matching items).
+        :param select: str, The attributes to be returned in the result.
+        :param exclusive_start_key: dict, The primary key of the first item that this operation will evaluate.
+        :param return_consumed_capacity: str, Determines the level of detail about either provisioned or on-demand throughput consumption that is returned in the response
+        :param total_segments: int, For a parallel Scan request, TotalSegments represents the total number of segments into which the Scan operation will be divided.
+        :param segment: int, For a parallel Scan request, Segment identifies an individual segment to be scanned by an application worker.
+        :param projection_expression: str, A string that identifies one or more attributes to retrieve from the specified table or index. These attributes can include scalars, sets, or elements of a JSON document.
+        :param filter_expression: str, A string that contains conditions that DynamoDB applies after the Scan operation, but before the data is returned to you.
+        :param consistent_read: bool, A Boolean value that determines the read consistency model during the scan
+        :param expression_attribute_names: dict, One or more substitution tokens for attribute names in an expression.
+        :param expression_attribute_values: dict, One or more values that can be substituted in an expression.
+        :return: generator, yielding the items that match the scan
+        """
+        params = without_none(
+            TableName=table_name,
+            IndexName=index_name,
+            Select=select,
+            Limit=limit,
+            ConsistentRead=consistent_read,
+            ExclusiveStartKey=exclusive_start_key,
+            ReturnConsumedCapacity=return_consumed_capacity,
+            TotalSegments=total_segments,
+            Segment=segment,
+            ProjectionExpression=projection_expression,
+            FilterExpression=filter_expression,
+            ExpressionAttributeNames=expression_attribute_names,
+            ExpressionAttributeValues=expression_attribute_values
+        )
+        return self._iter_pages(self.db.scan, params, max_items)
+
+    def parallel_scan(self, table_name: str,
+                      total_segments: int = None,
+                      max_items: int = None,
+                      buffer_size: int = 1000,
+                      **kwargs):
+        """
+        Scans a Table in multiple segments at once and yields the items as they arrive from any segment.
+        The order of the items is not defined.
+
+        :param table_name: str, The name of the table containing the requested items.
+        :param total_segments: int, The number of segments to split the scan into, defaults to max_workers.
+        :param max_items: int, The maximum number of items to yield, all items are yielded if not set.
+        :param buffer_size: int, The maximum number of items buffered between the segment workers and the consumer.
+        :param kwargs: Any further parameter of iter_scan, except total_segments and segment.
+        :return: generator, yielding the items that match the scan
+        """
+        total_segments = total_segments or self.max_workers
+        items = queue.Queue(maxsize=buffer_size)
+        stopped = threading.Event()
+        done = object()
+
+        def put(entry):
+            while not stopped.is_set():
+                try:
+                    items.put(entry, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def scan_segment(segment):
+            try:
+                for item in self.iter_scan(table_name, total_segments=total_segments, segment=segment, **kwargs):
+                    if not put(item):
+                        return
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, total_segments))
+        try:
+            for segment in range(total_segments):
+                executor.submit(contextvars.copy_context().run, scan_segment, segment)
+            running, count = total_segments, 0
+            while running:
+                item = items.get()
+                if item is done:
+                    running -= 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+                count += 1
+                if max_items is not None and count >= max_items:
+                    return
+        finally:
+            stopped.set()
+            executor.shutdown(wait=False)
+
+    def batch_get_items(self, table_name: str, keys: list,
+                        consistent_read: bool = None,
+                        projection_expression: str = None,
+                        expression_attribute_names: dict = None,
+                        max_retries: int = 8):
+        """
+        Reads multiple Items from the given Table using concurrent BatchGetItem requests of at most 100 keys.
+        Unprocessed keys are retried with a jittered exponential backoff.
+        Eventually consistent reads are served from the cache, sharing the entries of get_item, and fill it.
+
+        :param table_name: str, The name of the table containing the requested items.
+        :param keys: list, A list of maps of attribute names to values, each representing the primary key of an item to retrieve.
+        :param consistent_read: bool, Determines the read consistency model: If set to true, then the operation uses strongly consistent reads; otherwise, the operation uses eventually consistent reads.
+        :param projection_expression: str, A string that identifies one or more attributes to retrieve from the table. The key attributes are added automatically.
+        :param expression_attribute_names: dict, One or more substitution tokens for attribute names in an expression.
+        :param max_retries: int, How often unprocessed keys are retried before an UnprocessedItemsError is raised.
+        :return: list, The found Items in the same order as the given keys, with None for every key that was not found
+        """
+        if not keys:
+            return []
+        results, missing, cache_keys = [None] * len(keys), list(range(len(keys))), None
+        if self.cache and not consistent_read:
+            cache_keys = [self.cache.make_key(table_name, 'get', {
+                'key': key, 'projection': projection_expression, 'names': expression_attribute_names}) for key in keys]
+            missing = []
+            for index, cache_key in enumerate(cache_keys):
+                hit, item = self.cache.get(cache_key)
+                if not hit:
+                    missing.append(index)
+                elif item is not None:
+                    # Projected reads of get_item may lack the key attributes, which BatchGetItem always returns
+                    results[index] = dict(item, **keys[index])
+            if not missing:
+                return results
+        serialized_keys = [self.codec.serialize_item(keys[index]) for index in missing]
+        key_names = list(keys[0].keys())
+        unique_keys = {}
+        for key in serialized_keys:
+            unique_keys.setdefault(self._key_id(key, key_names), key)
+
+        request = {}
+        if consistent_read is not None:
+            request['ConsistentRead'] = consistent_read
+        if projection_expression:
+            names = dict(expression_attribute_names or {})
+            projected = projected_attributes(projection_expression, names)
+            for i, name in enumerate(key_names):
+                # Overlapping paths are refused by DynamoDB
+                if name not in projected:
+                    names[f'#batch_key{i}'] = name
+                    projection_expression += f', #batch_key{i}'
+            request['ProjectionExpression'] = projection_expression
+            if names:
+                request['ExpressionAttributeNames'] = names
+        elif expression_attribute_names:
+            request['ExpressionAttributeNames'] = expression_attribute_names
+
+        def get_chunk(key_chunk):
+            found = []
+            request_items = {table_name: dict(request, Keys=key_chunk)}
+            for attempt in range(max_retries + 1):
+                res = self.db.batch_get_item(RequestItems=request_items)
+                found.extend(res.get('Responses', {}).get(table_name, []))
+                request_items = res.get('UnprocessedKeys')
+                if not request_items:
+                    return found
+                if attempt < max_retries:
+                    backoff(attempt)
+            raise UnprocessedItemsError(table_name, request_items[table_name]['Keys'])
+
+        items = {}
+        for found in self._run_chunks(get_chunk, chunk(list(unique_keys.values()), BATCH_GET_LIMIT)):
+            for item in found:
+                items[self._key_id(item, key_names)] = self.codec.deserialize_item(item, table_name)
+        for index, key in zip(missing, serialized_keys):
+            results[index] = items.get(self._key_id(key, key_names))
+            if cache_keys:
+                self.cache.set(cache_keys[index], results[index], keys[index])
+        return results
+
+    def batch_write_items(self, table_name: str,
+                          put_items: list = None,
+                          delete_keys: list = None,
+                          max_retries: int = 8,
+                          key_names: list = None):
+        """
+        Puts and deletes multiple Items in the given Table using concurrent BatchWriteItem requests of at most 25 writes.
+        Unprocessed items are retried with a jittered exponential backoff.
+        BatchWriteItem refuses to write an item twice in one request, so of multiple writes of the same primary key
+        only the last one is sent, deletes following the puts.
+
+        :param table_name: str, The name of the table to write the items to.
+        :param put_items: list, A list of items (maps of attribute name/value pairs) to create or replace.
+        :param delete_keys: list, A list of maps of attribute names to values, each representing the primary key of an item to delete.
+        :param max_retries: int, How often unprocessed items are retried before an UnprocessedItemsError is raised.
+        :param key_names: list, The names of the primary key attributes, read from the table description if not given.
+        :return: None
+        """
+        if not put_items and not delete_keys:
+            return
+        if key_names is None:
+            key_names = list(delete_keys[0].keys()) if delete_keys else self.key_names(table_name)
+        unique = {}
+        for item in put_items or []:
+            unique[self._key_id(item, key_names)] = {'PutRequest': {'Item': self.codec.serialize_item(item)}}
+        for key in delete_keys or []:
+            unique[self._key_id(key, key_names)] = {'DeleteRequest': {'Key': self.codec.serialize_item(key)}}
+        requests = list(unique.values())
+
+        def write_chunk(request_chunk):
+            request_items = {table_name: request_chunk}
+            for attempt in range(max_retries + 1):
+                res = self.db.batch_write_item(RequestItems=request_items)
+                request_items = res.get('UnprocessedItems')
+                if not request_items:
+                    return
+                if attempt < max_retries:
+                    backoff(attempt)
+            raise UnprocessedItemsError(table_name, request_items[table_name])
+
+        try:
+            self._run_chunks(write_chunk, chunk(requests, BATCH_WRITE_LIMIT))
+        finally:
+            self._invalidate(table_name, (put_items or []) + (delete_keys or []))
+
+    def key_names(self, table_name: str):
+        """
+        Returns the names of the primary key attributes of a table, described once per table
+
+        :param table_name: str, The name of the table
+        :return: list, The partition key and the sort key, if the table has one
+        """
+        if table_name not in self._key_names:
+            schema = self.db.describe_table(TableName=table_name)['Table']['KeySchema']
+            self._key_names[table_name] = [key['AttributeName'] for key in schema]
+        return self._key_names[table_name]
+
+    def transact_write_items(self, actions: list,
+                             client_request_token: str = None,
+                             max_retries: int = 8):
+        """
+        Writes up to 100 Items of any Tables atomically with one TransactWriteItems request, either all writes
+        are applied or none of them. Transactions cancelled by conflicts or throttling are retried with a jittered
+        exponential backoff.
+
+        An action is a dict with the name of its 'table' and exactly one of 'put' (the item), 'update', 'delete' or
+        'check' (the primary key), optionally with 'update_expression', 'conditional_expression',
+        'expression_attribute_names' and 'expression_attribute_values' given as python values.
+
+        :param actions: list, The writes of the transaction, at most one per item.
+        :param client_request_token: str, Makes the request idempotent, repeating it within 10 minutes does not write again.
+        :param max_retries: int, How often a transaction cancelled by conflicts or throttling is sent again.
+        :return: list, The result of every action in the order of the actions, see write_result. If the transaction was cancelled, all results are errors, the actions, which did not cause it, with the code TransactionCanceled.
+        """
+        from botocore.exceptions import ClientError
+        if not actions:
+            return []
+        if len(actions) > TRANSACT_WRITE_LIMIT:
+            raise ValueError(f'A transaction holds at most {TRANSACT_WRITE_LIMIT} writes, got {len(actions)}')
+        items = [self._transact_item(action) for action in actions]
+        try:
+            for attempt in range(max_retries + 1):
+                try:
+                    self.db.transact_write_items(**without_none(TransactItems=items,
+                                                                ClientRequestToken=client_request_token))
+                    return [write_result() for _ in actions]
+                except ClientError as error:
+                    code = error.response.get('Error', {}).get('Code')
+                    reasons = error.response.get('CancellationReasons') or []
+                    transient = code in ('TransactionInProgressException', 'ThrottlingException') or \
+                        code == 'TransactionCanceledException' and reasons and \
+                        all(reason.get('Code') in TRANSIENT_CANCELLATIONS for reason in reasons)
+                    if transient and attempt < max_retries:
+                        backoff(attempt)
+                        continue
+                    if code != 'TransactionCanceledException':
+                        raise
+                    if len(reasons) != len(actions):
+                        reasons = [{} for _ in actions]
+                    cancelled = write_result('TransactionCanceled',
+                                             'Cancelled with the other writes of the transaction')
+                    return [write_result(reason['Code'], reason.get('Message'))
+                            if reason.get('Code') not in (None, 'None') else dict(cancelled) for reason in reasons]
+        finally:
+            for action in actions:
+                self._invalidate(action['table'], [self._action_key(action)])
+
+    def batch_write(self, actions: list, max_retries: int = 8):
+        """
+        Writes multiple Items of any Tables independently of each other and returns the result of every write,
+        instead of raising on the first failure.
+        Unconditional puts and deletes are sent in concurrent BatchWriteItem requests of at most 25 writes,
+        retrying unprocessed items with a jittered exponential backoff.
+        Updates and conditional writes, which BatchWriteItem does not support, are sent concurrently one by one.
+
+        :param actions: list, The writes, see transact_write_items, 'check' is not supported.
+        :param max_retries: int, How often unprocessed items are retried before they are reported as failed.
+        :return: list, The result of every action in the order of the actions, see write_result
+        """
+        from botocore.exceptions import ClientError
+        results = [None] * len(actions)
+        batched, single = [], []
+        for index, action in enumerate(actions):
+            if 'check' in action:
+                raise ValueError('Condition checks are only supported in transactions')
+            if ('put' in action or 'delete' in action) and not action.get('conditional_expression'):
+                batched.append(index)
+            else:
+                single.append(index)
+
+        def write_chunk(indexes):
+            sent, requests = {}, {}
+            for index in indexes:
+                action = actions[index]
+                sent[index] = {'PutRequest': {'Item': self.codec.serialize_item(action['put'])}} if 'put' in action \
+                    else {'DeleteRequest': {'Key': self.codec.serialize_item(action['delete'])}}
+                requests.setdefault(action['table'], []).append(sent[index])
+            error = None
+            try:
+                for attempt in range(max_retries + 1):
+                    res = self.db.batch_write_item(RequestItems=requests)
+                    requests = res.get('UnprocessedItems')
+                    if not requests:
+                        break
+                    if attempt < max_retries:
+                        backoff(attempt)
+            except ClientError as client_error:
+                # The requests of the failed call are kept, the writes processed by earlier attempts succeeded
+                error = client_error.response.get('Error', {})
+            finally:
+                # The single writes invalidate their items themselves
+                for index in indexes:
+                    self._invalidate(actions[index]['table'], [self._action_key(actions[index])])
+            for index in indexes:
+                # Unprocessed requests are returned as they were sent
+                if sent[index] not in (requests or {}).get(actions[index]['table'], []):
+                    results[index] = write_result()
+                elif error is not None:
+                    results[index] = write_result(error.get('Code'), error.get('Message'))
+                else:
+                    results[index] = write_result('Unprocessed', 'The write was not processed after all retries')
+
+        def write_single(indexes):
+            action = actions[indexes[0]]
+            options = {key: action[key] for key in ('update_expression', 'conditional_expression',
+                                                     'expression_attribute_names', 'expression_attribute_values')
+                       if action.get(key) is not None}
+            try:
+                if 'put' in action:
+                    self.create_item(action['table'], action['put'], **options)
+                elif 'delete' in action:
+                    self.delete_item(action['table'], action['delete'], **options)
+                else:
+                    self.update_item(action['table'], action['update'], **options)
+                results[indexes[0]] = write_result()
+            except ClientError as error:
+                results[indexes[0]] = write_result(error.response.get('Error', {}).get('Code'),
+                                                   error.response.get('Error', {}).get('Message'))
+
+        self._run_chunks(lambda task: task[0](task[1]),
+                         [(write_chunk, indexes) for indexes in chunk(batched, BATCH_WRITE_LIMIT)] +
+                         [(write_single, [index]) for index in single])
+        return results
+
+    def _transact_item(self, action: dict):
+        """
+        Builds the TransactWriteItems entry of a write
+
+        :param action: dict, The write, see transact_write_items
+        :return: dict, The serialized Put, Update, Delete or ConditionCheck
+        """
+        operations = [operation for operation in ('put', 'update', 'delete', 'check') if operation in action]
+        if len(operations) != 1:
+            raise ValueError(f'A write needs exactly one of put, update, delete or check, got {operations}')
+        operation = operations[0]
+        values = action.get('expression_attribute_values')
+        entry = without_none(
+            TableName=action['table'],
+            UpdateExpression=action.get('update_expression'),
+            ConditionExpression=action.get('conditional_expression'),
+            ExpressionAttributeNames=action.get('expression_attribute_names'),
+            ExpressionAttributeValues=self.codec.serialize_item(values) if values else None
+        )
+        entry['Item' if operation == 'put' else 'Key'] = self.codec.serialize_item(action[operation])
+        names = {'put': 'Put', 'update': 'Update', 'delete': 'Delete', 'check': 'ConditionCheck'}
+        return {names[operation]: entry}
+
+    def _invalidate(self, table_name: str, items: list):
+        """
+        Removes written items from the cache. It runs after the write, as a read between an earlier invalidation
+        and the write would cache the old item again.
+
+        :param table_name: str, The name of the table
+        :param items: list, The written items or their primary keys
+        :return: None
+        """
+        if self.cache:
+            for item in items:
+                self.cache.invalidate_item(table_name, item)
+
+    @staticmethod
+    def _action_key(action: dict):
+        return next(action[operation] for operation in ('put', 'update', 'delete', 'check') if operation in action)
+
+    def _iter_pages(self, operation, params: dict, max_items: int = None):
+        """
+        Yields the deserialized items of all pages of a query or scan, while prefetching the next page
+
+        :param operation: callable, The client method to call for a single page
+        :param params: dict, The parameters of the request
+        :param max_items: int, The maximum number of items to yield
+        :return: generator, yielding the deserialized items
+        """
+        if max_items is not None and max_items <= 0:
+            return
+        count = 0
+        table_name = params['TableName']
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(context.run, operation, **params)
+            while pending is not None:
+                res = pending.result()
+                pending = None
+                if 'LastEvaluatedKey' in res:
+                    pending = executor.submit(context.run, operation,
+                                              **dict(params, ExclusiveStartKey=res['LastEvaluatedKey']))
+                for item in res.get('Items', []):
+                    yield self.codec.deserialize_item(item, table_name)
+                    count += 1
+                    if max_items is not None and count >= max_items:
+                        if pending is not None:
+                            pending.cancel()
+                        return
+
+    def _run_chunks(self, fn, chunks: list):
+        """
+        Runs the given function for every chunk, concurrently if there is more than one chunk
+
+        :param fn: callable, The function to call with each chunk
+        :param chunks: list, The chunks to process
+        :return: list, The results of the function in the order of the chunks
+        """
+        if len(chunks) <= 1:
+            return [fn(c) for c in chunks]
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks))) as executor:
+            return list(executor.map(lambda c: context.copy().run(fn, c), chunks))
+
+    @staticmethod
+    def _key_id(item: dict, key_names: list):
+        """
+        Builds a hashable identity of an item from its serialized key attributes
+
+        :param item: dict, The serialized item or key
+        :param key_names: list, The names of the key attributes
+        :return: tuple, The identity of the item
+        """
+        return tuple(str(item.get(name)) for name in key_names)
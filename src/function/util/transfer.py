@@ -0,0 +1,494 @@
+"""
+Bulk Transfer Module streaming whole notebooks as gzip compressed NDJSON, e.g. for backups, clones and migrations
+"""
+import base64
+import gzip
+import io
+import itertools
+import json
+import os
+import threading
+import time
+import zlib
+from .content import ContentStore
+from .graph_store import GraphStore, graph_key
+from .permissions import ENTITIES as PERMISSION_ENTITIES, PermissionIndex
+from .storage import Storage
+
+FORMAT = 'hyper-wiki-notebook'
+VERSION = 1
+
+# Every line of a stream is a JSON object. The first line is the header, the last line the trailer counting the
+# items in between, a stream without trailer was cut off. Items keep the DynamoDB JSON format of their table,
+# binary values base64 encoded, and name the entity of their table, so they are written to the tables of the
+# importing deployment:
+#   {"format": "hyper-wiki-notebook", "version": 1, "notebook": "<id>"}
+#   {"entity": "page", "item": {"id": {"S": "<id>"}, ...}}
+#   {"end": true, "items": 1234}
+# Content rows precede the page versions referencing them, so the texts can be indexed while importing.
+ENTITIES = ('notebook', 'folder', 'page', 'content', 'page_version', 'graph')
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def encode_binary(value: dict):
+    """
+    Replaces the binary values of a serialized attribute by their base64 encoding, as JSON has no bytes
+
+    :param value: dict, The attribute in the DynamoDB wire format
+    :return: dict, The JSON compatible attribute
+    """
+    (kind, data), = value.items()
+    if kind == 'B':
+        return {'B': base64.b64encode(bytes(data)).decode('ascii')}
+    if kind == 'BS':
+        return {'BS': [base64.b64encode(bytes(element)).decode('ascii') for element in data]}
+    if kind == 'L':
+        return {'L': [encode_binary(element) for element in data]}
+    if kind == 'M':
+        return {'M': {key: encode_binary(element) for key, element in data.items()}}
+    return value
+
+
+def decode_binary(value: dict):
+    """
+    Restores the binary values of an attribute encoded by encode_binary
+
+    :param value: dict, The JSON compatible attribute
+    :return: dict, The attribute in the DynamoDB wire format
+    """
+    (kind, data), = value.items()
+    if kind == 'B':
+        return {'B': base64.b64decode(data)}
+    if kind == 'BS':
+        return {'BS': [base64.b64decode(element) for element in data]}
+    if kind == 'L':
+        return {'L': [decode_binary(element) for element in data]}
+    if kind == 'M':
+        return {'M': {key: decode_binary(element) for key, element in data.items()}}
+    return value
+
+
+def chunk_ids(ids, size: int):
+    """
+    Splits an iterable of ids into lists of at most size ids, without reading it at once
+
+    :param ids: iterable, The ids
+    :param size: int, The maximum length of a list
+    :return: generator, yielding the lists
+    """
+    batch = []
+    for item_id in ids:
+        batch.append(item_id)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class RateLimiter:
+    """
+    Spaces out writes, so a bulk import stays below a number of items per second and leaves capacity to the servers
+    """
+
+    def __init__(self, rate: float = 0):
+        """
+
+        :param rate: float, The maximum number of items per second, 0 for no limit
+        """
+        self.rate = rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, count: int = 1):
+        """
+        Blocks until count items may be written
+
+        :param count: int, The number of items
+        :return: None
+        """
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + count / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class _Prefixed(io.RawIOBase):
+    """
+    Raw stream returning the bytes read ahead to detect the compression before the rest of the source
+    """
+
+    def __init__(self, prefix: bytes, source):
+        self.prefix = prefix
+        self.source = source
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.prefix or self.source.read(len(buffer))
+        data, self.prefix = data[:len(buffer)], data[len(buffer):]
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class _Members:
+    """
+    Ids of the items reachable from the notebook of an imported stream, collected while reading it.
+    Every item follows the item referencing it, so an item not referenced so far belongs to another notebook.
+    The newly referenced ids are collected as well, to authorize overwriting them before the references are written.
+    """
+
+    def __init__(self, notebook_id: str):
+        """
+
+        :param notebook_id: str, The id of the notebook in the header of the stream
+        """
+        self.notebook_id = notebook_id
+        self.graph_id = None
+        self.ids = {'notebook': set(), 'folder': set(), 'page': set(), 'page_version': set()}
+        self.claimed = {'notebook': [notebook_id], 'folder': [], 'page': [], 'page_version': []}
+
+    def admit(self, entity: str, item: dict):
+        """
+        Checks that an item belongs to the notebook and adds the items it references
+
+        :param entity: str, The entity of the item
+        :param item: dict, The deserialized item
+        :return: str, Why the item does not belong to the notebook, None if it does
+        """
+        ids, outside = self.ids, f'does not belong to notebook {self.notebook_id}'
+        if entity == 'notebook':
+            if item.get('id') != self.notebook_id:
+                return f'notebook {item.get("id")}, which is not the notebook {self.notebook_id} of the stream'
+            if ids['notebook']:
+                return f'notebook {item["id"]} a second time'
+            ids['notebook'].add(item['id'])
+            self._claim('folder', item.get('folders'))
+            self._claim('page', item.get('pages'))
+            self.graph_id = item.get('graph')
+            return None
+        if entity == 'content':
+            chain = item.get('chain')
+            return None if self._chain(chain) else f'content of chain {chain}, which {outside}'
+        if entity == 'graph':
+            if self.graph_id is not None and item.get('pk') == graph_key(self.graph_id) and \
+                    item.get('graph', item.get('id')) == self.graph_id:
+                return None
+            return f'graph row {item.get("pk")} {item.get("sk")}, which {outside}'
+        if item.get('id') not in ids[entity] or entity == 'page_version' and (
+                item.get('page') is not None and item['page'] not in ids['page'] or
+                item.get('content_chain') is not None and not self._chain(item['content_chain'])):
+            return f'{entity} {item.get("id")}, which {outside}'
+        if entity == 'folder':
+            self._claim('page', item.get('pages'))
+        elif entity == 'page':
+            self._claim('page_version', item.get('pageVersions'))
+        return None
+
+    def _claim(self, entity: str, item_ids: list):
+        for item_id in item_ids or ():
+            if item_id not in self.ids[entity]:
+                self.ids[entity].add(item_id)
+                self.claimed[entity].append(item_id)
+
+    def _chain(self, chain: str):
+        # A chain is named after its page or, without page, after its version
+        return chain in self.ids['page'] or chain in self.ids['page_version']
+
+
+def open_lines(source):
+    """
+    Opens a stream for reading its lines, gzip compressed streams are decompressed on the fly
+
+    :param source: A binary file object, only its read method is used, e.g. the body of a request
+    :return: A buffered binary file object
+    """
+    prefix = source.read(len(GZIP_MAGIC))
+    reader = io.BufferedReader(_Prefixed(prefix, source))
+    return gzip.GzipFile(fileobj=reader, mode='rb') if prefix == GZIP_MAGIC else reader
+
+
+class NotebookTransfer:
+    """
+    Exports a notebook with its folders, pages, page versions, their content and its graph as a stream of
+    NDJSON lines and imports such streams. Both directions read and write in batches and hold only the ids
+    of the visited pages and chains, so the memory stays bounded for notebooks of any size.
+    Imports are idempotent and report the number of committed lines, so a failed import resumes from there.
+    """
+
+    def __init__(self, storage: Storage, tables: dict, graphs: GraphStore, contents: ContentStore,
+                 search: dict = None, batch_size: int = 500, rate: float = 0, compress_level: int = 6,
+                 permissions: PermissionIndex = None):
+        """
+
+        :param storage: Storage, The storage holding the tables
+        :param tables: dict, The table names of the entities notebook, folder, page and page_version
+        :param graphs: GraphStore, The store of the graphs
+        :param contents: ContentStore, The store of the page version texts
+        :param search: dict, The SearchIndex of page versions and edges, updated by imports, None to skip indexing
+        :param batch_size: int, The number of items read or written at once
+        :param rate: float, The maximum number of items written per second during imports, 0 for no limit
+        :param compress_level: int, The gzip level of exports, 1 to 9
+        :param permissions: PermissionIndex, The index of the permissions, updated by imports
+        """
+        self.storage = storage
+        self.graphs = graphs
+        self.contents = contents
+        self.search = search
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(rate)
+        self.compress_level = compress_level
+        self.permissions = permissions
+        self.tables = dict(tables, graph=graphs.table_name, content=contents.table_name)
+
+    def items(self, notebook_id: str):
+        """
+        Reads a notebook and everything it holds
+
+        :param notebook_id: str, The id of the notebook
+        :return: generator, yielding (entity, item) tuples in the order of the stream
+        :raises LookupError: If the notebook does not exist
+        """
+        notebook = self.storage.get_item(self.tables['notebook'], {'id': notebook_id}, consistent_read=True)
+        if notebook is None:
+            raise LookupError(f'Could not find notebook {notebook_id}')
+        yield 'notebook', notebook
+        page_ids = dict.fromkeys(notebook.get('pages') or ())
+        for folders in chunk_ids(notebook.get('folders') or (), 100):
+            for folder in self._batch_get('folder', folders):
+                page_ids.update(dict.fromkeys(folder.get('pages') or ()))
+                yield 'folder', folder
+        chains = set()
+        for pages in chunk_ids(page_ids, 100):
+            version_ids = []
+            for page in self._batch_get('page', pages):
+                version_ids.extend(page.get('pageVersions') or ())
+                yield 'page', page
+            for versions in chunk_ids(version_ids, 100):
+                versions = self._batch_get('page_version', versions)
+                for version in versions:
+                    chain = version.get('content_chain')
+                    if chain and chain not in chains:
+                        chains.add(chain)
+                        for row in self.contents.rows(chain):
+                            yield 'content', row
+                for version in versions:
+                    yield 'page_version', version
+        if notebook.get('graph'):
+            for row in self.graphs.rows(notebook['graph']):
+                yield 'graph', row
+
+    def lines(self, notebook_id: str):
+        """
+        Exports a notebook as uncompressed NDJSON
+
+        :param notebook_id: str, The id of the notebook
+        :return: generator, yielding the lines as bytes, each ending with a newline
+        :raises LookupError: If the notebook does not exist, raised by the first next()
+        """
+        items = self.items(notebook_id)
+        first = next(items)
+        yield self._line({'format': FORMAT, 'version': VERSION, 'notebook': notebook_id})
+        count = 0
+        for entity, item in itertools.chain([first], items):
+            item = {key: encode_binary(value) for key, value in self.storage.codec.serialize_item(item).items()}
+            yield self._line({'entity': entity, 'item': item})
+            count += 1
+        yield self._line({'end': True, 'items': count})
+
+    def export_stream(self, notebook_id: str):
+        """
+        Exports a notebook as gzip compressed NDJSON, e.g. for streamed HTTP responses
+
+        :param notebook_id: str, The id of the notebook
+        :return: generator, yielding compressed chunks of bytes
+        :raises LookupError: If the notebook does not exist, raised by the first next()
+        """
+        lines = self.lines(notebook_id)
+        first = next(lines)
+        compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        buffer, size = [first], len(first)
+        for line in lines:
+            buffer.append(line)
+            size += len(line)
+            if size >= 1 << 16:
+                data = compressor.compress(b''.join(buffer))
+                buffer, size = [], 0
+                if data:
+                    yield data
+        yield compressor.compress(b''.join(buffer)) + compressor.flush()
+
+    def export_file(self, notebook_id: str, path: str):
+        """
+        Exports a notebook to a file, which is compressed if its name ends with .gz
+
+        :param notebook_id: str, The id of the notebook
+        :param path: str, The path of the file
+        :return: None
+        :raises LookupError: If the notebook does not exist
+        """
+        chunks = self.export_stream(notebook_id) if path.endswith('.gz') else self.lines(notebook_id)
+        first = next(chunks)
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as export_file:
+            export_file.write(first)
+            for data in chunks:
+                export_file.write(data)
+        os.replace(temporary, path)
+
+    def import_stream(self, source, offset: int = 0, checkpoint=None, authorize=None):
+        """
+        Imports a stream of NDJSON lines, compressed or not, while reading it
+
+        :param source: A binary file object, e.g. an open file or the body of a request
+        :param offset: int, The number of lines committed by an earlier attempt, which are skipped
+        :param checkpoint: callable, Called with the number of committed lines after every written batch
+        :param authorize: callable, Called with the entity and the stored item of every notebook, folder, page and
+            page version the stream overwrites, before it is written, raises PermissionError to refuse the import
+        :return: dict, The id of the notebook, the number of imported items and the number of committed lines
+        :raises ValueError: If the stream is not an export, is corrupt, holds items of other notebooks or was cut off,
+            the lines up to the last checkpoint have been committed
+        """
+        pending, count, header, trailer, members = {}, 0, None, None, None
+        number = 0
+
+        def commit():
+            nonlocal pending, count
+            self._authorize(members.claimed, authorize)
+            size = sum(len(items) for items in pending.values())
+            if size:
+                self.limiter.acquire(size)
+                self._write(pending)
+                count += size
+                pending = {}
+            if checkpoint is not None:
+                checkpoint(number)
+
+        for number, line in enumerate(open_lines(source), 1):
+            if trailer is not None:
+                raise ValueError(f'Line {number} follows the end of the stream')
+            try:
+                data = json.loads(line)
+            except ValueError:
+                raise ValueError(f'Line {number} is not valid JSON')
+            if number == 1:
+                if data.get('format') != FORMAT or data.get('version') != VERSION or \
+                        not isinstance(data.get('notebook'), str):
+                    raise ValueError(f'The stream is not a {FORMAT} export of version {VERSION}')
+                header, members = data, _Members(data['notebook'])
+                self._authorize(members.claimed, authorize)
+            elif data.get('end'):
+                trailer = data
+            else:
+                entity = data.get('entity')
+                if entity not in ENTITIES or not isinstance(data.get('item'), dict):
+                    raise ValueError(f'Line {number} holds no item of a known entity')
+                table_name = self.tables[entity]
+                item = self.storage.codec.deserialize_item({key: decode_binary(value)
+                                                            for key, value in data['item'].items()}, table_name)
+                # The committed lines are read again, as the items they reference belong to the notebook
+                outside = members.admit(entity, item)
+                if outside is not None:
+                    raise ValueError(f'Line {number} holds {outside}')
+                if number > offset:
+                    pending.setdefault(entity, []).append(item)
+                    if sum(len(items) for items in pending.values()) >= self.batch_size:
+                        commit()
+        commit()
+        if header is None:
+            raise ValueError('The stream is empty')
+        if trailer is None:
+            raise ValueError(f'The stream ends after line {number} without its last line, it was cut off')
+        if trailer.get('items') != number - 2:
+            raise ValueError(f'The stream holds {number - 2} items, but {trailer.get("items")} were exported')
+        return {'notebook': header['notebook'], 'items': count, 'offset': number}
+
+    def import_file(self, path: str, checkpoint_path: str = None):
+        """
+        Imports a file, resuming from the checkpoint of an earlier attempt, if there is one
+
+        :param path: str, The path of the file, compressed or not
+        :param checkpoint_path: str, The file recording the committed lines, defaults to <path>.checkpoint
+        :return: dict, The result of import_stream
+        :raises ValueError: If the file is not an export, is corrupt or was cut off
+        """
+        checkpoint_path = checkpoint_path or f'{path}.checkpoint'
+        offset = 0
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, 'r', encoding='utf-8') as checkpoint_file:
+                offset = json.load(checkpoint_file).get('offset', 0)
+
+        def checkpoint(committed: int):
+            temporary = f'{checkpoint_path}.tmp'
+            with open(temporary, 'w', encoding='utf-8') as checkpoint_file:
+                json.dump({'offset': committed}, checkpoint_file)
+            os.replace(temporary, checkpoint_path)
+
+        with open(path, 'rb') as import_file:
+            result = self.import_stream(import_file, offset, checkpoint)
+        os.remove(checkpoint_path)
+        return result
+
+    def _batch_get(self, entity: str, ids: list, consistent_read: bool = False):
+        return [item for item in self.storage.batch_get_items(self.tables[entity], [{'id': item_id} for item_id in ids],
+                                                              consistent_read=consistent_read)
+                if item is not None]
+
+    def _authorize(self, claimed: dict, authorize):
+        """
+        Authorizes overwriting the stored items referenced by the stream, before the references are written.
+        Checking the items themselves would be too late, the written references already decide their permissions.
+
+        :param claimed: dict, The ids referenced since the last call by entity, emptied by the call
+        :param authorize: callable, Called with the entity and every stored item, None to skip the checks
+        :return: None
+        """
+        for entity, ids in claimed.items():
+            if authorize is not None:
+                for chunk in chunk_ids(ids, 100):
+                    for item in self._batch_get(entity, chunk, consistent_read=True):
+                        authorize(entity, item)
+            ids.clear()
+
+    def _write(self, pending: dict):
+        """
+        Writes a batch of items, content before the page versions referencing it, and indexes them
+
+        :param pending: dict, The deserialized items by entity
+        :return: None
+        """
+        written = {}
+        for entity in ENTITIES:
+            if entity not in pending:
+                continue
+            items = pending[entity]
+            self.storage.batch_write_items(self.tables[entity], put_items=items)
+            if self.permissions is not None and entity in PERMISSION_ENTITIES:
+                self.permissions.put_many(entity, items)
+            written[entity] = items
+        # The loaded indexes of the written graphs do not hold their new rows
+        for graph_id in {row['graph'] if 'graph' in row else row['id'] for row in written.get('graph') or ()}:
+            self.graphs.invalidate_graph(graph_id)
+        if self.search is not None:
+            self._index(written.get('page_version') or (), written.get('graph') or ())
+
+    def _index(self, versions: list, rows: list):
+        chained = [version for version in versions if 'content_chain' in version]
+        texts = self.contents.get_many([(version['content_chain'], version['content_revision'])
+                                        for version in chained])
+        contents = {version['id']: text for version, text in zip(chained, texts)}
+        self.search['page_version'].add_many(
+            (version['id'], {'name': version.get('name'), 'content': contents.get(version['id'], version.get('content'))})
+            for version in versions)
+        self.search['edge'].add_many((row['id'], {'name': row.get('name'), 'keywords': row.get('keywords')})
+                                     for row in rows if row.get('type') == 'edge')
+
+    @staticmethod
+    def _line(data: dict):
+        return json.dumps(data, separators=(',', ':')).encode('utf-8') + b'\n'
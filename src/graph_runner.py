@@ -1,8 +1,14 @@
-from function.graph import app
-from function.util.config import Config
+import os
+from function.util.config import get_config
 
-CONF = Config()
+CONF = get_config()
 
 
 if __name__ == '__main__':
-    app.run(CONF.graph_host, CONF.graph_port)
+    if CONF.graph_mode == 'asgi':
+        import uvicorn
+        uvicorn.run('function.graph.asgi:app', host=CONF.graph_host, port=CONF.graph_port,
+                    workers=CONF.graph_workers, access_log=False, app_dir=os.path.dirname(os.path.abspath(__file__)))
+    else:
+        from function.graph.wsgi import app
+        app.run(CONF.graph_host, CONF.graph_port)
@@ -1,11 +1,103 @@
-from function.socket import sio
+import asyncio
+import multiprocessing
+import signal
 from aiohttp import web
-from function.util.config import Config
+from function.util.config import get_config
 
-CONF = Config()
-socket_app = web.Application()
-sio.attach(socket_app)
+CONF = get_config()
+
+
+def create_app():
+    from function.socket import sio, RELAY
+    from function.util.ipc import IPCHub
+    from function.util.metrics import METRICS
+
+    async def metrics(request):
+        return web.Response(text=METRICS.render(), content_type='text/plain')
+
+    async def start_hubs(app):
+        # A single worker hosts the hubs itself, so the GraphQL server can reach its rooms
+        app['hubs'] = [IPCHub(path) for path in hub_paths()]
+        for hub in app['hubs']:
+            await hub.start()
+
+    async def start_relay(app):
+        RELAY.start()
+
+    socket_app = web.Application()
+    sio.attach(socket_app)
+    socket_app.router.add_get('/metrics', metrics)
+    if CONF.socket_workers <= 1:
+        socket_app.on_startup.append(start_hubs)
+    socket_app.on_startup.append(start_relay)
+    return socket_app
+
+
+def hub_paths():
+    # The change feed always has a hub, the bus only with the 'ipc' backend
+    return [CONF.socket_feed_path] + ([CONF.socket_bus_path] if CONF.socket_bus_backend == 'ipc' else [])
+
+
+def run_worker(worker: int = None, host: str = CONF.socket_host, port: int = CONF.socket_port):
+    if worker is not None:
+        from function.socket import sio
+        sio.set_worker(worker, CONF.socket_workers)
+    web.run_app(create_app(), host=host, port=port, access_log=None, print=None)
+
+
+def run_router(ports: list):
+    from function.socket.router import StickyRouter
+    # Every router process binds the same port, the kernel spreads the connections between them
+    web.run_app(StickyRouter('127.0.0.1', ports).app(), host=CONF.socket_host, port=CONF.socket_port,
+                reuse_port=True, access_log=None, print=None)
+
+
+def launch():
+    """
+    Runs the socket workers on the ports following the socket port behind sticky routers on the socket port.
+    The hubs of the change feed and of the 'ipc' bus run in this process. Workers and routers, which exit, are restarted.
+
+    :return: None
+    """
+    context = multiprocessing.get_context('spawn')
+    ports = [CONF.socket_port + 1 + worker for worker in range(CONF.socket_workers)]
+    targets = [(run_worker, (worker, '127.0.0.1', port)) for worker, port in enumerate(ports)]
+    targets += [(run_router, (ports,)) for _ in range(CONF.socket_routers)]
+
+    def start(target, args):
+        process = context.Process(target=target, args=args, daemon=True)
+        process.start()
+        return process
+
+    async def supervise():
+        from function.util.ipc import IPCHub
+        for path in hub_paths():
+            await IPCHub(path).start()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+        processes = [start(target, args) for target, args in targets]
+        try:
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), 1)
+                except asyncio.TimeoutError:
+                    pass
+                for i, (target, args) in enumerate(targets):
+                    if not stop.is_set() and not processes[i].is_alive():
+                        print(f'restarting {target.__name__}{args} after exit code {processes[i].exitcode}')
+                        processes[i] = start(target, args)
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+
+    asyncio.run(supervise())
 
 
 if __name__ == '__main__':
-    web.run_app(socket_app, host=CONF.socket_host, port=CONF.socket_port, access_log=None)
+    if CONF.socket_workers > 1:
+        launch()
+    else:
+        run_worker()
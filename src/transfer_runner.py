@@ -0,0 +1,50 @@
+import argparse
+import sys
+import time
+from function.graph import TRANSFER
+
+
+def export_notebook(args):
+    start = time.perf_counter()
+    if args.file == '-':
+        for chunk in TRANSFER.export_stream(args.notebook):
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return
+    TRANSFER.export_file(args.notebook, args.file)
+    print(f'exported notebook {args.notebook} to {args.file} in {time.perf_counter() - start:.1f}s')
+
+
+def import_notebook(args):
+    start = time.perf_counter()
+    if args.file == '-':
+        result = TRANSFER.import_stream(sys.stdin.buffer, args.offset)
+    else:
+        result = TRANSFER.import_file(args.file, args.checkpoint)
+    print(f'imported {result["items"]} items of notebook {result["notebook"]} '
+          f'in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exports and imports whole notebooks as NDJSON streams')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='write a notebook with its folders, pages, versions and graph')
+    export_parser.add_argument('notebook', help='the id of the notebook')
+    export_parser.add_argument('file', help='the export file, gzip compressed if it ends with .gz, - for stdout')
+    export_parser.set_defaults(run=export_notebook)
+    import_parser = commands.add_parser('import', help='write the items of an export, resuming an interrupted import')
+    import_parser.add_argument('file', help='the export file, compressed or not, - for stdin')
+    import_parser.add_argument('--checkpoint', help='the file recording the committed lines, defaults to FILE.checkpoint')
+    import_parser.add_argument('--offset', type=int, default=0, help='the committed lines to skip when reading stdin')
+    import_parser.add_argument('--batch-size', type=int, help='the items written per batch')
+    import_parser.add_argument('--rate', type=float, help='the items written per second, 0 for no limit')
+    import_parser.set_defaults(run=import_notebook)
+    args = parser.parse_args()
+    if getattr(args, 'batch_size', None):
+        TRANSFER.batch_size = args.batch_size
+    if getattr(args, 'rate', None) is not None:
+        TRANSFER.limiter.rate = args.rate
+    try:
+        args.run(args)
+    except (LookupError, ValueError) as error:
+        sys.exit(str(error))
@@ -0,0 +1,63 @@
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+from function.util.codec import ItemCodec
+
+PAGE_SIZE = 10000
+ROUNDS = 5
+SCHEMA = {'id': 'S', 'name': 'S', 'version': 'N', 'content': 'S', 'permissions': 'L'}
+
+
+def random_text(length):
+    return ''.join(random.choices(string.ascii_letters + ' ', k=length))
+
+
+def make_page():
+    return [{
+        'id': f'version-{i}',
+        'name': random_text(20),
+        'version': i,
+        'content': random_text(500),
+        'permissions': [{'id': f'permission-{i}', 'principals': ['admin', f'user-{i}'], 'right': 'write'}]
+    } for i in range(PAGE_SIZE)]
+
+
+def measure(name, fn, items):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = fn(items)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(f'{name:<32} {best * 1000:8.1f} ms / {PAGE_SIZE} items  ({PAGE_SIZE / best:10.0f} items/s)')
+    return result, best
+
+
+if __name__ == '__main__':
+    random.seed(42)
+    serializer, deserializer = TypeSerializer(), TypeDeserializer()
+    codec = ItemCodec({'page_version': SCHEMA})
+    page = make_page()
+
+    wire, boto_ser = measure('boto3 serialize', lambda items: [
+        {k: serializer.serialize(v) for k, v in item.items()} for item in items], page)
+    codec_wire, codec_ser = measure('codec serialize', lambda items: [
+        codec.serialize_item(item) for item in items], page)
+    assert wire == codec_wire
+
+    plain, boto_de = measure('boto3 deserialize', lambda items: [
+        {k: deserializer.deserialize(v) for k, v in item.items()} for item in items], wire)
+    decoded, codec_de = measure('codec deserialize', lambda items: [
+        codec.deserialize_item(item) for item in items], wire)
+    schema_decoded, schema_de = measure('codec deserialize (schema)', lambda items: [
+        codec.deserialize_item(item, 'page_version') for item in items], wire)
+    assert plain == decoded == schema_decoded
+
+    print(f'serialize speedup: {boto_ser / codec_ser:.1f}x, '
+          f'deserialize speedup: {boto_de / codec_de:.1f}x ({boto_de / schema_de:.1f}x with schema)')
@@ -0,0 +1,91 @@
+import os
+import random
+import string
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from function.util.content import apply_delta, make_delta
+
+LINES = 400
+EDITS = 500
+SNAPSHOT_INTERVAL = 20
+READS = 200
+
+
+def random_line():
+    words = [''.join(random.choices(string.ascii_lowercase, k=random.randint(2, 9))) for _ in range(8)]
+    return ' '.join(words) + '\n'
+
+
+def edit(lines):
+    lines = list(lines)
+    action = random.random()
+    position = random.randrange(len(lines))
+    if action < 0.6:
+        lines[position] = random_line()
+    elif action < 0.85:
+        lines.insert(position, random_line())
+    elif len(lines) > 1:
+        del lines[position]
+    return lines
+
+
+def make_history():
+    lines = [random_line() for _ in range(LINES)]
+    texts = [''.join(lines)]
+    for _ in range(EDITS - 1):
+        lines = edit(lines)
+        texts.append(''.join(lines))
+    return texts
+
+
+def store(texts):
+    rows = []
+    for revision, text in enumerate(texts):
+        if revision % SNAPSHOT_INTERVAL == 0:
+            rows.append(('snapshot', zlib.compress(text.encode('utf-8'))))
+        else:
+            rows.append(('delta', make_delta(texts[revision - 1], text)))
+    return rows
+
+
+def reconstruct(rows, revision):
+    start = revision - revision % SNAPSHOT_INTERVAL
+    text = zlib.decompress(rows[start][1]).decode('utf-8')
+    for _kind, data in rows[start + 1:revision + 1]:
+        text = apply_delta(text, data)
+    return text
+
+
+def percentile(timings, fraction):
+    return sorted(timings)[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+if __name__ == '__main__':
+    random.seed(42)
+    texts = make_history()
+    raw = sum(len(text.encode('utf-8')) for text in texts)
+
+    start = time.perf_counter()
+    rows = store(texts)
+    write = time.perf_counter() - start
+    stored = sum(len(data) for _kind, data in rows)
+    snapshots = sum(len(zlib.compress(text.encode('utf-8'))) for text in texts)
+
+    timings = []
+    for revision in random.choices(range(len(texts)), k=READS):
+        start = time.perf_counter()
+        text = reconstruct(rows, revision)
+        timings.append(time.perf_counter() - start)
+        assert text == texts[revision]
+
+    print(f'{EDITS} revisions of ~{raw // EDITS // 1024} KB, snapshot every {SNAPSHOT_INTERVAL} revisions')
+    print(f'raw:                 {raw / 1024:10.1f} KB')
+    print(f'compressed copies:   {snapshots / 1024:10.1f} KB  ({raw / snapshots:6.1f}x)')
+    print(f'deltas + snapshots:  {stored / 1024:10.1f} KB  ({raw / stored:6.1f}x)')
+    print(f'encode:              {write / EDITS * 1000:10.2f} ms / revision')
+    print(f'reconstruct p50:     {percentile(timings, 0.5) * 1000:10.2f} ms')
+    print(f'reconstruct p99:     {percentile(timings, 0.99) * 1000:10.2f} ms')
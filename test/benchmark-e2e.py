@@ -0,0 +1,531 @@
+"""
+End-to-end benchmark of the GraphQL and the socket server against an in-process DynamoDB stand-in (moto).
+A wiki dataset is seeded, then a replayable GraphQL query mix and socket fan-out scenarios are driven.
+Throughput and latency percentiles are written as JSON, which --compare checks against an earlier run.
+
+    pip install "moto[dynamodb]"
+    python test/benchmark-e2e.py --output baseline.json
+    python test/benchmark-e2e.py --compare baseline.json
+
+All latencies include the stand-in, compare runs of the same machine and dataset only.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+for name, value in (('AWS_ACCESS_KEY_ID', 'benchmark'), ('AWS_SECRET_ACCESS_KEY', 'benchmark'),
+                    ('AWS_DEFAULT_REGION', 'us-east-1')):
+    os.environ.setdefault(name, value)
+
+try:
+    from moto import mock_aws
+except ImportError:
+    try:
+        from moto import mock_dynamodb as mock_aws
+    except ImportError:
+        sys.exit('The benchmark needs moto as DynamoDB stand-in: pip install "moto[dynamodb]"')
+
+from function.util.config import get_config
+
+WORDS = ('graph', 'wiki', 'page', 'folder', 'notebook', 'delta', 'socket', 'query', 'index', 'latency', 'cache',
+         'edge', 'node', 'version', 'search', 'content', 'render', 'stream', 'batch', 'shard')
+TOKEN = re.compile(r'#(\d+);')
+
+# Operations of the GraphQL mix: name -> (weight, query), the variables are drawn from the seeded dataset
+MIX = {
+    'page_version': (30, 'query($id: String!) { pageVersion(id: $id) { id name version content } }'),
+    'notebook_tree': (15, 'query($id: String!) { notebook(id: $id) { name folders { name pages { location } } '
+                          'pages { location versions { name version } } } }'),
+    'page': (15, 'query($id: String!) { page(id: $id) { location versions { name version } } }'),
+    'search': (10, 'query($content: String) { pageVersions(content: $content, limit: 10) { id name } }'),
+    'node': (5, 'query($id: String!) { node(id: $id) { id page { name } edges { name } } }'),
+    'neighborhood': (5, 'query($id: String!) { neighborhood(id: $id, depth: 2) { id } }'),
+    'edges': (5, 'query($keyword: String) { edges(keyword: $keyword, limit: 10) { id name } }'),
+    'update_page_version': (15, 'mutation($id: ID!, $content: String) '
+                                '{ updatePageVersion(id: $id, input: {content: $content}) { error message } }'),
+}
+
+
+def text(rng: random.Random, words: int):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def percentile(values: list, fraction: float):
+    # Nearest rank on sorted values
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))]
+
+
+def summarize(latencies: list, elapsed: float, errors: int = 0):
+    latencies = sorted(latencies)
+    ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        'count': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+    }
+
+
+def configure(directory: str):
+    # Everything the servers write goes to a temporary directory, the servers only talk to each other in process
+    conf = get_config()
+    conf.search_directory = os.path.join(directory, 'search')
+    conf.graph_schema_cache = os.path.join(directory, 'schema-cache')
+    conf.socket_feed_path = os.path.join(directory, 'feed.sock')
+    conf.socket_bus_path = os.path.join(directory, 'bus.sock')
+    conf.graph_index_log = os.path.join(directory, 'graph-index.log')
+    conf.auth_log = os.path.join(directory, 'permissions.log')
+    conf.socket_bus_backend = 'memory'
+    conf.socket_workers = 1
+    conf.db_endpoint = ''
+    conf.graph_cost_max_cost = max(conf.graph_cost_max_cost, 100000)
+    return conf
+
+
+def seed(args, rng: random.Random):
+    """
+    Writes the dataset: notebooks x folders x pages x versions and one graph with nodes for page versions
+
+    :return: dict, The ids the scenarios draw from
+    """
+    import bootstrap_runner
+    from function.graph import CONTENTS, GRAPHS, SEARCH, STORAGE, TABLES
+    bootstrap_runner.bootstrap()
+    notebooks, folders, pages, versions = [], [], [], []
+    dataset = {'notebooks': [], 'pages': [], 'versions': [], 'rooms': [], 'nodes': []}
+    for n in range(args.notebooks):
+        notebook_id = f'notebook-{n}'
+        notebook_pages = []
+        for f in range(args.folders):
+            folder_id = f'{notebook_id}-folder-{f}'
+            folder_pages = []
+            for p in range(args.pages):
+                page_id = f'{folder_id}-page-{p}'
+                page_versions = []
+                for v in range(args.versions):
+                    version_id = f'{page_id}-version-{v}'
+                    content = text(rng, args.words)
+                    versions.append({'id': version_id, 'name': f'version {v}', 'version': v, 'page': page_id,
+                                     'content_chain': page_id, 'content_revision': CONTENTS.put(page_id, content)})
+                    SEARCH['page_version'].add(version_id, name=f'version {v}', content=content)
+                    page_versions.append(version_id)
+                pages.append({'id': page_id, 'name': page_id, 'location': f'/{notebook_id}/{f}/{p}',
+                              'pageVersions': page_versions})
+                folder_pages.append(page_id)
+                dataset['pages'].append(page_id)
+                dataset['versions'].extend(page_versions)
+                dataset['rooms'].append((notebook_id, page_id, page_versions[-1]))
+            folders.append({'id': folder_id, 'name': folder_id, 'location': f'/{notebook_id}/{f}',
+                            'pages': folder_pages})
+            notebook_pages.extend(folder_pages)
+        notebooks.append({'id': notebook_id, 'name': notebook_id, 'pages': notebook_pages,
+                          'folders': [folder['id'] for folder in folders[-args.folders:]], 'graph': 'graph-0',
+                          'permissions': []})
+        dataset['notebooks'].append(notebook_id)
+    for entity, items in (('notebook', notebooks), ('folder', folders), ('page', pages), ('page_version', versions)):
+        STORAGE.batch_write_items(TABLES[entity], put_items=items)
+    SEARCH['page_version'].flush()
+
+    GRAPHS.put_graph('graph-0', name='benchmark')
+    nodes = [f'node-{i}' for i in range(min(args.nodes, len(dataset['versions'])))]
+    for node_id, version_id in zip(nodes, dataset['versions']):
+        GRAPHS.put_node('graph-0', node_id, version_id)
+    for e in range(args.edges if len(nodes) > 1 else 0):
+        source, target = rng.sample(nodes, 2)
+        GRAPHS.put_edge('graph-0', f'edge-{e}', source, target, name=f'edge {e}',
+                        keywords=rng.sample(WORDS, 2))
+    SEARCH['edge'].flush()
+    dataset['nodes'] = nodes
+    return dataset
+
+
+def make_mix(args, dataset: dict, rng: random.Random):
+    """
+    Draws the GraphQL requests of a run, the same seed and dataset give the same mix
+
+    :return: list, The requests as {'name', 'query', 'variables'}
+    """
+    names = [name for name in MIX if name not in ('node', 'neighborhood') or dataset['nodes']]
+    weights = [MIX[name][0] for name in names]
+    variables = {
+        'page_version': lambda: {'id': rng.choice(dataset['versions'])},
+        'notebook_tree': lambda: {'id': rng.choice(dataset['notebooks'])},
+        'page': lambda: {'id': rng.choice(dataset['pages'])},
+        'search': lambda: {'content': ' '.join(rng.sample(WORDS, 2))},
+        'node': lambda: {'id': rng.choice(dataset['nodes'])},
+        'neighborhood': lambda: {'id': rng.choice(dataset['nodes'])},
+        'edges': lambda: {'keyword': rng.choice(WORDS)},
+        'update_page_version': lambda: {'id': rng.choice(dataset['versions']), 'content': text(rng, args.words)},
+    }
+    mix = []
+    for name in rng.choices(names, weights, k=args.requests):
+        mix.append({'name': name, 'query': MIX[name][1], 'variables': variables[name]()})
+    return mix
+
+
+def run_graphql(args, mix: list):
+    """
+    Sends the mix to the Flask app with concurrent clients
+
+    :return: dict, The summary over all requests and per operation
+    """
+    from function.graph.wsgi import app
+    local = threading.local()
+    latencies = {}
+    errors = {}
+    lock = threading.Lock()
+
+    def send(request):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        response = client.post('/', json={'query': request['query'], 'variables': request['variables']})
+        elapsed = time.perf_counter() - start
+        body = response.get_json(silent=True) or {}
+        failed = response.status_code != 200 or bool(body.get('errors')) or any(
+            isinstance(value, dict) and value.get('error') for value in (body.get('data') or {}).values())
+        with lock:
+            latencies.setdefault(request['name'], []).append(elapsed)
+            if failed:
+                errors[request['name']] = errors.get(request['name'], 0) + 1
+
+    for request in mix[:args.warmup]:
+        send(request)
+    latencies.clear()
+    errors.clear()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(send, mix[args.warmup:]))
+    elapsed = time.perf_counter() - start
+    result = summarize([value for values in latencies.values() for value in values], elapsed,
+                       sum(errors.values()))
+    result['concurrency'] = args.concurrency
+    result['operations'] = {name: summarize(values, elapsed, errors.get(name, 0))
+                            for name, values in sorted(latencies.items())}
+    return result
+
+
+class SocketServer(threading.Thread):
+    """
+    Runs the aiohttp app of socket_runner on a free loopback port in its own event loop
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.port = None
+        self.ready = threading.Event()
+        self.loop = None
+
+    def run(self):
+        from aiohttp import web
+        from socket_runner import create_app
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        runner = web.AppRunner(create_app())
+        self.loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        self.loop.run_until_complete(site.start())
+        self.port = runner.addresses[0][1]
+        self.ready.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(runner.cleanup())
+        # Background tasks of the hubs, the relay and engine.io are cancelled with the server
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.join(10)
+
+
+async def connect_clients(args, port: int, rooms: list):
+    """
+    Connects the clients of every room and joins them to the page of the room
+
+    :return: list, (client, namespace, room) tuples
+    """
+    import socketio
+    transports = args.transports.split(',')
+    clients = []
+    for notebook_id, page_id, version_id in rooms:
+        namespace = f'/notebook/{notebook_id}'
+        for _ in range(args.clients):
+            client = socketio.AsyncClient(reconnection=False)
+            await client.connect(f'http://127.0.0.1:{port}?notebook={notebook_id}', namespaces=[namespace],
+                                 transports=transports)
+            answer = await client.call('join', {'page': page_id}, namespace=namespace)
+            if answer.get('error'):
+                raise RuntimeError(answer.get('message'))
+            clients.append((client, namespace, (notebook_id, page_id, version_id), answer['seq']))
+    return clients
+
+
+async def run_fanout(args, clients: list):
+    """
+    Every room gets operations from its first client, the latency runs from sending to receipt by every member
+
+    :return: dict, The summary of the deliveries
+    """
+    sent = {}
+    latencies = []
+    writers = {}
+    for client, namespace, room, seq in clients:
+        writers.setdefault(room, (client, namespace, seq))
+
+        async def on_ops(data, client=client):
+            now = time.perf_counter()
+            for operation in data.get('ops', ()):
+                for token in TOKEN.findall(operation.get('text', '')):
+                    if token in sent:
+                        latencies.append(now - sent[token])
+
+        client.on('ops', on_ops, namespace=namespace)
+
+    async def write(room, client, namespace, seq, offset):
+        for k in range(args.ops):
+            token = str(offset + k)
+            sent[token] = time.perf_counter()
+            answer = await client.call('ops', {'page': room[1], 'seq': seq,
+                                               'ops': [{'type': 'insert', 'position': 0, 'text': f'#{token};'}]},
+                                       namespace=namespace)
+            if not answer.get('error'):
+                seq = answer['seq']
+            await asyncio.sleep(args.ops_interval)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[write(room, client, namespace, seq, i * args.ops)
+                           for i, (room, (client, namespace, seq)) in enumerate(writers.items())])
+    expected = len(sent) * args.clients
+    deadline = time.perf_counter() + args.drain
+    while len(latencies) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    result = summarize(latencies, elapsed, expected - len(latencies))
+    result.update(sent=len(sent), expected=expected)
+    return result
+
+
+async def run_changes(args, clients: list, rng: random.Random):
+    """
+    Updates the latest page version of the rooms through GraphQL, the latency runs from sending the mutation
+    to the receipt of the change by every member of the room
+
+    :return: dict, The summary of the deliveries
+    """
+    from function.graph.wsgi import app
+    sent = {}
+    latencies = []
+    members = {}
+    for client, namespace, room, _seq in clients:
+        members[room] = members.get(room, 0) + 1
+
+        async def on_changes(data):
+            now = time.perf_counter()
+            for change in data.get('changes', ()):
+                key = (change.get('id'), change.get('version'))
+                if key in sent:
+                    latencies.append(now - sent[key])
+
+        client.on('changes', on_changes, namespace=namespace)
+
+    rooms = list(members)
+    client = app.test_client()
+    loop = asyncio.get_running_loop()
+    query = 'mutation($id: ID!, $version: Int, $content: String) ' \
+            '{ updatePageVersion(id: $id, input: {version: $version, content: $content}) { error } }'
+    expected = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(1) as executor:
+        for k in range(args.changes):
+            room = rooms[k % len(rooms)]
+            version = 1000 + k
+            sent[(room[2], version)] = time.perf_counter()
+            expected += members[room]
+            await loop.run_in_executor(executor, lambda: client.post('/', json={
+                'query': query, 'variables': {'id': room[2], 'version': version, 'content': text(rng, args.words)}}))
+            await asyncio.sleep(args.changes_interval)
+    deadline = time.perf_counter() + args.drain
+    while len(latencies) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    result = summarize(latencies, elapsed, expected - len(latencies))
+    result.update(sent=len(sent), expected=expected)
+    return result
+
+
+def run_socket(args, dataset: dict, rng: random.Random):
+    server = SocketServer()
+    server.start()
+    if not server.ready.wait(30):
+        raise RuntimeError('The socket server did not start')
+    rooms = dataset['rooms'][:args.rooms]
+
+    async def scenarios():
+        clients = await connect_clients(args, server.port, rooms)
+        try:
+            results = {'rooms': len(rooms), 'clients': len(clients), 'transports': args.transports}
+            if args.ops:
+                results['fanout'] = await run_fanout(args, clients)
+            if args.changes:
+                results['changes'] = await run_changes(args, clients, rng)
+            return results
+        finally:
+            for client, *_ in clients:
+                await client.disconnect()
+
+    try:
+        return asyncio.run(scenarios())
+    finally:
+        server.stop()
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latency_metrics(report: dict, prefix: str = ''):
+    # Flattens the summaries of a report to name -> summary
+    found = {}
+    for key, value in report.items():
+        if isinstance(value, dict) and 'p95_ms' in value:
+            found[f'{prefix}{key}'] = value
+        if isinstance(value, dict):
+            found.update(latency_metrics(value, f'{prefix}{key}.'))
+    return found
+
+
+def compare(report: dict, baseline: dict, threshold: float):
+    """
+    Prints the change of the percentiles against a baseline
+
+    :return: list, The names of the metrics whose p95 grew by more than the threshold
+    """
+    current, previous = latency_metrics(report['results']), latency_metrics(baseline['results'])
+    regressions = []
+    print(f'{"metric":<44} {"p50 ms":>16} {"p95 ms":>16} {"p99 ms":>16}')
+    for name in sorted(current):
+        if name not in previous:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            old, new = previous[name].get(key), current[name].get(key)
+            if old and new:
+                cells.append(f'{new:8.2f} {(new - old) / old:+6.0%}')
+                if key == 'p95_ms' and (new - old) / old > threshold:
+                    regressions.append(name)
+            else:
+                cells.append(f'{"-":>15}')
+        print(f'{name:<44} ' + ' '.join(f'{cell:>16}' for cell in cells))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='End-to-end benchmark of the GraphQL and the socket server')
+    dataset = parser.add_argument_group('dataset')
+    dataset.add_argument('--notebooks', type=int, default=2)
+    dataset.add_argument('--folders', type=int, default=3, help='folders per notebook')
+    dataset.add_argument('--pages', type=int, default=5, help='pages per folder')
+    dataset.add_argument('--versions', type=int, default=3, help='versions per page')
+    dataset.add_argument('--words', type=int, default=200, help='words per page version')
+    dataset.add_argument('--nodes', type=int, default=60, help='nodes of the graph, at most one per page version')
+    dataset.add_argument('--edges', type=int, default=300, help='edges of the graph')
+    graphql = parser.add_argument_group('graphql')
+    graphql.add_argument('--requests', type=int, default=500, help='requests of the query mix')
+    graphql.add_argument('--warmup', type=int, default=20, help='requests of the mix sent before measuring')
+    graphql.add_argument('--concurrency', type=int, default=4)
+    graphql.add_argument('--mix', help='replay the requests of this file instead of drawing them')
+    graphql.add_argument('--save-mix', help='write the requests of the run to this file')
+    sockets = parser.add_argument_group('socket')
+    sockets.add_argument('--rooms', type=int, default=4, help='pages with live clients')
+    sockets.add_argument('--clients', type=int, default=5, help='clients per room')
+    sockets.add_argument('--ops', type=int, default=50, help='operations sent to every room')
+    sockets.add_argument('--ops-interval', type=float, default=0.01)
+    sockets.add_argument('--changes', type=int, default=40, help='GraphQL mutations relayed to the rooms')
+    sockets.add_argument('--changes-interval', type=float, default=0.05)
+    sockets.add_argument('--drain', type=float, default=5.0, help='seconds to wait for outstanding deliveries')
+    sockets.add_argument('--transports', default='polling', help='Engine.IO transports of the clients')
+    parser.add_argument('--scenarios', default='graphql,socket')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the report to this file instead of stdout')
+    parser.add_argument('--compare', help='compare with the report of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative p95 growth reported as regression by --compare')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    scenarios = set(args.scenarios.split(','))
+    rng = random.Random(args.seed)
+    report = {
+        'meta': {'revision': revision(), 'python': platform.python_version(), 'machine': platform.machine(),
+                 'seed': args.seed, 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')},
+        'dataset': {key: getattr(args, key) for key in
+                    ('notebooks', 'folders', 'pages', 'versions', 'words', 'nodes', 'edges')},
+        'results': {},
+    }
+    # The servers print their events, stdout is kept for the report
+    with tempfile.TemporaryDirectory(prefix='hw-bench-') as directory, mock_aws(), \
+            contextlib.redirect_stdout(sys.stderr):
+        configure(directory)
+        start = time.perf_counter()
+        dataset = seed(args, rng)
+        report['meta']['seed_seconds'] = round(time.perf_counter() - start, 2)
+        if 'graphql' in scenarios:
+            if args.mix:
+                with open(args.mix, 'r', encoding='utf-8') as mix_file:
+                    mix = json.load(mix_file)
+            else:
+                mix = make_mix(args, dataset, rng)
+            if args.save_mix:
+                with open(args.save_mix, 'w', encoding='utf-8') as mix_file:
+                    json.dump(mix, mix_file)
+            report['results']['graphql'] = run_graphql(args, mix)
+        if 'socket' in scenarios:
+            report['results']['socket'] = run_socket(args, dataset, rng)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        if regressions:
+            print(f'p95 regressed by more than {args.threshold:.0%}: {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+from function.util.config import get_config
+
+ROUNDS = 15
+# Module -> statement run after the import, which touches what the first request needs
+TARGETS = [
+    ('function.util.config', 'function.util.config.get_config()'),
+    ('function.graph.asgi', ''),
+    ('function.graph.wsgi', ''),
+    ('function.socket', ''),
+]
+
+PROGRAM = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+{statement}
+sys.stdout.write(repr(time.perf_counter() - start))
+'''
+
+
+def import_time(module, statement):
+    env = dict(os.environ, AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+    output = subprocess.run([sys.executable, '-c', PROGRAM.format(module=module, statement=statement)],
+                            cwd=SRC, env=env, capture_output=True, text=True, check=True).stdout
+    return float(output)
+
+
+def measure(name, module, statement, before=None):
+    timings = []
+    for _ in range(ROUNDS):
+        if before:
+            before()
+        timings.append(import_time(module, statement))
+    timings.sort()
+    print(f'{name:<40} p50 {statistics.median(timings) * 1000:7.1f} ms  '
+          f'min {timings[0] * 1000:7.1f} ms  max {timings[-1] * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    schema_cache = get_config().graph_schema_cache
+    for module, statement in TARGETS:
+        measure(f'import {module}', module, statement)
+    if schema_cache:
+        measure('import function.graph (cold schema cache)', 'function.graph', '',
+                lambda: shutil.rmtree(schema_cache, ignore_errors=True))
+        measure('import function.graph (warm schema cache)', 'function.graph', '')
+    measure('first DynamoDB client', 'function.graph', 'function.graph.STORAGE.db')